@@ -191,8 +191,13 @@ class zulip::app_frontend_base {
   }.map |$key| {
     [regsubst($key, '_workers$', ''), Integer(zulipconf('application_server', $key, 1))]
   })
-  $mobile_notification_shards = Integer(zulipconf('application_server', 'mobile_notification_shards', 1))
-  $user_activity_shards = Integer(zulipconf('application_server', 'user_activity_shards', 1))
+  # Sharded queues are partitioned into `<queue>_shard<n>` queues, one per
+  # worker; this list must match SHARDABLE_QUEUES in scripts/lib/zulip_tools.py.
+  $queue_shards = Hash(['deferred_work', 'embed_links', 'missedmessage_emails', 'user_activity'].map |$queue| {
+    [$queue, Integer(zulipconf('application_server', "${queue}_shards", 1))]
+  }) + {
+    'missedmessage_mobile_notifications' => Integer(zulipconf('application_server', 'mobile_notification_shards', 1)),
+  }
   $tornado_ports = $zulip::tornado_sharding::tornado_ports
 
   $proxy_host = zulipconf('http_proxy', 'host', 'localhost')
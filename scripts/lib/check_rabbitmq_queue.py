@@ -10,7 +10,12 @@ from typing import Any
 ZULIP_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 sys.path.append(ZULIP_PATH)
-from scripts.lib.zulip_tools import atomic_nagios_write, get_config, get_config_file
+from scripts.lib.zulip_tools import (
+    atomic_nagios_write,
+    get_config,
+    get_config_file,
+    get_queue_shards,
+)
 
 normal_queues = [
     "deferred_work",
@@ -33,12 +38,7 @@ normal_queues = [
 if get_config(get_config_file(), "application_server", "dedicated_soft_reactivation_queue", False):
     normal_queues.append("soft_reactivation")
 
-mobile_notification_shards = int(
-    get_config(get_config_file(), "application_server", "mobile_notification_shards", "1")
-)
-user_activity_shards = int(
-    get_config(get_config_file(), "application_server", "user_activity_shards", "1")
-)
+queue_shards = get_queue_shards(get_config_file())
 
 OK = 0
 WARNING = 1
@@ -182,16 +182,12 @@ def check_rabbitmq_queues() -> None:
     queue_stats: dict[str, dict[str, Any]] = {}
 
     check_queues = normal_queues
-    if mobile_notification_shards > 1:
-        # For sharded queue workers, where there's a separate queue
-        # for each shard, we need to make sure none of those are
-        # backlogged.
-        check_queues += [
-            f"missedmessage_mobile_notifications_shard{d}"
-            for d in range(1, mobile_notification_shards + 1)
-        ]
-    if user_activity_shards > 1:
-        check_queues += [f"user_activity_shard{d}" for d in range(1, user_activity_shards + 1)]
+    for queue_name, shards in queue_shards.items():
+        if shards > 1:
+            # For sharded queue workers, where there's a separate queue
+            # for each shard, we need to make sure none of those are
+            # backlogged.
+            check_queues += [f"{queue_name}_shard{d}" for d in range(1, shards + 1)]
 
     queues_to_check = set(check_queues).intersection(set(queues_with_consumers))
     for queue in queues_to_check:
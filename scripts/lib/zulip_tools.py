@@ -613,6 +613,34 @@ def get_tornado_ports(config_file: configparser.RawConfigParser) -> list[int]:
     return ports
 
 
+# Queues which can be partitioned into several sub-queues, named
+# `<queue>_shard<n>`, each with its own consumer.  Their publishers
+# choose the sub-queue from a user or realm ID (see
+# zerver.lib.queue.sharded_queue_name), so the events for any one
+# user are still processed in order.
+SHARDABLE_QUEUES = [
+    "deferred_work",
+    "embed_links",
+    "missedmessage_emails",
+    "missedmessage_mobile_notifications",
+    "user_activity",
+]
+
+
+def get_queue_shards(config_file: configparser.RawConfigParser) -> dict[str, int]:
+    """Returns how many shards each shardable queue is configured with,
+    via `<queue>_shards` in the `application_server` section."""
+    queue_shards = {
+        queue_name: int(get_config(config_file, "application_server", f"{queue_name}_shards", "1"))
+        for queue_name in SHARDABLE_QUEUES
+    }
+    # For historical reasons, this one has a different name.
+    queue_shards["missedmessage_mobile_notifications"] = int(
+        get_config(config_file, "application_server", "mobile_notification_shards", "1")
+    )
+    return queue_shards
+
+
 def get_or_create_dev_uuid_var_path(path: str) -> str:
     absolute_path = f"{get_dev_uuid_var_path()}/{path}"
     os.makedirs(absolute_path, exist_ok=True)
@@ -450,6 +450,14 @@ python_rules = RuleList(
                 "stream: Optional[Stream] = models.ForeignKey(Stream, on_delete=CASCADE)",
             ],
         },
+        {
+            "pattern": r"""queue_(json_publish_rollback_unsafe|event_on_commit)\(["'](deferred_work|embed_links|missedmessage_emails|missedmessage_mobile_notifications|user_activity)["']""",
+            "description": "Use sharded_queue_name(); when this queue is sharded, nothing consumes its unsharded name.",
+            "good_lines": [
+                'queue_event_on_commit(sharded_queue_name("deferred_work", realm.id), event)'
+            ],
+            "bad_lines": ['queue_event_on_commit("deferred_work", event)'],
+        },
         {
             "pattern": r"exit[(][1-9]\d*[)]",
             "include_only": {"/management/commands/"},
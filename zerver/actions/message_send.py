@@ -11,7 +11,7 @@ import orjson
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError, transaction
-from django.db.models import Exists, F, OuterRef, QuerySet
+from django.db.models import Exists, OuterRef, QuerySet
 from django.utils.html import escape
 from django.utils.timezone import now as timezone_now
 from django.utils.translation import gettext as _
@@ -60,13 +60,13 @@ from zerver.lib.notification_data import (
     user_allows_notifications_in_StreamTopic,
 )
 from zerver.lib.query_helpers import query_for_ids
-from zerver.lib.queue import queue_event_on_commit
+from zerver.lib.queue import queue_event_on_commit, sharded_queue_name
 from zerver.lib.recipient_users import (
     check_sender_can_access_recipients,
     recipient_for_user_profiles,
 )
 from zerver.lib.stream_subscription import (
-    get_subscriptions_for_send_message,
+    get_subscription_rows_for_send_message,
     num_subscribers_for_stream_id,
 )
 from zerver.lib.stream_topic import StreamTopicTarget
@@ -295,45 +295,14 @@ def get_recipient_info(
             # misses this sender. This is useful when the sender is sending their first message
             # in the topic.
             topic_participant_user_ids.add(sender_id)
-        subscription_rows = (
-            get_subscriptions_for_send_message(
-                realm_id=realm_id,
-                stream_id=stream_topic.stream_id,
-                topic_name=stream_topic.topic_name,
-                possible_stream_wildcard_mention=possible_stream_wildcard_mention,
-                topic_participant_user_ids=topic_participant_user_ids,
-                possibly_mentioned_user_ids=possibly_mentioned_user_ids,
-            )
-            .annotate(
-                user_profile_email_notifications=F(
-                    "user_profile__enable_stream_email_notifications"
-                ),
-                user_profile_push_notifications=F("user_profile__enable_stream_push_notifications"),
-                user_profile_wildcard_mentions_notify=F("user_profile__wildcard_mentions_notify"),
-                followed_topic_email_notifications=F(
-                    "user_profile__enable_followed_topic_email_notifications"
-                ),
-                followed_topic_push_notifications=F(
-                    "user_profile__enable_followed_topic_push_notifications"
-                ),
-                followed_topic_wildcard_mentions_notify=F(
-                    "user_profile__enable_followed_topic_wildcard_mentions_notify"
-                ),
-            )
-            .values(
-                "user_profile_id",
-                "push_notifications",
-                "email_notifications",
-                "wildcard_mentions_notify",
-                "followed_topic_push_notifications",
-                "followed_topic_email_notifications",
-                "followed_topic_wildcard_mentions_notify",
-                "user_profile_email_notifications",
-                "user_profile_push_notifications",
-                "user_profile_wildcard_mentions_notify",
-                "is_muted",
-            )
-            .order_by("user_profile_id")
+        subscription_rows = get_subscription_rows_for_send_message(
+            realm_id=realm_id,
+            recipient_id=recipient.id,
+            stream_id=stream_topic.stream_id,
+            topic_name=stream_topic.topic_name,
+            possible_stream_wildcard_mention=possible_stream_wildcard_mention,
+            topic_participant_user_ids=topic_participant_user_ids,
+            possibly_mentioned_user_ids=possibly_mentioned_user_ids,
         )
 
         message_to_user_id_set = set()
@@ -1385,7 +1354,9 @@ def do_send_messages(
                 "message_realm_id": send_request.realm.id,
                 "urls": list(send_request.links_for_embed),
             }
-            queue_event_on_commit("embed_links", event_data)
+            queue_event_on_commit(
+                sharded_queue_name("embed_links", send_request.realm.id), event_data
+            )
 
         # Check if this is a 1:1 DM between a user and the Welcome Bot,
         # in which case we may want to send an automated response.
@@ -18,12 +18,13 @@ from zerver.lib.cache import (
     cache_delete_many,
     cache_set,
     display_recipient_cache_key,
+    flush_stream_recipient_info,
     to_dict_cache_key_id,
 )
 from zerver.lib.exceptions import JsonableError
 from zerver.lib.mention import silent_mention_syntax_for_user, silent_mention_syntax_for_user_group
 from zerver.lib.message import get_last_message_id
-from zerver.lib.queue import queue_event_on_commit
+from zerver.lib.queue import queue_event_on_commit, sharded_queue_name
 from zerver.lib.stream_color import pick_colors
 from zerver.lib.stream_subscription import (
     SubInfo,
@@ -512,6 +513,9 @@ def bulk_add_subs_to_db_with_logging(
     Subscription.objects.bulk_create(info.sub for info in subs_to_add)
     sub_ids = [info.sub.id for info in subs_to_activate]
     Subscription.objects.filter(id__in=sub_ids).update(active=True)
+    flush_stream_recipient_info(
+        recipient_ids={info.sub.recipient_id for info in [*subs_to_add, *subs_to_activate]}
+    )
 
     # Log subscription activities in RealmAuditLog
     event_time = timezone_now()
@@ -996,7 +1000,7 @@ def send_subscription_remove_events(
                 stream.recipient_id for stream in streams_by_user[user_profile.id]
             ],
         }
-        queue_event_on_commit("deferred_work", event)
+        queue_event_on_commit(sharded_queue_name("deferred_work", user_profile.id), event)
 
         if not user_profile.is_realm_admin:
             inaccessible_streams = [
@@ -1128,6 +1132,9 @@ def bulk_remove_subscriptions(
         Subscription.objects.filter(
             id__in=sub_ids_to_deactivate,
         ).update(active=False)
+        flush_stream_recipient_info(
+            recipient_ids={sub_info.sub.recipient_id for sub_info in subs_to_deactivate}
+        )
         bulk_update_subscriber_counts(direction=-1, streams=subscriber_count_changes)
 
         # Log subscription activities in RealmAuditLog
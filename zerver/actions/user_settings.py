@@ -16,11 +16,13 @@ from zerver.lib.cache import (
     bulk_flush_users,
     cache_delete,
     delete_user_profile_caches,
+    flush_stream_recipient_info,
+    stream_recipient_info_user_fields,
     user_profile_by_api_key_cache_key,
 )
 from zerver.lib.create_user import get_display_email_address
 from zerver.lib.i18n import get_language_name
-from zerver.lib.queue import queue_event_on_commit
+from zerver.lib.queue import queue_event_on_commit, sharded_queue_name
 from zerver.lib.send_email import FromAddress, clear_scheduled_emails, send_email
 from zerver.lib.timezone import canonicalize_timezone
 from zerver.lib.types import UserProfileChangeDict
@@ -338,7 +340,7 @@ def do_regenerate_api_key(user_profile: UserProfile, acting_user: UserProfile) -
     )
 
     event = {"type": "clear_push_device_tokens", "user_profile_id": user_profile.id}
-    queue_event_on_commit("deferred_work", event)
+    queue_event_on_commit(sharded_queue_name("deferred_work", user_profile.id), event)
 
     # Delete all of the user's Device records to stop sending E2EE push notifications.
     Device.objects.filter(user_id=user_profile.id).delete()
@@ -504,6 +506,8 @@ def bulk_change_user_setting(
 
     UserProfile.objects.bulk_update(user_profiles, [setting_name])
     RealmAuditLog.objects.bulk_create(audit_logs)
+    if setting_name in stream_recipient_info_user_fields:
+        flush_stream_recipient_info(realm_id=realm.id)
 
     # Disabling digest emails should clear a user's email queue
     if setting_name == "enable_digest_emails" and not db_setting_value:
@@ -529,7 +533,11 @@ def bulk_change_user_setting(
         assert isinstance(db_setting_value, str)
         event["language_name"] = get_language_name(db_setting_value)
 
-    transaction.on_commit(lambda: bulk_flush_users(user_profiles=user_profiles, realm=realm))
+    transaction.on_commit(
+        lambda: bulk_flush_users(
+            user_profiles=user_profiles, realm=realm, update_fields=[setting_name]
+        )
+    )
 
     user_ids = [u.id for u in user_profiles]
     send_event_on_commit(realm, event, user_ids)
@@ -43,7 +43,7 @@ from zerver.lib.exceptions import (
     UserDeactivatedError,
     WebhookError,
 )
-from zerver.lib.queue import queue_json_publish_rollback_unsafe
+from zerver.lib.queue import queue_json_publish_rollback_unsafe, sharded_queue_name
 from zerver.lib.rate_limiter import is_local_addr, rate_limit_request_by_ip, rate_limit_user
 from zerver.lib.request import RequestNotes
 from zerver.lib.response import json_method_not_allowed
@@ -95,12 +95,9 @@ def update_user_activity(
         "client_id": request_notes.client.id,
     }
 
-    queue_name = "user_activity"
-    if settings.USER_ACTIVITY_SHARDS > 1:  # nocoverage
-        shard_id = user_profile.id % settings.USER_ACTIVITY_SHARDS + 1
-        queue_name = f"user_activity_shard{shard_id}"
-
-    queue_json_publish_rollback_unsafe(queue_name, event, lambda event: None)
+    queue_json_publish_rollback_unsafe(
+        sharded_queue_name("user_activity", user_profile.id), event, lambda event: None
+    )
 
 
 # Based on django.views.decorators.http.require_http_methods
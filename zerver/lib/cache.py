@@ -2,29 +2,45 @@
 import hashlib
 import logging
 import os
+import pickle
 import re
 import secrets
 import sys
 import time
 import traceback
-from collections.abc import Callable, Iterable, Iterator, Sequence
+from collections import OrderedDict
+from collections.abc import Callable, Collection, Iterable, Iterator, Sequence
 from functools import _lru_cache_wrapper, lru_cache, wraps
 from itertools import islice, product
 from typing import TYPE_CHECKING, Any, Generic, TypeVar
 
+import redis
+import redis.commands.core
 from bmemcached.exceptions import MemcachedException
 from django.conf import settings
 from django.core.cache import caches
 from django.core.cache.backends.base import BaseCache
+from django.db import transaction
 from django.db.models import Q, QuerySet
 from typing_extensions import ParamSpec
 
 from scripts.lib.zulip_tools import DEPLOYMENTS_DIR, get_recent_deployments
+from zerver.lib.redis_utils import get_redis_client
+from zerver.lib.state_versions import record_user_state_changes, reset_state_versions
 
 if TYPE_CHECKING:
     # These modules have to be imported for type annotations but
     # they cannot be imported at runtime due to cyclic dependency.
-    from zerver.models import Attachment, Message, MutedUser, Realm, Stream, SubMessage, UserProfile
+    from zerver.models import (
+        Attachment,
+        Message,
+        MutedUser,
+        Realm,
+        Stream,
+        SubMessage,
+        Subscription,
+        UserProfile,
+    )
 
 MEMCACHED_MAX_KEY_LENGTH = 250
 
@@ -37,6 +53,11 @@ remote_cache_time_start = 0.0
 remote_cache_total_time = 0.0
 remote_cache_total_requests = 0
 
+# While a request is being profiled (see zerver/lib/request_profiling.py),
+# this is also passed the keys of each cache_get and cache_get_many,
+# and those which were found.
+cache_profiler: Callable[[Collection[str], Collection[str]], None] | None = None
+
 
 def get_remote_cache_time() -> float:
     return remote_cache_total_time
@@ -46,6 +67,14 @@ def get_remote_cache_requests() -> int:
     return remote_cache_total_requests
 
 
+def get_local_cache_hits() -> int:
+    return local_cache.hits
+
+
+def get_local_cache_requests() -> int:
+    return local_cache.requests
+
+
 def remote_cache_stats_start() -> None:
     global remote_cache_time_start
     remote_cache_time_start = time.time()
@@ -154,18 +183,257 @@ def get_cache_backend(cache_name: str | None) -> BaseCache:
     return caches[cache_name]
 
 
+# Keys which are also cached in each process by LocalCache, if it is
+# enabled.  These are read on nearly every request, and rarely change.
+LOCAL_CACHE_KEY_PREFIXES = (
+    "user_profile_by_id:",
+    "user_profile_narrow_by_id:",
+    "user_profile_by_api_key:",
+    "realm_system_groups:",
+)
+
+# Records, in Redis server time, when each key was last deleted.
+LOCAL_CACHE_INVALIDATION_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+for i = 2, #ARGV do
+    redis.call('ZADD', KEYS[1], string.format('%.6f', now), ARGV[i])
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', string.format('%.6f', now - ARGV[1]))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+"""
+
+
+class LocalCache:
+    """A bounded, per-process LRU cache in front of memcached, for the
+    keys in LOCAL_CACHE_KEY_PREFIXES; it is disabled unless
+    settings.LOCAL_CACHE_SIZE is set.
+
+    Values are stored pickled, as memcached stores them, so that
+    callers never share (and modify) the same object.  Deleting a key
+    deletes it from this process's cache immediately, and records the
+    deletion in a Redis sorted set, which every process checks at most
+    every SYNC_INTERVAL_SECONDS before using its cache.  If Redis is
+    unavailable, the cache is emptied and not used.
+    """
+
+    INVALIDATIONS_KEY = "local_cache_invalidations"
+    SYNC_INTERVAL_SECONDS = 0.2
+
+    def __init__(self) -> None:
+        self.entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self.key_prefix = KEY_PREFIX
+        self.hits = 0
+        self.requests = 0
+        # The Redis server time, and our own monotonic time, of our
+        # last successful sync.
+        self.synced_at: float | None = None
+        self.last_sync_time = 0.0
+        self.next_sync_time = 0.0
+        self.redis_client: redis.StrictRedis[bytes] | None = None
+        self.invalidation_script: redis.commands.core.Script | None = None
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def get_redis_client(self) -> "redis.StrictRedis[bytes]":
+        if self.redis_client is None:
+            self.redis_client = get_redis_client()
+        return self.redis_client
+
+    def get_invalidation_script(self) -> redis.commands.core.Script:
+        if self.invalidation_script is None:
+            self.invalidation_script = self.get_redis_client().register_script(
+                LOCAL_CACHE_INVALIDATION_SCRIPT
+            )
+        return self.invalidation_script
+
+    def sync(self) -> bool:
+        """Drops any keys which other processes have deleted since our
+        last sync; returns whether the cache is up to date enough to
+        use."""
+        if self.key_prefix != KEY_PREFIX:
+            # KEY_PREFIX changes between tests.
+            self.clear()
+            self.key_prefix = KEY_PREFIX
+
+        now = time.monotonic()
+        if now < self.next_sync_time:
+            return self.synced_at is not None
+        self.next_sync_time = now + self.SYNC_INTERVAL_SECONDS
+        if self.synced_at is None or now - self.last_sync_time > settings.LOCAL_CACHE_TIMEOUT:
+            # Any deletions we might have missed are older than all
+            # of our entries would be, so we only need to forget
+            # about those entries to catch up.
+            self.clear()
+            since = "+inf"
+        else:
+            # Overlap our last sync by a second, so we do not miss a
+            # deletion which raced with filling the entry from
+            # memcached, or was rounded to the microsecond.
+            since = str(self.synced_at - 1)
+
+        try:
+            with self.get_redis_client().pipeline(transaction=True) as pipe:
+                pipe.time()
+                pipe.zrangebyscore(self.INVALIDATIONS_KEY, since, "+inf")
+                (seconds, microseconds), deleted_keys = pipe.execute()
+        except redis.exceptions.RedisError:
+            logger.warning("Could not sync the local cache with Redis", exc_info=True)
+            self.clear()
+            self.synced_at = None
+            return False
+
+        for key in deleted_keys:
+            self.entries.pop(key.decode(), None)
+        self.synced_at = seconds + microseconds / 1000000
+        self.last_sync_time = now
+        return True
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, Any]:
+        keys = [key for key in keys if key.startswith(LOCAL_CACHE_KEY_PREFIXES)]
+        if not keys or not self.sync():
+            return {}
+        self.requests += len(keys)
+        now = time.monotonic()
+        found = {}
+        for key in keys:
+            entry = self.entries.get(key)
+            if entry is None:
+                continue
+            expires, pickled_value = entry
+            if expires < now:
+                del self.entries[key]
+                continue
+            self.entries.move_to_end(key)
+            found[key] = pickle.loads(pickled_value)  # noqa: S301 # we pickled it ourselves
+        self.hits += len(found)
+        return found
+
+    def set_many(self, items: dict[str, Any]) -> None:
+        items = {
+            key: value
+            for key, value in items.items()
+            if key.startswith(LOCAL_CACHE_KEY_PREFIXES) and value is not None
+        }
+        if not items or not self.sync():
+            return
+        expires = time.monotonic() + settings.LOCAL_CACHE_TIMEOUT
+        for key, value in items.items():
+            self.entries[key] = (expires, pickle.dumps(value, protocol=5))
+            self.entries.move_to_end(key)
+        while len(self.entries) > settings.LOCAL_CACHE_SIZE:
+            self.entries.popitem(last=False)
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        keys = [key for key in keys if key.startswith(LOCAL_CACHE_KEY_PREFIXES)]
+        if not keys:
+            return
+        for key in keys:
+            self.entries.pop(key, None)
+        # Entries can live for up to LOCAL_CACHE_TIMEOUT, plus up to
+        # a sync interval before we notice that a process has fallen
+        # behind; keep each deletion for comfortably longer than that.
+        retention = settings.LOCAL_CACHE_TIMEOUT + 60
+        try:
+            for i in range(0, len(keys), 1000):
+                self.get_invalidation_script()(
+                    keys=[self.INVALIDATIONS_KEY], args=[retention, *keys[i : i + 1000]]
+                )
+        except redis.exceptions.RedisError:
+            logger.exception("Error while recording local cache deletions")
+
+
+local_cache = LocalCache()
+
+
+def local_cache_enabled(cache_name: str | None) -> bool:
+    return settings.LOCAL_CACHE_SIZE > 0 and cache_name is None
+
+
+# How long a process may hold the lease on recomputing a value, and
+# how long others wait for it to finish, before trying themselves.
+CACHE_LEASE_TIMEOUT = 10
+CACHE_LEASE_WAIT_SECONDS = 5.0
+CACHE_LEASE_POLL_SECONDS = 0.05
+
+
+def cache_lease_key(key: str) -> str:
+    return f"cache_lease:{hashlib.sha1(key.encode()).hexdigest()}"
+
+
+def acquire_cache_lease(key: str, cache_name: str | None = None) -> bool:
+    """Returns whether this process got the lease on recomputing the
+    value for the key, which only one process holds at a time."""
+    final_key = KEY_PREFIX + cache_lease_key(key)
+    remote_cache_stats_start()
+    try:
+        acquired = get_cache_backend(cache_name).add(final_key, True, timeout=CACHE_LEASE_TIMEOUT)
+    except MemcachedException:
+        logger.exception("Error while acquiring a cache lease")
+        acquired = True
+    remote_cache_stats_finish()
+    return acquired
+
+
+def release_cache_lease(key: str, cache_name: str | None = None) -> None:
+    final_key = KEY_PREFIX + cache_lease_key(key)
+    remote_cache_stats_start()
+    try:
+        get_cache_backend(cache_name).delete(final_key)
+    except MemcachedException:
+        logger.exception("Error while releasing a cache lease")
+    remote_cache_stats_finish()
+
+
+def wait_for_cache_lease(key: str, cache_name: str | None = None) -> Any:
+    """Waits for the process holding the lease on the key to store
+    its value, and returns it; returns None if the lease is released
+    without a value being stored, or we give up waiting."""
+    lease_key = cache_lease_key(key)
+    deadline = time.monotonic() + CACHE_LEASE_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(CACHE_LEASE_POLL_SECONDS)
+        found = cache_get_many([key, lease_key], cache_name=cache_name)
+        if key in found:
+            return found[key]
+        if lease_key not in found:
+            return None
+    return None
+
+
 def cache_with_key(
     keyfunc: Callable[ParamT, str],
     cache_name: str | None = None,
     timeout: int | None = None,
     pickled_tupled: bool = True,
+    *,
+    single_flight: bool = False,
+    stale_timeout: int | None = None,
 ) -> Callable[[Callable[ParamT, ReturnT]], Callable[ParamT, ReturnT]]:
     """Decorator which applies Django caching to a function.
 
     Decorator argument is a function which computes a cache key
     from the original function's arguments.  You are responsible
     for avoiding collisions with other uses of this decorator or
-    other uses of caching."""
+    other uses of caching.
+
+    For expensive functions with hot keys, single_flight=True makes
+    only one process at a time recompute a missing value, holding a
+    lease on it; the others wait for its result, rather than all
+    running the same queries at once.  stale_timeout additionally
+    keeps the value for that many seconds after its timeout, during
+    which one process recomputes it while the others return the
+    stale value.  Deleting the key never leaves a stale value.
+
+    Callers inside a database transaction skip the lease, and compute
+    the value themselves: another process's value would not reflect
+    the transaction's uncommitted changes."""
+
+    if stale_timeout is not None:
+        assert timeout is not None
+        single_flight = True
+    assert pickled_tupled or not single_flight
 
     def decorator(func: Callable[ParamT, ReturnT]) -> Callable[ParamT, ReturnT]:
         @wraps(func)
@@ -183,20 +451,51 @@ def cache_with_key(
             # result of None from a missing key.  Setting
             # pickled_tupled=False avoids pickling the result (if it's
             # a raw string or bytes) at the cost of losing this
-            # distinction.
+            # distinction.  With stale_timeout, they are instead
+            # (value, fresh until) pairs.
+            holding_lease = False
+            use_lease = single_flight and not transaction.get_connection().in_atomic_block
             if val is not None and pickled_tupled:
-                return val[0]
+                if stale_timeout is None or len(val) == 1 or val[1] > time.time():
+                    return val[0]
+                if use_lease:
+                    holding_lease = acquire_cache_lease(key, cache_name)
+                    if not holding_lease:
+                        return val[0]
+            elif use_lease:
+                holding_lease = acquire_cache_lease(key, cache_name)
+                if not holding_lease:
+                    val = wait_for_cache_lease(key, cache_name)
+                    if val is not None:
+                        return val[0]
 
-            val = func(*args, **kwargs)
-            if isinstance(val, QuerySet):
-                logging.error(
-                    "cache_with_key attempted to store a full QuerySet object -- declining to cache",
-                    stack_info=True,
-                )
-            else:
-                cache_set(
-                    key, val, cache_name=cache_name, timeout=timeout, pickled_tupled=pickled_tupled
-                )
+            try:
+                val = func(*args, **kwargs)
+                if isinstance(val, QuerySet):
+                    logging.error(
+                        "cache_with_key attempted to store a full QuerySet object -- declining to cache",
+                        stack_info=True,
+                    )
+                elif stale_timeout is not None:
+                    assert timeout is not None
+                    cache_set(
+                        key,
+                        (val, time.time() + timeout),
+                        cache_name=cache_name,
+                        timeout=timeout + stale_timeout,
+                        pickled_tupled=False,
+                    )
+                else:
+                    cache_set(
+                        key,
+                        val,
+                        cache_name=cache_name,
+                        timeout=timeout,
+                        pickled_tupled=pickled_tupled,
+                    )
+            finally:
+                if holding_lease:
+                    release_cache_lease(key, cache_name)
 
             return val
 
@@ -254,27 +553,57 @@ def cache_set(
     except MemcachedException:
         logger.exception("Error while storing to cache")
     remote_cache_stats_finish()
+    if local_cache_enabled(cache_name):
+        local_cache.set_many({key: val})
 
 
 def cache_get(key: str, cache_name: str | None = None) -> Any:
     final_key = KEY_PREFIX + key
     validate_cache_key(final_key)
 
+    if local_cache_enabled(cache_name):
+        local_ret = local_cache.get_many([key])
+        if key in local_ret:
+            if cache_profiler is not None:
+                cache_profiler([key], [key])
+            return local_ret[key]
+
     remote_cache_stats_start()
     cache_backend = get_cache_backend(cache_name)
     ret = cache_backend.get(final_key)
     remote_cache_stats_finish()
+    if local_cache_enabled(cache_name):
+        local_cache.set_many({key: ret})
+    if cache_profiler is not None:
+        cache_profiler([key], [] if ret is None else [key])
     return ret
 
 
 def cache_get_many(keys: list[str], cache_name: str | None = None) -> dict[str, Any]:
-    keys = [KEY_PREFIX + key for key in keys]
     for key in keys:
-        validate_cache_key(key)
+        validate_cache_key(KEY_PREFIX + key)
+
+    local_ret: dict[str, Any] = {}
+    if local_cache_enabled(cache_name):
+        local_ret = local_cache.get_many(keys)
+        remote_keys = [key for key in keys if key not in local_ret]
+        if not remote_keys:
+            if cache_profiler is not None:
+                cache_profiler(keys, local_ret)
+            return local_ret
+    else:
+        remote_keys = keys
+
     remote_cache_stats_start()
-    ret = get_cache_backend(cache_name).get_many(keys)
+    ret = get_cache_backend(cache_name).get_many([KEY_PREFIX + key for key in remote_keys])
     remote_cache_stats_finish()
-    return {key.removeprefix(KEY_PREFIX): value for key, value in ret.items()}
+    ret = {key.removeprefix(KEY_PREFIX): value for key, value in ret.items()}
+    if local_cache_enabled(cache_name):
+        local_cache.set_many(ret)
+    ret.update(local_ret)
+    if cache_profiler is not None:
+        cache_profiler(keys, ret)
+    return ret
 
 
 def safe_cache_get_many(keys: list[str], cache_name: str | None = None) -> dict[str, Any]:
@@ -302,13 +631,14 @@ def cache_set_many(
         new_key = KEY_PREFIX + key
         validate_cache_key(new_key)
         new_items[new_key] = item
-    items = new_items
     remote_cache_stats_start()
     try:
-        get_cache_backend(cache_name).set_many(items, timeout=timeout)
+        get_cache_backend(cache_name).set_many(new_items, timeout=timeout)
     except MemcachedException:
         logger.exception("Error while storing to cache")
     remote_cache_stats_finish()
+    if local_cache_enabled(cache_name):
+        local_cache.set_many(items)
 
 
 def safe_cache_set_many(
@@ -337,6 +667,7 @@ def cache_delete(key: str, cache_name: str | None = None) -> None:
 
 
 def cache_delete_many(items: Iterable[str], cache_name: str | None = None) -> None:
+    items = list(items)
     remote_cache_stats_start()
     keys = iter(e[0] + e[1] for e in product(get_all_cache_key_prefixes(), items))
     while True:
@@ -347,6 +678,8 @@ def cache_delete_many(items: Iterable[str], cache_name: str | None = None) -> No
             validate_cache_key(key, auto_prepend_prefix=False)
         get_cache_backend(cache_name).delete_many(batch)
     remote_cache_stats_finish()
+    if local_cache_enabled(cache_name):
+        local_cache.delete_many(items)
 
 
 def filter_good_and_bad_keys(keys: list[str]) -> tuple[list[str], list[str]]:
@@ -664,6 +997,13 @@ def bulk_flush_users(
 
     cache_delete_many(list(cache_keys_to_delete))
 
+    if changed(update_fields, stream_recipient_info_user_fields):
+        flush_stream_recipient_info(realm_id=realm.id)
+
+    if changed(update_fields, realm_user_dict_fields):
+        flush_realm_state_snapshots(realm.id)
+        record_user_state_changes(realm.id, [user_profile.id for user_profile in user_profiles])
+
     if changed(update_fields, ["email", "full_name", "id", "is_mirror_dummy"]):
         delete_display_recipient_cache(user_profiles)
 
@@ -715,6 +1055,8 @@ def flush_realm(
         cache_delete(active_guest_user_ids_cache_key(realm.id))
         cache_delete(realm_rendered_description_cache_key(realm))
         cache_delete(realm_text_description_cache_key(realm))
+        flush_realm_state_snapshots(realm.id)
+        reset_state_versions(realm.id)
     elif changed(update_fields, ["description"]):
         cache_delete(realm_rendered_description_cache_key(realm))
         cache_delete(realm_text_description_cache_key(realm))
@@ -757,6 +1099,113 @@ def flush_stream(
         cache_delete(bot_dicts_in_realm_cache_key(stream.realm_id))
 
 
+# The UserProfile fields which get_recipient_info reads for every
+# subscriber of the channel; see stream_recipient_info_cache_key.
+stream_recipient_info_user_fields: list[str] = [
+    "is_active",
+    "long_term_idle",
+    "enable_stream_email_notifications",
+    "enable_stream_push_notifications",
+    "wildcard_mentions_notify",
+    "enable_followed_topic_email_notifications",
+    "enable_followed_topic_push_notifications",
+    "enable_followed_topic_wildcard_mentions_notify",
+]
+
+stream_recipient_info_subscription_fields: list[str] = [
+    "active",
+    "is_user_active",
+    "is_muted",
+    "push_notifications",
+    "email_notifications",
+    "wildcard_mentions_notify",
+]
+
+
+def realm_state_generation_cache_key(realm_id: int) -> str:
+    return f"realm_state_generation:{realm_id}"
+
+
+def get_realm_state_generation(realm_id: int) -> str:
+    """The realm-wide parts of the /register initial state are cached
+    under this generation, which flush_realm_state_snapshots discards
+    to invalidate all of them; see zerver/lib/realm_state_snapshot.py."""
+    key = realm_state_generation_cache_key(realm_id)
+    generation = cache_get_many([key]).get(key)
+    if generation is None:
+        generation = secrets.token_hex(8)
+        cache_set_many({key: generation}, timeout=3600 * 24 * 7)
+    return generation
+
+
+def flush_realm_state_snapshots(realm_id: int) -> None:
+    def flush() -> None:
+        cache_delete(realm_state_generation_cache_key(realm_id))
+
+    # As in flush_stream_recipient_info, flushing again once the
+    # transaction commits ensures that a concurrent /register cannot
+    # leave the pre-transaction data cached under the new generation.
+    flush()
+    transaction.on_commit(flush)
+
+
+def stream_recipient_info_version_cache_key(recipient_id: int) -> str:
+    return f"stream_recipient_info_version:{recipient_id}"
+
+
+def realm_recipient_info_version_cache_key(realm_id: int) -> str:
+    return f"realm_recipient_info_version:{realm_id}"
+
+
+def stream_recipient_info_cache_key(realm_id: int, recipient_id: int) -> str:
+    """The subscriber data for a channel is invalidated by changes to
+    its subscriptions, or to the relevant settings of any user in the
+    realm; rather than finding and deleting every affected channel's
+    entry for the latter, the key includes a version for each, which
+    flush_stream_recipient_info discards to invalidate every entry
+    using it."""
+    version_keys = [
+        stream_recipient_info_version_cache_key(recipient_id),
+        realm_recipient_info_version_cache_key(realm_id),
+    ]
+    versions = cache_get_many(version_keys)
+    missing_versions = {key: secrets.token_hex(8) for key in version_keys if key not in versions}
+    if missing_versions:
+        cache_set_many(missing_versions, timeout=3600 * 24 * 7)
+        versions.update(missing_versions)
+    stream_version, realm_version = (versions[key] for key in version_keys)
+    return f"stream_recipient_info:{recipient_id}:{stream_version}:{realm_version}"
+
+
+def flush_stream_recipient_info(
+    *, recipient_ids: Iterable[int] = (), realm_id: int | None = None
+) -> None:
+    version_keys = [stream_recipient_info_version_cache_key(rid) for rid in recipient_ids]
+    if realm_id is not None:
+        version_keys.append(realm_recipient_info_version_cache_key(realm_id))
+    if not version_keys:
+        return
+
+    def flush() -> None:
+        cache_delete_many(version_keys)
+
+    # Flushing again once the transaction commits ensures that a
+    # concurrent message send cannot leave the pre-transaction data
+    # cached under the new version.
+    flush()
+    transaction.on_commit(flush)
+
+
+def flush_subscription(
+    *,
+    instance: "Subscription",
+    update_fields: Sequence[str] | None = None,
+    **kwargs: object,
+) -> None:
+    if changed(update_fields, stream_recipient_info_subscription_fields):
+        flush_stream_recipient_info(recipient_ids=[instance.recipient_id])
+
+
 def flush_used_upload_space_cache(
     *,
     instance: "Attachment",
@@ -11,6 +11,10 @@ Query: TypeAlias = str | bytes | Composable
 Params: TypeAlias = Sequence[object] | Mapping[str, object] | None
 ParamsT = TypeVar("ParamsT")
 
+# While a request is being profiled (see zerver/lib/request_profiling.py),
+# this is also passed each query's SQL and duration.
+query_profiler: Callable[[cursor, Query, float], None] | None = None
+
 
 # Similar to the tracking done in Django's CursorDebugWrapper, but done at the
 # psycopg2 cursor level so it works with SQLAlchemy.
@@ -29,6 +33,8 @@ def wrapper_execute(
                 "time": f"{duration:.3f}",
             }
         )
+        if query_profiler is not None:
+            query_profiler(self, sql, duration)
 
 
 class TimeTrackingCursor(cursor):
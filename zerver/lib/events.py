@@ -3,7 +3,7 @@
 import copy
 import logging
 import time
-from collections.abc import Callable, Collection, Iterable, Sequence
+from collections.abc import Callable, Collection, Iterable, Mapping, Sequence
 from dataclasses import asdict
 from typing import Any, Literal
 
@@ -58,12 +58,18 @@ from zerver.lib.onboarding_steps import get_next_onboarding_steps
 from zerver.lib.presence import get_presence_for_user, get_presences_for_realm
 from zerver.lib.realm_icon import realm_icon_url
 from zerver.lib.realm_logo import get_realm_logo_source, get_realm_logo_url
+from zerver.lib.realm_state_snapshot import RealmStateSnapshot
 from zerver.lib.scheduled_messages import (
     get_undelivered_reminders,
     get_undelivered_scheduled_messages,
 )
 from zerver.lib.soft_deactivation import reactivate_user_if_soft_deactivated
 from zerver.lib.sounds import get_available_notification_sounds
+from zerver.lib.state_versions import (
+    STATE_SECTION_EVENT_TYPES,
+    STATE_VERSION_EVENT_TYPES,
+    get_state_versions,
+)
 from zerver.lib.stream_subscription import handle_stream_notifications_compatibility
 from zerver.lib.streams import do_get_streams, get_web_public_streams
 from zerver.lib.subscription_info import (
@@ -77,6 +83,7 @@ from zerver.lib.timezone import canonicalize_timezone
 from zerver.lib.topic import TOPIC_NAME, maybe_rename_general_chat_to_empty_topic
 from zerver.lib.types import UserGroupMembersData
 from zerver.lib.user_groups import (
+    RealmUserGroupsData,
     get_group_setting_value_for_register_api,
     get_recursive_membership_groups,
     get_role_based_system_groups_dict,
@@ -88,6 +95,7 @@ from zerver.lib.user_topics import get_topic_mutes, get_user_topics
 from zerver.lib.users import (
     get_cross_realm_dicts,
     get_data_for_inaccessible_user,
+    get_shareable_users_for_api,
     get_users_for_api,
     is_administrator_role,
     is_moderator_role,
@@ -185,6 +193,7 @@ def fetch_initial_state_data(
     include_deactivated_groups: bool = False,
     archived_channels: bool = False,
     simplified_presence_events: bool = False,
+    client_state_versions: Mapping[str, str] | None = None,
 ) -> dict[str, Any]:
     """When `event_types` is None, fetches the core data powering the
     web app's `page_params` and `/api/v1/register` (for mobile/terminal
@@ -241,6 +250,50 @@ def fetch_initial_state_data(
             web_home_view="recent",
         )
 
+    # Realm-wide sections of the state may come from a cached
+    # snapshot; see zerver/lib/realm_state_snapshot.py.  The users
+    # section depends on which users and email addresses the user can
+    # access, so we only share it between non-guest users with the
+    # same role, and not with PARTIAL_USERS, which varies by user.
+    users_snapshot_eligible = (
+        user_profile is not None and not user_profile.is_guest and not settings.PARTIAL_USERS
+    )
+    snapshot_sections = {
+        "user_groups": str(int(include_deactivated_groups)),
+        "custom_profile_fields": "",
+        "realm_domains": "",
+        "realm_playgrounds": "",
+        "default_stream_groups": "",
+    }
+    if users_snapshot_eligible:
+        assert user_profile is not None
+        snapshot_sections["users"] = (
+            f"{user_profile.role}:{int(client_gravatar)}:{int(user_avatar_url_field_optional)}"
+        )
+    snapshot = RealmStateSnapshot(realm.id, snapshot_sections)
+
+    # Clients resuming from a previous /register can skip the sections
+    # they already have; see zerver/lib/state_versions.py.  For the
+    # same reasons as the users snapshot, realm_user is only resumable
+    # for users who can access all users.
+    resumed_sections: set[str] = set()
+    changed_user_ids: list[int] = []
+    if client_state_versions is not None and user_profile is not None:
+        state_versions = get_state_versions(
+            realm.id,
+            [section for section in STATE_SECTION_EVENT_TYPES if want(section)],
+            client_state_versions,
+            realm_user_variant=(
+                f"{user_profile.role}-{int(client_gravatar)}-{int(user_avatar_url_field_optional)}"
+                if users_snapshot_eligible
+                else None
+            ),
+        )
+        state["state_versions"] = state_versions.versions
+        state["resumed_state_sections"] = sorted(state_versions.resumed)
+        resumed_sections = state_versions.resumed
+        changed_user_ids = state_versions.changed_user_ids
+
     # We fetch early some collections of group that we need to
     # efficiently compute permissions.
     settings_user_recursive_group_ids = set()
@@ -261,10 +314,24 @@ def fetch_initial_state_data(
         # anonymous groups in realm_setting_group_ids and the
         # IDs of the NamedUserGroup objects used there, but
         # don't need the other NamedUserGroup fields.
-        realm_groups_data = user_groups_in_realm_serialized(
-            realm,
-            include_deactivated_groups=include_deactivated_groups,
-            fetch_anonymous_group_membership=True,
+        realm_groups_data = snapshot.get(
+            "user_groups",
+            lambda: user_groups_in_realm_serialized(
+                realm,
+                include_deactivated_groups=include_deactivated_groups,
+                fetch_anonymous_group_membership=True,
+            ),
+            load=lambda data: RealmUserGroupsData(
+                api_groups=data["api_groups"],
+                system_groups_name_dict={
+                    int(group_id): name
+                    for group_id, name in data["system_groups_name_dict"].items()
+                },
+                anonymous_group_membership={
+                    int(group_id): members
+                    for group_id, members in data["anonymous_group_membership"].items()
+                },
+            ),
         )
         anonymous_group_membership_data_dict: dict[int, UserGroupMembersData] = {}
         for key, value in realm_groups_data.anonymous_group_membership.items():
@@ -281,16 +348,18 @@ def fetch_initial_state_data(
             # Spectators can't access full user profiles or
             # personal settings, so we send an empty list.
             state["custom_profile_fields"] = []
-        else:
-            fields = custom_profile_fields_for_realm(realm.id)
-            state["custom_profile_fields"] = [f.as_dict() for f in fields]
+        elif "custom_profile_fields" not in resumed_sections:
+            state["custom_profile_fields"] = snapshot.get(
+                "custom_profile_fields",
+                lambda: [f.as_dict() for f in custom_profile_fields_for_realm(realm.id)],
+            )
         state["custom_profile_field_types"] = {
             item[4]: {"id": item[0], "name": str(item[1])}
             for item in CustomProfileField.ALL_FIELD_TYPES
         }
 
         if not pronouns_field_type_supported:
-            for field in state["custom_profile_fields"]:
+            for field in state.get("custom_profile_fields", []):
                 if field["type"] == CustomProfileField.PRONOUNS:
                     field["type"] = CustomProfileField.SHORT_TEXT
 
@@ -383,7 +452,7 @@ def fetch_initial_state_data(
         # Send server_timestamp, to match the format of `GET /presence` requests.
         state["server_timestamp"] = time.time()
 
-    if want("realm_user_groups"):
+    if want("realm_user_groups") and "realm_user_groups" not in resumed_sections:
         state["realm_user_groups"] = realm_groups_data.api_groups
 
     if want("realm"):
@@ -671,8 +740,8 @@ def fetch_initial_state_data(
             ).name
         )
 
-    if want("realm_domains"):
-        state["realm_domains"] = get_realm_domains(realm)
+    if want("realm_domains") and "realm_domains" not in resumed_sections:
+        state["realm_domains"] = snapshot.get("realm_domains", lambda: get_realm_domains(realm))
 
     if want("realm_emoji"):
         state["realm_emoji"] = get_all_custom_emoji_for_realm(realm.id)
@@ -693,8 +762,10 @@ def fetch_initial_state_data(
         # backwards-compatible `realm_filters` event would not render the it properly.
         state["realm_filters"] = []
 
-    if want("realm_playgrounds"):
-        state["realm_playgrounds"] = get_realm_playgrounds(realm)
+    if want("realm_playgrounds") and "realm_playgrounds" not in resumed_sections:
+        state["realm_playgrounds"] = snapshot.get(
+            "realm_playgrounds", lambda: get_realm_playgrounds(realm)
+        )
 
     if want("realm_billing"):
         state["realm_billing"] = {}
@@ -706,15 +777,39 @@ def fetch_initial_state_data(
         )
 
     if want("realm_user"):
-        state["raw_users"] = get_users_for_api(
-            realm,
-            user_profile,
-            client_gravatar=client_gravatar,
-            user_avatar_url_field_optional=user_avatar_url_field_optional,
-            # Don't send custom profile field values to spectators.
-            include_custom_profile_fields=user_profile is not None,
-            user_list_incomplete=user_list_incomplete,
-        )
+        if "realm_user" in resumed_sections:
+            # Only the users which changed since the client's version.
+            state["raw_users"] = get_users_for_api(
+                realm,
+                user_profile,
+                client_gravatar=client_gravatar,
+                user_avatar_url_field_optional=user_avatar_url_field_optional,
+                user_ids=changed_user_ids,
+            )
+        elif users_snapshot_eligible:
+            assert user_profile is not None
+            state["raw_users"] = snapshot.get(
+                "users",
+                lambda: get_shareable_users_for_api(
+                    realm,
+                    user_profile,
+                    client_gravatar=client_gravatar,
+                    user_avatar_url_field_optional=user_avatar_url_field_optional,
+                ),
+                load=lambda data: {int(user_id): row for user_id, row in data.items()},
+            )
+            # Users can always see their own delivery email.
+            state["raw_users"][user_profile.id]["delivery_email"] = user_profile.delivery_email
+        else:
+            state["raw_users"] = get_users_for_api(
+                realm,
+                user_profile,
+                client_gravatar=client_gravatar,
+                user_avatar_url_field_optional=user_avatar_url_field_optional,
+                # Don't send custom profile field values to spectators.
+                include_custom_profile_fields=user_profile is not None,
+                user_list_incomplete=user_list_incomplete,
+            )
         state["cross_realm_bots"] = list(get_cross_realm_dicts())
 
         # For the user's own avatar URL, we force
@@ -901,12 +996,13 @@ def fetch_initial_state_data(
         else:
             state["realm_default_streams"] = list(get_default_stream_ids_for_realm(realm.id))
 
-    if want("default_stream_groups"):
+    if want("default_stream_groups") and "default_stream_groups" not in resumed_sections:
         if settings_user.is_guest:
             state["realm_default_stream_groups"] = []
         else:
-            state["realm_default_stream_groups"] = default_stream_groups_to_dicts_sorted(
-                get_default_stream_groups(realm)
+            state["realm_default_stream_groups"] = snapshot.get(
+                "default_stream_groups",
+                lambda: default_stream_groups_to_dicts_sorted(get_default_stream_groups(realm)),
             )
 
     if want("stop_words"):
@@ -966,6 +1062,7 @@ def fetch_initial_state_data(
     if want("device"):
         state["devices"] = {} if user_profile is None else get_devices(user_profile)
 
+    snapshot.save()
     return state
 
 
@@ -2119,6 +2216,7 @@ def do_events_register(
     fetch_event_types: Collection[str] | None = None,
     spectator_requested_language: str | None = None,
     pronouns_field_type_supported: bool = True,
+    state_versions: Mapping[str, str] | None = None,
 ) -> dict[str, Any]:
     # Technically we don't need to check this here because
     # build_narrow_predicate will check it, but it's nicer from an error
@@ -2236,10 +2334,35 @@ def do_events_register(
         include_deactivated_groups=include_deactivated_groups,
         archived_channels=archived_channels,
         simplified_presence_events=simplified_presence_events,
+        client_state_versions=state_versions,
     )
 
     # Apply events that came in while we were fetching initial data
     events = get_user_events(user_profile, queue_id, -1)
+
+    if ret.get("resumed_state_sections") and any(
+        event["type"] in STATE_VERSION_EVENT_TYPES for event in events
+    ):
+        # These events may modify data from the resumed sections,
+        # which we don't have, so we fetch those in full instead.
+        # The versions we fetched are still correct, if older than
+        # necessary.
+        ret.update(
+            fetch_initial_state_data(
+                user_profile,
+                realm=realm,
+                event_types=ret["resumed_state_sections"],
+                queue_id=queue_id,
+                idle_queue_timeout_secs=result.idle_queue_timeout_secs,
+                client_gravatar=client_gravatar,
+                user_avatar_url_field_optional=user_avatar_url_field_optional,
+                pronouns_field_type_supported=pronouns_field_type_supported,
+                user_list_incomplete=user_list_incomplete,
+                include_deactivated_groups=include_deactivated_groups,
+                archived_channels=archived_channels,
+            )
+        )
+        ret["resumed_state_sections"] = []
     apply_events(
         user_profile,
         state=ret,
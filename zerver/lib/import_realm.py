@@ -36,7 +36,7 @@ from zerver.lib.avatar import generate_and_upload_jdenticon_avatar
 from zerver.lib.avatar_hash import user_avatar_base_path_from_ids
 from zerver.lib.bulk_create import bulk_set_stream_recipient_fields
 from zerver.lib.export import Field, Path, Record, TableName, date_fields_for_table
-from zerver.lib.markdown import markdown_convert
+from zerver.lib.markdown import DbData, get_db_data, markdown_convert
 from zerver.lib.markdown import version as markdown_version
 from zerver.lib.message import get_last_message_id
 from zerver.lib.migration_status import MigrationStatusJson, parse_migration_status
@@ -549,6 +549,7 @@ def fix_message_content_attributes(
     For messages imported from a third-party export, it also corrects the
     has_link and has_image attributes.
     """
+    messages_to_render = []
     for message in messages:
         if content_key not in message:
             # Message-edit entries include topic moves, which don't
@@ -614,6 +615,26 @@ def fix_message_content_attributes(
 
             continue
 
+        messages_to_render.append(message)
+
+    if not messages_to_render:
+        return
+
+    # Fetch the mentioned users, linked channels, etc. for the whole
+    # batch at once, rather than for each message.  This also enqueues
+    # thumbnailing for images that are referenced.  If that fails, we
+    # fall back to fetching them for each message, so that only the
+    # messages which cannot be rendered are skipped.
+    db_data: DbData | None = None
+    try:
+        db_data = get_db_data([message[content_key] for message in messages_to_render], realm)
+    except Exception:
+        logging.warning(
+            "Error fetching Markdown data for %s messages; rendering them one at a time",
+            len(messages_to_render),
+        )
+
+    for message in messages_to_render:
         try:
             content = message[content_key]
 
@@ -627,13 +648,13 @@ def fix_message_content_attributes(
             # words" type feature, and notifications aren't important anyway.
             realm_alert_words_automaton = None
 
-            # This also enqueues thumbnailing for images that are referenced
             rendering_result = markdown_convert(
                 content=content,
                 realm_alert_words_automaton=realm_alert_words_automaton,
                 message_realm=realm,
                 sent_by_bot=sent_by_bot,
                 translate_emoticons=translate_emoticons,
+                db_data=db_data,
             )
             rendered_content = rendering_result.rendered_content
             message["has_image"] = rendering_result.has_image
@@ -5,7 +5,7 @@ import re
 import time
 from collections import deque
 from collections.abc import Callable
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import datetime, timezone
 from functools import lru_cache
 from re import Match, Pattern
@@ -2551,6 +2551,64 @@ def privacy_clean_markdown(content: str) -> str:
     return repr(_privacy_re.sub("x", content))
 
 
+def get_db_data(
+    content: str | list[str],
+    message_realm: Realm,
+    *,
+    message_sender: UserProfile | None = None,
+    acting_user: UserProfile | None = None,
+    realm_alert_words_automaton: ahocorasick.Automaton | None = None,
+    sent_by_bot: bool = False,
+    translate_emoticons: bool = False,
+    mention_data: MentionData | None = None,
+) -> DbData:
+    """Fetches the data from the database needed to render content in
+    message_realm.  content may be a list of several messages' content,
+    all with the same sender and acting user, in which case the result
+    can be passed as db_data to render each of them."""
+    contents = [content] if isinstance(content, str) else content
+
+    # Here we fetch the data structures needed to render
+    # mentions/stream mentions from the database, but only
+    # if there is syntax in the message that might use them, since
+    # the fetches are somewhat expensive and these types of syntax
+    # are uncommon enough that it's a useful optimization.
+    if mention_data is None:
+        mention_backend = MentionBackend(message_realm.id)
+        mention_data = MentionData(mention_backend, contents, message_sender)
+
+    if acting_user is None:
+        acting_user = message_sender
+
+    stream_names: set[str] = set()
+    linked_stream_topic_data: set[ChannelTopicInfo] = set()
+    for message_content in contents:
+        stream_names |= possible_linked_stream_names(message_content)
+        linked_stream_topic_data |= possible_linked_topics(message_content)
+    stream_name_info = mention_data.get_stream_name_map(stream_names, acting_user=acting_user)
+    topic_info = mention_data.get_topic_info_map(linked_stream_topic_data, acting_user=acting_user)
+
+    if any(content_has_emoji_syntax(message_content) for message_content in contents):
+        active_realm_emoji = get_name_keyed_dict_for_active_realm_emoji(message_realm.id)
+    else:
+        active_realm_emoji = {}
+
+    user_upload_previews = manifest_and_get_user_upload_previews(
+        message_realm.id, "\n".join(contents)
+    )
+    return DbData(
+        realm_alert_words_automaton=realm_alert_words_automaton,
+        mention_data=mention_data,
+        active_realm_emoji=active_realm_emoji,
+        realm_url=message_realm.url,
+        sent_by_bot=sent_by_bot,
+        stream_names=stream_name_info,
+        topic_info=topic_info,
+        translate_emoticons=translate_emoticons,
+        user_upload_previews=user_upload_previews,
+    )
+
+
 def do_convert(
     content: str,
     realm_alert_words_automaton: ahocorasick.Automaton | None = None,
@@ -2563,8 +2621,13 @@ def do_convert(
     email_gateway: bool = False,
     no_previews: bool = False,
     acting_user: UserProfile | None = None,
+    db_data: DbData | None = None,
 ) -> MessageRenderingResult:
-    """Convert Markdown to HTML, with Zulip-specific settings and hacks."""
+    """Convert Markdown to HTML, with Zulip-specific settings and hacks.
+
+    db_data, if passed, is the result of get_db_data for a batch of
+    messages including this one; otherwise, we fetch it for just this
+    message."""
     # This logic is a bit convoluted, but the overall goal is to support a range of use cases:
     # * Nothing is passed in other than content -> just run default options (e.g. for docs)
     # * message is passed, but no realm is -> look up realm from message
@@ -2610,50 +2673,34 @@ def do_convert(
     md_engine.url_embed_data = url_embed_data
 
     # Pre-fetch data from the DB that is used in the Markdown thread
-    user_upload_previews = None
+    image_metadata = None
     if message_realm is not None:
-        # Here we fetch the data structures needed to render
-        # mentions/stream mentions from the database, but only
-        # if there is syntax in the message that might use them, since
-        # the fetches are somewhat expensive and these types of syntax
-        # are uncommon enough that it's a useful optimization.
-
-        message_sender = None
-        if message is not None:
-            message_sender = message.sender
-
-        if mention_data is None:
-            mention_backend = MentionBackend(message_realm.id)
-            mention_data = MentionData(mention_backend, content, message_sender)
-
-        if acting_user is None:
-            acting_user = message_sender
-
-        stream_names = possible_linked_stream_names(content)
-        stream_name_info = mention_data.get_stream_name_map(stream_names, acting_user=acting_user)
-
-        linked_stream_topic_data = possible_linked_topics(content)
-        topic_info = mention_data.get_topic_info_map(
-            linked_stream_topic_data, acting_user=acting_user
-        )
-
-        if content_has_emoji_syntax(content):
-            active_realm_emoji = get_name_keyed_dict_for_active_realm_emoji(message_realm.id)
+        shared_db_data = db_data is not None
+        if db_data is None:
+            db_data = get_db_data(
+                content,
+                message_realm,
+                message_sender=message.sender if message is not None else None,
+                acting_user=acting_user,
+                realm_alert_words_automaton=realm_alert_words_automaton,
+                sent_by_bot=sent_by_bot,
+                translate_emoticons=translate_emoticons,
+                mention_data=mention_data,
+            )
         else:
-            active_realm_emoji = {}
-
-        user_upload_previews = manifest_and_get_user_upload_previews(message_realm.id, content)
-        md_engine.zulip_db_data = DbData(
-            realm_alert_words_automaton=realm_alert_words_automaton,
-            mention_data=mention_data,
-            active_realm_emoji=active_realm_emoji,
-            realm_url=message_realm.url,
-            sent_by_bot=sent_by_bot,
-            stream_names=stream_name_info,
-            topic_info=topic_info,
-            translate_emoticons=translate_emoticons,
-            user_upload_previews=user_upload_previews,
-        )
+            db_data = replace(
+                db_data, sent_by_bot=sent_by_bot, translate_emoticons=translate_emoticons
+            )
+        image_metadata = db_data.user_upload_previews.image_metadata
+        if shared_db_data and image_metadata:
+            # Skip post-processing this message for the other
+            # messages' images.
+            image_metadata = {
+                path_id: metadata
+                for path_id, metadata in image_metadata.items()
+                if path_id in content
+            }
+        md_engine.zulip_db_data = db_data
 
     try:
         # Spend at most 5 seconds rendering; this protects the backend
@@ -2664,9 +2711,9 @@ def do_convert(
         rendering_result.rendered_content = unsafe_timeout(5, lambda: md_engine.convert(content))
 
         # Post-process the result with the rendered image previews:
-        if user_upload_previews is not None:
+        if image_metadata is not None:
             content_with_thumbnails, thumbnail_spinners = rewrite_thumbnailed_images(
-                rendering_result.rendered_content, user_upload_previews.image_metadata
+                rendering_result.rendered_content, image_metadata
             )
             rendering_result.thumbnail_spinners = thumbnail_spinners
             if content_with_thumbnails is not None:
@@ -2734,6 +2781,7 @@ def markdown_convert(
     email_gateway: bool = False,
     no_previews: bool = False,
     acting_user: UserProfile | None = None,
+    db_data: DbData | None = None,
 ) -> MessageRenderingResult:
     markdown_stats_start()
     ret = do_convert(
@@ -2748,6 +2796,7 @@ def markdown_convert(
         email_gateway,
         no_previews=no_previews,
         acting_user=acting_user,
+        db_data=db_data,
     )
     markdown_stats_finish()
     return ret
@@ -2763,6 +2812,7 @@ def render_message_markdown(
     email_gateway: bool = False,
     acting_user: UserProfile | None = None,
     no_previews: bool = False,
+    db_data: DbData | None = None,
 ) -> MessageRenderingResult:
     """
     This is basically just a wrapper for do_render_markdown.
@@ -2787,11 +2837,53 @@ def render_message_markdown(
         email_gateway=email_gateway,
         no_previews=no_previews,
         acting_user=acting_user,
+        db_data=db_data,
     )
 
     return rendering_result
 
 
+def render_message_markdown_batch(
+    messages: list[Message],
+    realm: Realm,
+    contents: list[str] | None = None,
+    realm_alert_words_automaton: ahocorasick.Automaton | None = None,
+) -> list[MessageRenderingResult]:
+    """Renders the content of several messages in realm, as
+    render_message_markdown would, but with one set of database
+    queries for each sender, rather than for each message.  contents
+    defaults to the content of each message."""
+    if contents is None:
+        contents = [message.content for message in messages]
+    assert len(contents) == len(messages)
+
+    # Which users and channels a message may mention or link depends
+    # on its sender, so we share data only between messages with the
+    # same sender.
+    indexes_by_sender: dict[int, list[int]] = {}
+    for i, message in enumerate(messages):
+        indexes_by_sender.setdefault(message.sender_id, []).append(i)
+
+    results: dict[int, MessageRenderingResult] = {}
+    for indexes in indexes_by_sender.values():
+        sender = messages[indexes[0]].sender
+        db_data = get_db_data(
+            [contents[i] for i in indexes],
+            realm,
+            message_sender=sender,
+            realm_alert_words_automaton=realm_alert_words_automaton,
+        )
+        for i in indexes:
+            results[i] = render_message_markdown(
+                messages[i],
+                contents[i],
+                realm=realm,
+                realm_alert_words_automaton=realm_alert_words_automaton,
+                db_data=db_data,
+            )
+    return [results[i] for i in range(len(messages))]
+
+
 def get_markdown_link_for_url(filename: str, url: str) -> str:
     # Our markdown has no escaping, so we cannot link any
     # text containing brackets; strip them from the
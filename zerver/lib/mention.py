@@ -374,20 +374,33 @@ def get_possible_mentions_info(
 
 class MentionData:
     def __init__(
-        self, mention_backend: MentionBackend, content: str, message_sender: UserProfile | None
+        self,
+        mention_backend: MentionBackend,
+        content: str | list[str],
+        message_sender: UserProfile | None,
     ) -> None:
+        """content may be a list of several messages' content, all
+        from message_sender, to fetch the data for rendering all of
+        them at once; the wildcard flags are then set if any of them
+        has wildcard mentions."""
         self.mention_backend = mention_backend
         realm_id = mention_backend.realm_id
         self.message_sender = message_sender
-        mentions = possible_mentions(content)
+        contents = [content] if isinstance(content, str) else content
+        mention_texts: set[str] = set()
+        self.has_stream_wildcards = False
+        self.has_topic_wildcards = False
+        for message_content in contents:
+            mentions = possible_mentions(message_content)
+            mention_texts |= mentions.mention_texts
+            self.has_stream_wildcards |= mentions.message_has_stream_wildcards
+            self.has_topic_wildcards |= mentions.message_has_topic_wildcards
         possible_mentions_info = get_possible_mentions_info(
-            mention_backend, mentions.mention_texts, message_sender
+            mention_backend, mention_texts, message_sender
         )
         self.full_name_info = {row.full_name.lower(): row for row in possible_mentions_info}
         self.user_id_info = {row.id: row for row in possible_mentions_info}
-        self.init_user_group_data(realm_id=realm_id, content=content)
-        self.has_stream_wildcards = mentions.message_has_stream_wildcards
-        self.has_topic_wildcards = mentions.message_has_topic_wildcards
+        self.init_user_group_data(realm_id=realm_id, contents=contents)
 
     def message_has_stream_wildcards(self) -> bool:
         return self.has_stream_wildcards
@@ -395,10 +408,15 @@ class MentionData:
     def message_has_topic_wildcards(self) -> bool:
         return self.has_topic_wildcards
 
-    def init_user_group_data(self, realm_id: int, content: str) -> None:
+    def init_user_group_data(self, realm_id: int, contents: list[str]) -> None:
         self.user_group_name_info: dict[str, NamedUserGroup] = {}
         self.user_group_members: dict[int, set[int]] = defaultdict(set)
-        user_group_names_mentions = possible_user_group_mentions(content)
+        user_group_names_mentions: dict[str, Literal["silent", "non-silent"]] = {}
+        for content in contents:
+            for group_name, mention_type in possible_user_group_mentions(content).items():
+                # As within a message, non-silent mentions take precedence.
+                if mention_type == "non-silent" or group_name not in user_group_names_mentions:
+                    user_group_names_mentions[group_name] = mention_type
         if user_group_names_mentions:
             named_user_groups = NamedUserGroup.objects.filter(
                 realm_for_sharding_id=realm_id, name__in=user_group_names_mentions
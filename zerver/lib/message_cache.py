@@ -7,16 +7,23 @@ from typing import Any, TypedDict
 import orjson
 
 from zerver.lib.avatar import get_avatar_field, get_avatar_for_inaccessible_user
-from zerver.lib.cache import cache_set_many, cache_with_key, to_dict_cache_key, to_dict_cache_key_id
+from zerver.lib.cache import (
+    cache_delete_many,
+    cache_set_many,
+    cache_with_key,
+    to_dict_cache_key,
+    to_dict_cache_key_id,
+)
 from zerver.lib.display_recipient import bulk_fetch_display_recipients
-from zerver.lib.markdown import render_message_markdown, topic_links
+from zerver.lib.markdown import render_message_markdown, render_message_markdown_batch, topic_links
 from zerver.lib.markdown import version as markdown_version
+from zerver.lib.parallel import run_parallel
 from zerver.lib.query_helpers import query_for_ids
 from zerver.lib.timestamp import datetime_to_timestamp
 from zerver.lib.topic import DB_TOPIC_NAME, TOPIC_LINKS, TOPIC_NAME
 from zerver.lib.types import DisplayRecipientT, EditHistoryEvent, UserDisplayRecipient
 from zerver.models import Message, Reaction, Realm, Recipient, Stream, SubMessage, UserProfile
-from zerver.models.realms import get_fake_email_domain
+from zerver.models.realms import get_fake_email_domain, get_realm_by_id
 
 
 class RawReactionRow(TypedDict):
@@ -100,6 +107,39 @@ def save_message_rendered_content(message: Message, content: str) -> str:
     return rendered_content
 
 
+def save_messages_rendered_content(realm: Realm, messages: list[Message]) -> None:
+    """Re-renders and saves the content of several messages in realm,
+    sharing the database queries for rendering between them."""
+    rendering_results = render_message_markdown_batch(messages, realm)
+    for message, rendering_result in zip(messages, rendering_results, strict=True):
+        message.rendered_content = rendering_result.rendered_content
+        message.rendered_content_version = markdown_version
+    Message.objects.bulk_update(messages, ["rendered_content", "rendered_content_version"])
+    cache_delete_many(to_dict_cache_key_id(message.id) for message in messages)
+
+
+def rerender_messages_batch(batch: tuple[int, list[int]]) -> None:
+    realm_id, message_ids = batch
+    messages = list(
+        Message.objects.filter(realm_id=realm_id, id__in=message_ids)
+        .select_related("sender")
+        .order_by("id")
+    )
+    save_messages_rendered_content(get_realm_by_id(realm_id), messages)
+
+
+def rerender_messages(
+    realm: Realm, message_ids: list[int], *, batch_size: int = 1000, processes: int = 1
+) -> None:
+    """Re-renders messages in batches of batch_size, using a pool of
+    processes if processes > 1; a batch which fails to render is
+    logged and skipped."""
+    batches = [
+        (realm.id, message_ids[i : i + batch_size]) for i in range(0, len(message_ids), batch_size)
+    ]
+    run_parallel(rerender_messages_batch, batches, processes, catch=True)
+
+
 class ReactionDict:
     @staticmethod
     def build_dict_from_raw_db_row(row: RawReactionRow) -> dict[str, Any]:
@@ -33,21 +33,54 @@ class OutgoingWebhookResult:
     widget_content: str | None = None
 
 
+@dataclass
+class OutgoingWebhookRequest:
+    url: str
+    json: dict[str, Any] | None = None
+    data: list[tuple[str, Any]] | None = None
+
+
+def make_outgoing_webhook_session() -> requests.Session:
+    return OutgoingSession(
+        role="webhook",
+        timeout=settings.OUTGOING_WEBHOOK_TIMEOUT_SECONDS,
+        headers={"User-Agent": "ZulipOutgoingWebhook/" + ZULIP_VERSION},
+    )
+
+
 class OutgoingWebhookServiceInterface(abc.ABC):
-    def __init__(self, token: str, user_profile: UserProfile, service_name: str) -> None:
+    def __init__(
+        self,
+        token: str,
+        user_profile: UserProfile,
+        service_name: str,
+        session: requests.Session | None = None,
+    ) -> None:
         self.token: str = token
         self.user_profile: UserProfile = user_profile
         self.service_name: str = service_name
-        self.session: requests.Session = OutgoingSession(
-            role="webhook",
-            timeout=settings.OUTGOING_WEBHOOK_TIMEOUT_SECONDS,
-            headers={"User-Agent": "ZulipOutgoingWebhook/" + ZULIP_VERSION},
-        )
+        if session is None:
+            session = make_outgoing_webhook_session()
+        self.session: requests.Session = session
 
     @abc.abstractmethod
-    def make_request(self, base_url: str, event: dict[str, Any], realm: Realm) -> Response | None:
+    def build_request(
+        self, base_url: str, event: dict[str, Any], realm: Realm
+    ) -> OutgoingWebhookRequest | None:
+        """Returns the request to send for the event, or None if
+        there is nothing to send.  This does all of the database
+        access needed, so that send_request need not."""
         raise NotImplementedError
 
+    def send_request(self, request: OutgoingWebhookRequest) -> Response:
+        return self.session.post(request.url, json=request.json, data=request.data)
+
+    def make_request(self, base_url: str, event: dict[str, Any], realm: Realm) -> Response | None:
+        request = self.build_request(base_url, event, realm)
+        if request is None:
+            return None
+        return self.send_request(request)
+
     @abc.abstractmethod
     def process_success(self, response_json: dict[str, Any]) -> OutgoingWebhookResult | None:
         raise NotImplementedError
@@ -55,7 +88,9 @@ class OutgoingWebhookServiceInterface(abc.ABC):
 
 class GenericOutgoingWebhookService(OutgoingWebhookServiceInterface):
     @override
-    def make_request(self, base_url: str, event: dict[str, Any], realm: Realm) -> Response | None:
+    def build_request(
+        self, base_url: str, event: dict[str, Any], realm: Realm
+    ) -> OutgoingWebhookRequest | None:
         """
         We send a simple version of the message to outgoing
         webhooks, since most of them really only need
@@ -87,7 +122,7 @@ class GenericOutgoingWebhookService(OutgoingWebhookServiceInterface):
             "trigger": event["trigger"],
         }
 
-        return self.session.post(base_url, json=request_data)
+        return OutgoingWebhookRequest(url=base_url, json=request_data)
 
     @override
     def process_success(self, response_json: dict[str, Any]) -> OutgoingWebhookResult | None:
@@ -112,7 +147,9 @@ class GenericOutgoingWebhookService(OutgoingWebhookServiceInterface):
 
 class SlackOutgoingWebhookService(OutgoingWebhookServiceInterface):
     @override
-    def make_request(self, base_url: str, event: dict[str, Any], realm: Realm) -> Response | None:
+    def build_request(
+        self, base_url: str, event: dict[str, Any], realm: Realm
+    ) -> OutgoingWebhookRequest | None:
         if event["message"]["type"] == "private":
             failure_message = "Slack outgoing webhooks don't support direct messages."
             fail_with_message(event, failure_message)
@@ -147,7 +184,7 @@ class SlackOutgoingWebhookService(OutgoingWebhookServiceInterface):
             ("trigger_word", event["trigger"]),
             ("service_id", event["user_profile_id"]),
         ]
-        return self.session.post(base_url, data=request_data)
+        return OutgoingWebhookRequest(url=base_url, data=request_data)
 
     @override
     def process_success(self, response_json: dict[str, Any]) -> OutgoingWebhookResult | None:
@@ -171,10 +208,15 @@ def get_service_interface_class(interface: str) -> Any:
         return AVAILABLE_OUTGOING_WEBHOOK_INTERFACES[interface]
 
 
-def get_outgoing_webhook_service_handler(service: Service) -> Any:
+def get_outgoing_webhook_service_handler(
+    service: Service, session: requests.Session | None = None
+) -> Any:
     service_interface_class = get_service_interface_class(service.interface_name())
     service_interface = service_interface_class(
-        token=service.token, user_profile=service.user_profile, service_name=service.name
+        token=service.token,
+        user_profile=service.user_profile,
+        service_name=service.name,
+        session=session,
     )
     return service_interface
 
@@ -350,56 +392,54 @@ def process_success_response(
     send_response_message(bot_id=bot_id, message_info=message_info, response_data=response_data)
 
 
-def do_rest_call(
-    base_url: str,
+def log_request_time(service_handler: OutgoingWebhookServiceInterface, seconds: float) -> None:
+    bot_profile = service_handler.user_profile
+    logging.info(
+        "Outgoing webhook request from %s@%s took %f seconds",
+        bot_profile.id,
+        bot_profile.realm.string_id,
+        seconds,
+    )
+
+
+def process_response(
     event: dict[str, Any],
     service_handler: OutgoingWebhookServiceInterface,
+    response: Response,
 ) -> Response | None:
-    """Returns response of call if no exception occurs."""
-    try:
-        start_time = perf_counter()
-        bot_profile = service_handler.user_profile
-        response = service_handler.make_request(
-            base_url,
-            event,
-            bot_profile.realm,
-        )
-        logging.info(
-            "Outgoing webhook request from %s@%s took %f seconds",
-            bot_profile.id,
-            bot_profile.realm.string_id,
-            perf_counter() - start_time,
-        )
-        if response is None:
-            return None
-        if str(response.status_code).startswith("2"):
-            try:
-                process_success_response(event, service_handler, response)
-            except JsonableError as e:
-                response_message = e.msg
-                logging.info("Outhook trigger failed:", stack_info=True)
-                fail_with_message(event, response_message)
-                response_message = f"The outgoing webhook server attempted to send a message in Zulip, but that request resulted in the following error:\n> {e}"
-                notify_bot_owner(
-                    event, response_content=response.text, failure_message=response_message
-                )
-                return None
-        else:
-            logging.warning(
-                "Message %(message_url)s triggered an outgoing webhook, returning status "
-                'code %(status_code)s.\n Content of response (in quotes): "'
-                '%(response)s"',
-                {
-                    "message_url": get_message_url(event),
-                    "status_code": response.status_code,
-                    "response": response.text,
-                },
+    if str(response.status_code).startswith("2"):
+        try:
+            process_success_response(event, service_handler, response)
+        except JsonableError as e:
+            response_message = e.msg
+            logging.info("Outhook trigger failed:", stack_info=True)
+            fail_with_message(event, response_message)
+            response_message = f"The outgoing webhook server attempted to send a message in Zulip, but that request resulted in the following error:\n> {e}"
+            notify_bot_owner(
+                event, response_content=response.text, failure_message=response_message
             )
-            failure_message = f"Third party responded with {response.status_code}"
-            fail_with_message(event, failure_message)
-            notify_bot_owner(event, response.status_code, response.content)
-        return response
-    except requests.exceptions.Timeout:
+            return None
+    else:
+        logging.warning(
+            "Message %(message_url)s triggered an outgoing webhook, returning status "
+            'code %(status_code)s.\n Content of response (in quotes): "'
+            '%(response)s"',
+            {
+                "message_url": get_message_url(event),
+                "status_code": response.status_code,
+                "response": response.text,
+            },
+        )
+        failure_message = f"Third party responded with {response.status_code}"
+        fail_with_message(event, failure_message)
+        notify_bot_owner(event, response.status_code, response.content)
+    return response
+
+
+def process_request_exception(
+    event: dict[str, Any], exception: requests.exceptions.RequestException
+) -> None:
+    if isinstance(exception, requests.exceptions.Timeout):
         logging.info(
             "Trigger event %s on %s timed out. Retrying",
             event["command"],
@@ -409,9 +449,10 @@ def do_rest_call(
             f"Request timed out after {settings.OUTGOING_WEBHOOK_TIMEOUT_SECONDS} seconds."
         )
         request_retry(event, failure_message=failure_message)
-        return None
-
-    except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError):
+    elif isinstance(
+        exception,
+        requests.exceptions.ConnectionError | requests.exceptions.ChunkedEncodingError,
+    ):
         logging.info(
             "Trigger event %s on %s resulted in a connection error. Retrying",
             event["command"],
@@ -419,14 +460,35 @@ def do_rest_call(
         )
         failure_message = "A connection error occurred. Is my bot server down?"
         request_retry(event, failure_message=failure_message)
-        return None
-
-    except requests.exceptions.RequestException as e:
+    else:
         response_message = (
-            f"An exception of type *{type(e).__name__}* occurred for message `{event['command']}`! "
+            f"An exception of type *{type(exception).__name__}* occurred for message `{event['command']}`! "
             "See the Zulip server logs for more information."
         )
-        logging.exception("Outhook trigger failed:", stack_info=True)
+        logging.error("Outhook trigger failed:", exc_info=exception, stack_info=True)
         fail_with_message(event, response_message)
-        notify_bot_owner(event, exception=e)
+        notify_bot_owner(event, exception=exception)
+
+
+def do_rest_call(
+    base_url: str,
+    event: dict[str, Any],
+    service_handler: OutgoingWebhookServiceInterface,
+) -> Response | None:
+    """Returns response of call if no exception occurs."""
+    try:
+        start_time = perf_counter()
+        bot_profile = service_handler.user_profile
+        response = service_handler.make_request(
+            base_url,
+            event,
+            bot_profile.realm,
+        )
+        log_request_time(service_handler, perf_counter() - start_time)
+    except requests.exceptions.RequestException as e:
+        process_request_exception(event, e)
+        return None
+
+    if response is None:
         return None
+    return process_response(event, service_handler, response)
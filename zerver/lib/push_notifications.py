@@ -340,21 +340,35 @@ def send_apple_push_notification(
     if have_missing_app_id:
         devices = [device for device in devices if device.ios_app_id is not None]
 
-    results: dict[DeviceToken, NotificationResult | BaseException] = {}
-    for device in devices:
-        # TODO obviously this should be made to actually use the async
-        request = aioapns.NotificationRequest(
+    notification_requests = {
+        device: aioapns.NotificationRequest(
             apns_topic=device.ios_app_id,
             device_token=device.token,
             message=message,
             time_to_live=24 * 3600,
         )
-        try:
-            results[device] = apns_context.loop.run_until_complete(
+        for device in devices
+    }
+
+    async def send_notifications() -> list[NotificationResult | BaseException]:
+        # Sending the notifications concurrently lets aioapns multiplex
+        # them over its HTTP/2 connection, rather than waiting for the
+        # response to each in turn.
+        return await asyncio.gather(
+            *(
                 apns_context.apns.send_notification(request)
-            )
-        except BaseException as e:
-            results[device] = e
+                for request in notification_requests.values()
+            ),
+            return_exceptions=True,
+        )
+
+    results: dict[DeviceToken, NotificationResult | BaseException] = dict(
+        zip(
+            notification_requests,
+            apns_context.loop.run_until_complete(send_notifications()),
+            strict=True,
+        )
+    )
 
     successfully_sent_count = 0
     for device, result in results.items():
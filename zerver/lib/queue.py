@@ -188,16 +188,21 @@ class SimpleQueueClient(QueueClient[BlockingChannel]):
         self,
         queue_name: str,
         callback: Callable[[list[dict[str, Any]]], None],
-        batch_size: int = 1,
-        timeout: int | None = None,
+        batch_size: int | Callable[[], int] = 1,
+        timeout: float | None = None,
     ) -> None:
+        """batch_size may be a function, which is called before each
+        batch is collected, for consumers which tune their batch size
+        while running."""
         if batch_size == 1:
             timeout = None
+        get_batch_size = batch_size if callable(batch_size) else lambda: batch_size
 
         def do_consume(channel: BlockingChannel) -> None:
             events: list[dict[str, Any]] = []
             last_process = time.time()
             max_processed: int | None = None
+            current_batch_size = get_batch_size()
             self.is_consuming = True
 
             # This iterator technique will iteratively collect up to
@@ -212,7 +217,7 @@ class SimpleQueueClient(QueueClient[BlockingChannel]):
                     events.append(orjson.loads(body))
                     max_processed = method.delivery_tag
                 now = time.time()
-                if len(events) >= batch_size or (timeout and now >= last_process + timeout):
+                if len(events) >= current_batch_size or (timeout and now >= last_process + timeout):
                     if events:
                         assert max_processed is not None
                         try:
@@ -223,6 +228,7 @@ class SimpleQueueClient(QueueClient[BlockingChannel]):
                                 channel.basic_nack(max_processed, multiple=True)
                             raise
                         events = []
+                        current_batch_size = get_batch_size()
                     last_process = now
                 if not self.is_consuming:
                     break
@@ -235,6 +241,14 @@ class SimpleQueueClient(QueueClient[BlockingChannel]):
             self.channel._pending_events  # type: ignore[attr-defined] # private member missing from stubs
         )
 
+    def set_prefetch(self, prefetch: int) -> None:
+        """Changes how many unacknowledged events RabbitMQ sends to this
+        client; this applies immediately to an open channel, and
+        otherwise once connected."""
+        self.prefetch = prefetch
+        if self.channel is not None and self.channel.is_open:
+            self.channel.basic_qos(prefetch_count=prefetch)
+
     def stop_consuming(self) -> None:
         assert self.channel is not None
         assert self.is_consuming
@@ -389,19 +403,44 @@ class TornadoQueueClient(QueueClient[Channel]):
         queue_name: str,
         callback: Callable[[list[dict[str, Any]]], None],
         batch_size: int = 1,
-        timeout: int | None = None,
+        timeout: float | None = None,
     ) -> None:
+        # Messages delivered together (i.e., in the same IOLoop
+        # iteration) are passed to the callback as one batch of up to
+        # batch_size events, on the next iteration of the IOLoop.
+        batch: list[dict[str, Any]] = []
+        batch_delivery_tag: int | None = None
+
+        def process_batch(ch: Channel) -> None:
+            nonlocal batch, batch_delivery_tag
+            if not batch:
+                return
+            events, delivery_tag = batch, batch_delivery_tag
+            batch, batch_delivery_tag = [], None
+            assert delivery_tag is not None
+            callback(events)
+            ch.basic_ack(delivery_tag=delivery_tag, multiple=len(events) > 1)
+
         def wrapped_consumer(
             ch: Channel,
             method: Basic.Deliver,
             properties: pika.BasicProperties,
             body: bytes,
         ) -> None:
+            nonlocal batch_delivery_tag
             assert method.delivery_tag is not None
-            callback([orjson.loads(body)])
-            ch.basic_ack(delivery_tag=method.delivery_tag)
+            if batch_size == 1:
+                callback([orjson.loads(body)])
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+                return
+
+            if not batch:
+                ioloop.IOLoop.current().add_callback(process_batch, ch)
+            batch.append(orjson.loads(body))
+            batch_delivery_tag = method.delivery_tag
+            if len(batch) >= batch_size:
+                process_batch(ch)
 
-        assert batch_size == 1
         assert timeout is None
         self.consumers[queue_name].add(wrapped_consumer)
 
@@ -466,11 +505,20 @@ def queue_event_on_commit(queue_name: str, event: dict[str, Any]) -> None:
     transaction.on_commit(lambda: queue_json_publish_rollback_unsafe(queue_name, event))
 
 
+def sharded_queue_name(queue_name: str, shard_key: int) -> str:
+    """Returns the sub-queue of a queue that is partitioned into
+    settings.QUEUE_SHARDS[queue_name] shards which carries the events
+    for shard_key, usually a user or realm ID.  Each shard has a
+    single consumer, so events published with the same shard_key are
+    processed in order."""
+    shards = settings.QUEUE_SHARDS.get(queue_name, 1)
+    if shards > 1:
+        return f"{queue_name}_shard{shard_key % shards + 1}"
+    return queue_name
+
+
 def mobile_notifications_queue_name(user_id: int) -> str:
-    if settings.MOBILE_NOTIFICATIONS_SHARDS > 1:
-        shard_id = user_id % settings.MOBILE_NOTIFICATIONS_SHARDS + 1
-        return f"missedmessage_mobile_notifications_shard{shard_id}"
-    return "missedmessage_mobile_notifications"
+    return sharded_queue_name("missedmessage_mobile_notifications", user_id)
 
 
 def retry_event(
@@ -3,7 +3,11 @@
 --
 -- KEYS[1] = block_key, KEYS[2] = gcra_key
 -- ARGV[1] = num_rules, ARGV[2..2*num_rules+1] = w1, l1, w2, l2, ...
--- ARGV[2*num_rules+2] (optional) = override timestamp for tests only
+-- ARGV[2*num_rules+2] = cost: requests to check and count
+-- ARGV[2*num_rules+3] = admitted: requests which a server process has
+--   already admitted from its local budget, which are counted without
+--   being checked
+-- ARGV[2*num_rules+4] (optional) = override timestamp for tests only
 --
 -- Returns a 4-element list of strings:
 --   [ratelimited, secs_to_freedom, calls_remaining, secs_to_reset]
@@ -11,13 +15,15 @@
 local block_key = KEYS[1]
 local gcra_key = KEYS[2]
 local num_rules = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2 * num_rules + 2])
+local admitted = tonumber(ARGV[2 * num_rules + 3])
 
 -- Use Redis server time so that all app servers see a consistent
 -- clock, avoiding false positives from inter-machine clock drift.
 -- Tests may pass an explicit timestamp as the last argument to get
 -- deterministic behavior without wall-clock sleeps.
 local now
-local test_time_arg = ARGV[2 * num_rules + 2]
+local test_time_arg = ARGV[2 * num_rules + 4]
 if test_time_arg then
     now = tonumber(test_time_arg)
 else
@@ -32,12 +38,28 @@ if redis.call('EXISTS', block_key) == 1 then
     return {'1', string.format('%.17g', ttl / 1000.0), '0', '0'}
 end
 
+-- Stores the given TATs, expiring the hash once they have all passed.
+local function persist_tats(fields, tats)
+    local max_ttl = 0
+    for i = 1, num_rules do
+        redis.call('HSET', gcra_key, fields[i], string.format('%.17g', tats[i]))
+        if tats[i] - now > max_ttl then
+            max_ttl = tats[i] - now
+        end
+    end
+    local ttl_seconds = math.ceil(max_ttl)
+    if ttl_seconds > 0 then
+        redis.call('EXPIRE', gcra_key, ttl_seconds)
+    end
+end
+
 -- For each rule, compute the new TAT (Theoretical Arrival Time)
 -- without writing anything yet.  If any rule would be violated,
--- we reject the request and leave all TATs unchanged.
+-- we reject the request and leave all TATs unchanged, other than to
+-- count any already-admitted requests.
 local fields = {}
+local admitted_tats = {}
 local new_tats = {}
-local max_ttl = 0
 local limited = false
 local secs_to_freedom = 0
 
@@ -52,7 +74,10 @@ for i = 1, num_rules do
     -- If the stored TAT is in the past, treat it as now (the
     -- bucket has fully drained).
     local tat = math.max(stored and tonumber(stored) or now, now)
-    local new_tat = tat + emission_interval
+    -- Already-admitted requests are counted even if they overflow the
+    -- bucket, though only up to it being full.
+    tat = math.min(tat + emission_interval * admitted, math.max(tat, now + window))
+    local new_tat = tat + emission_interval * cost
 
     -- The bucket overflows when new_tat exceeds the window
     -- horizon: the request arrived faster than the drain rate
@@ -66,26 +91,21 @@ for i = 1, num_rules do
     end
 
     fields[i] = field
+    admitted_tats[i] = tat
     new_tats[i] = new_tat
-    local remaining = new_tat - now
-    if remaining > max_ttl then
-        max_ttl = remaining
-    end
 end
 
--- All-or-nothing: if any rule triggered, reject without updating.
+-- All-or-nothing: if any rule triggered, reject without counting
+-- the request.
 if limited then
+    if admitted > 0 then
+        persist_tats(fields, admitted_tats)
+    end
     return {'1', string.format('%.17g', secs_to_freedom), '0', '0'}
 end
 
 -- Request allowed — persist all new TATs atomically.
-for i = 1, num_rules do
-    redis.call('HSET', gcra_key, fields[i], string.format('%.17g', new_tats[i]))
-end
-local ttl_seconds = math.ceil(max_ttl)
-if ttl_seconds > 0 then
-    redis.call('EXPIRE', gcra_key, ttl_seconds)
-end
+persist_tats(fields, new_tats)
 
 -- Compute remaining quota for the max (outermost) rule, used for
 -- the X-RateLimit-Remaining response header.
@@ -1,12 +1,14 @@
 import logging
 import time
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from datetime import timedelta
 from ipaddress import IPv6Network, ip_network
 from pathlib import Path
 from typing import Optional
 
 import orjson
+import redis.client
 import redis.commands.core
 from django.conf import settings
 from django.http import HttpRequest
@@ -116,7 +118,7 @@ class RateLimitedUser(RateLimitedObject):
         self.user_id = user.id
         self.rate_limits = user.rate_limits
         self.domain = domain
-        super().__init__()
+        super().__init__(get_rate_limiter_backend(domain))
 
     @override
     def key(self) -> str:
@@ -141,7 +143,7 @@ class RateLimitedIPAddr(RateLimitedObject):
         self.ip_addr = ip_addr
         self.ipv6_network_prefix = ipv6_network_prefix
         self.domain = domain
-        super().__init__()
+        super().__init__(get_rate_limiter_backend(domain))
 
     @override
     def key(self) -> str:
@@ -275,25 +277,38 @@ class RedisRateLimiterBackend(RateLimiterBackend):
         return calls_remaining, secs_to_reset
 
     @classmethod
-    @override
-    def rate_limit_entity(
-        cls, entity_key: str, rules: list[tuple[int, int]], max_api_calls: int, max_api_window: int
-    ) -> tuple[bool, float, int, float]:
+    def run_script(
+        cls,
+        entity_key: str,
+        rules: list[tuple[int, int]],
+        *,
+        cost: int = 1,
+        admitted: int = 0,
+        pipe: redis.client.Pipeline | None = None,
+    ) -> list[bytes]:
+        """Checks and counts `cost` requests against the rules, first
+        counting `admitted` requests which have already been allowed
+        without checking them.  If a pipeline is passed, the script is
+        queued on it, rather than being run immediately."""
         assert rules
         gcra_key, block_key = cls.get_keys(entity_key)
 
-        # Build args: num_rules, w1, l1, w2, l2, ...[, now]
+        # Build args: num_rules, w1, l1, w2, l2, ..., cost, admitted[, now]
         # The Lua script uses Redis TIME internally for clock
         # consistency; tests may pass a trailing timestamp override.
         args: list[float | int] = [len(rules)]
         for window, limit in rules:
             args.append(window)
             args.append(limit)
+        args.append(cost)
+        args.append(admitted)
         if cls._testing_clock:
             args.append(time.time())
 
-        result = cls._get_script()(keys=[block_key, gcra_key], args=args)
+        return cls._get_script()(keys=[block_key, gcra_key], args=args, client=pipe)
 
+    @classmethod
+    def parse_result(cls, result: list[bytes]) -> tuple[bool, float, int, float]:
         ratelimited = result[0] == b"1"
         secs_to_freedom = float(result[1])
         calls_remaining = int(result[2])
@@ -301,6 +316,124 @@ class RedisRateLimiterBackend(RateLimiterBackend):
 
         return ratelimited, secs_to_freedom, calls_remaining, secs_to_reset
 
+    @classmethod
+    @override
+    def rate_limit_entity(
+        cls, entity_key: str, rules: list[tuple[int, int]], max_api_calls: int, max_api_window: int
+    ) -> tuple[bool, float, int, float]:
+        return cls.parse_result(cls.run_script(entity_key, rules))
+
+
+@dataclass
+class LocalRateLimitBudget:
+    rules: list[tuple[int, int]]
+    # Requests which this process may still allow without asking Redis.
+    remaining: int
+    # Requests which this process has allowed, but not yet told Redis of.
+    unreported: int
+    expires: float
+    calls_remaining: int
+    secs_to_reset: float
+
+
+class LocalBudgetRateLimiterBackend(RedisRateLimiterBackend):
+    """A two-tier rate limiter, which saves a Redis round trip on most
+    requests.  When Redis allows a request, it also grants this process
+    a small budget of further requests for the entity, which are allowed
+    without asking Redis, for a short time.  The requests allowed from
+    the budget are reported to Redis in batches; the next check with
+    Redis counts them, and every REPORT_INTERVAL_SECONDS they are all
+    reported in one pipeline.
+
+    Each process can thus allow up to RATE_LIMITING_LOCAL_BUDGET
+    requests beyond the limit, so this is only used for the domains in
+    RATE_LIMITING_LOCAL_BUDGET_DOMAINS, where that is acceptable."""
+
+    budgets: dict[str, LocalRateLimitBudget] = {}
+    last_report_time = 0.0
+
+    BUDGET_SECONDS = 1
+    REPORT_INTERVAL_SECONDS = 1
+
+    @classmethod
+    def report_usage(cls) -> None:
+        now = time.time()
+        cls.last_report_time = now
+        with client.pipeline(transaction=False) as pipe:
+            for entity_key, budget in list(cls.budgets.items()):
+                if budget.unreported > 0:
+                    cls.run_script(
+                        entity_key, budget.rules, cost=0, admitted=budget.unreported, pipe=pipe
+                    )
+                    budget.unreported = 0
+                if budget.expires <= now:
+                    del cls.budgets[entity_key]
+            if len(pipe) > 0:
+                pipe.execute()
+
+    @classmethod
+    def forget_budget(cls, entity_key: str) -> None:
+        budget = cls.budgets.pop(entity_key, None)
+        if budget is not None and budget.unreported > 0:
+            cls.run_script(entity_key, budget.rules, cost=0, admitted=budget.unreported)
+
+    @classmethod
+    @override
+    def block_access(cls, entity_key: str, seconds: int) -> None:
+        cls.forget_budget(entity_key)
+        super().block_access(entity_key, seconds)
+
+    @classmethod
+    @override
+    def clear_history(cls, entity_key: str) -> None:
+        cls.budgets.pop(entity_key, None)
+        super().clear_history(entity_key)
+
+    @classmethod
+    @override
+    def rate_limit_entity(
+        cls, entity_key: str, rules: list[tuple[int, int]], max_api_calls: int, max_api_window: int
+    ) -> tuple[bool, float, int, float]:
+        now = time.time()
+        budget = cls.budgets.get(entity_key)
+        if budget is not None and budget.remaining > 0 and budget.expires > now:
+            budget.remaining -= 1
+            budget.unreported += 1
+            budget.calls_remaining = max(0, budget.calls_remaining - 1)
+            if now - cls.last_report_time >= cls.REPORT_INTERVAL_SECONDS:
+                cls.report_usage()
+            return False, 0.0, budget.calls_remaining, budget.secs_to_reset
+
+        # Ask Redis, counting anything allowed from the previous budget
+        # in the same round trip.
+        unreported = budget.unreported if budget is not None else 0
+        ratelimited, secs_to_freedom, calls_remaining, secs_to_reset = cls.parse_result(
+            cls.run_script(entity_key, rules, admitted=unreported)
+        )
+        if ratelimited:
+            cls.budgets.pop(entity_key, None)
+        else:
+            # Only take a share of what is left, so that the other
+            # processes can allow requests too.
+            cls.budgets[entity_key] = LocalRateLimitBudget(
+                rules=rules,
+                remaining=min(settings.RATE_LIMITING_LOCAL_BUDGET, calls_remaining // 2),
+                unreported=0,
+                expires=now + cls.BUDGET_SECONDS,
+                calls_remaining=calls_remaining,
+                secs_to_reset=secs_to_reset,
+            )
+        return ratelimited, secs_to_freedom, calls_remaining, secs_to_reset
+
+
+def get_rate_limiter_backend(domain: str) -> type[RateLimiterBackend]:
+    if (
+        settings.RATE_LIMITING_LOCAL_BUDGET > 0
+        and domain in settings.RATE_LIMITING_LOCAL_BUDGET_DOMAINS
+    ):
+        return LocalBudgetRateLimiterBackend
+    return RedisRateLimiterBackend
+
 
 class RateLimitResult:
     def __init__(
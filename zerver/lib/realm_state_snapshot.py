@@ -0,0 +1,87 @@
+from collections.abc import Callable, Mapping
+from typing import Any, TypeVar
+
+import orjson
+from django.conf import settings
+
+from zerver.lib.cache import get_realm_state_generation, safe_cache_get_many, safe_cache_set_many
+
+# With settings.REALM_STATE_SNAPSHOTS, the parts of the /register
+# initial state which are shared by many users of a realm (user
+# groups, users, custom profile fields, etc.) are computed once and
+# cached as serialized JSON fragments, keyed by the realm's state
+# generation.  Each fragment is specific to the client capabilities
+# and, where relevant, user role which affect its contents.
+#
+# Any event of one of these types changes state which may be part of
+# a snapshot, so sending one discards the realm's generation; see
+# zerver/tornado/django_api.py.  Since clients register their event
+# queue before fetching the initial state, a snapshot computed just
+# before a change is fixed up by the change's event, just like state
+# fetched from the database.
+REALM_STATE_SNAPSHOT_EVENT_TYPES = {
+    "custom_profile_fields",
+    "default_stream_groups",
+    "default_streams",
+    "realm_bot",
+    "realm_domains",
+    "realm_playgrounds",
+    "realm_user",
+    "stream",
+    "user_group",
+}
+
+REALM_STATE_SNAPSHOT_TIMEOUT_SECONDS = 3600 * 24
+
+T = TypeVar("T")
+
+
+def realm_state_snapshot_cache_key(
+    realm_id: int, generation: str, section: str, variant: str
+) -> str:
+    return f"realm_state_snapshot:{realm_id}:{generation}:{section}:{variant}"
+
+
+class RealmStateSnapshot:
+    """The cached fragments for one /register request.  `sections`
+    maps each section the request may need to the variant it needs,
+    so that they can be fetched with a single cache query."""
+
+    def __init__(self, realm_id: int, sections: Mapping[str, str]) -> None:
+        self.enabled = settings.REALM_STATE_SNAPSHOTS
+        self.keys: dict[str, str] = {}
+        self.fragments: dict[str, bytes] = {}
+        self.new_fragments: dict[str, bytes] = {}
+        if not self.enabled:
+            return
+        generation = get_realm_state_generation(realm_id)
+        self.keys = {
+            section: realm_state_snapshot_cache_key(realm_id, generation, section, variant)
+            for section, variant in sections.items()
+        }
+        self.fragments = safe_cache_get_many(list(self.keys.values()))
+
+    def get(
+        self,
+        section: str,
+        compute: Callable[[], T],
+        load: Callable[[Any], T] = lambda data: data,
+    ) -> T:
+        """Returns the section's data, computing and caching it if
+        needed.  The data is a fresh copy, which the caller may
+        modify.  It is cached as JSON, which `load` converts back to
+        what `compute` returns; e.g. integer dictionary keys come back
+        as strings."""
+        if not self.enabled:
+            return compute()
+        key = self.keys[section]
+        fragment = self.fragments.get(key)
+        if fragment is None:
+            fragment = orjson.dumps(compute(), option=orjson.OPT_NON_STR_KEYS)
+            self.fragments[key] = self.new_fragments[key] = fragment
+        return load(orjson.loads(fragment))
+
+    def save(self) -> None:
+        if self.new_fragments:
+            safe_cache_set_many(self.new_fragments, timeout=REALM_STATE_SNAPSHOT_TIMEOUT_SECONDS)
+            self.new_fragments = {}
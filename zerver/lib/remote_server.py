@@ -28,7 +28,7 @@ from zerver.lib.exceptions import (
     RequestExpiredError,
 )
 from zerver.lib.outgoing_http import OutgoingSession
-from zerver.lib.queue import queue_event_on_commit
+from zerver.lib.queue import queue_event_on_commit, sharded_queue_name
 from zerver.lib.redis_utils import get_redis_client
 from zerver.lib.types import AnalyticsDataUploadLevel
 from zerver.models import Realm, RealmAuditLog
@@ -496,7 +496,7 @@ def maybe_enqueue_audit_log_upload(realm: Realm) -> None:
 
     if uses_notification_bouncer():
         event = {"type": "push_bouncer_update_for_realm", "realm_id": realm.id}
-        queue_event_on_commit("deferred_work", event)
+        queue_event_on_commit(sharded_queue_name("deferred_work", realm.id), event)
 
 
 SELF_HOSTING_REGISTRATION_TAKEOVER_CHALLENGE_TOKEN_REDIS_KEY = (
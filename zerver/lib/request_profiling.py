@@ -0,0 +1,166 @@
+import logging
+import random
+import re
+import time
+from collections import Counter
+from collections.abc import Collection
+from dataclasses import dataclass, field
+from typing import Any
+
+import orjson
+import redis
+from django.conf import settings
+from psycopg2.extensions import cursor
+from psycopg2.sql import Composable
+
+from zerver.lib import cache, db
+from zerver.lib.db import Query
+from zerver.lib.redis_utils import get_redis_client
+
+# Opt-in sampling of which database queries and cache keys a request
+# uses, for diagnosing slow endpoints in production.  Which requests
+# are profiled is controlled by the REQUEST_PROFILING_* settings; the
+# most recent profiles are kept in a capped Redis list, which
+# `manage.py request_profiles` summarizes.
+
+REQUEST_PROFILES_KEY = "request_profiles"
+
+# A query run at least this many times by one request is likely to be
+# an N+1 pattern, which should be a single bulk query instead.
+N_PLUS_ONE_THRESHOLD = 10
+
+STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+PLACEHOLDER_RE = re.compile(r"%(?:\(\w+\))?s")
+VALUE_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+ARRAY_RE = re.compile(r"ARRAY\[[^\]]*\]")
+WHITESPACE_RE = re.compile(r"\s+")
+
+redis_client: "redis.StrictRedis[bytes] | None" = None
+
+
+def fingerprint_query(sql: str) -> str:
+    """Normalizes a query's SQL, so that queries which differ only in
+    their parameters are counted together."""
+    sql = STRING_LITERAL_RE.sub("?", sql)
+    sql = NUMBER_RE.sub("?", sql)
+    sql = PLACEHOLDER_RE.sub("?", sql)
+    sql = VALUE_LIST_RE.sub("(...)", sql)
+    sql = ARRAY_RE.sub("ARRAY[...]", sql)
+    return WHITESPACE_RE.sub(" ", sql).strip()
+
+
+def cache_key_family(key: str) -> str:
+    return key.split(":", 1)[0]
+
+
+@dataclass
+class RequestProfile:
+    start_time: float = field(default_factory=time.perf_counter)
+    queries: list[tuple[str, float]] = field(default_factory=list)
+    cache_requests: Counter[str] = field(default_factory=Counter)
+    cache_misses: Counter[str] = field(default_factory=Counter)
+
+    def record_query(self, cursor_obj: cursor, sql: Query, duration: float) -> None:
+        # Fingerprinting is deferred until we know that the profile
+        # will be kept.
+        if isinstance(sql, Composable):
+            sql = sql.as_string(cursor_obj)
+        elif isinstance(sql, bytes):
+            sql = sql.decode(errors="replace")
+        self.queries.append((sql, duration))
+
+    def record_cache_get(self, keys: Collection[str], found_keys: Collection[str]) -> None:
+        for key in keys:
+            family = cache_key_family(key)
+            self.cache_requests[family] += 1
+            if key not in found_keys:
+                self.cache_misses[family] += 1
+
+    def summary(
+        self, *, path: str, method: str, user_id: int | None, status_code: int
+    ) -> dict[str, Any]:
+        queries: dict[str, dict[str, Any]] = {}
+        for sql, duration in self.queries:
+            query = queries.setdefault(fingerprint_query(sql), {"count": 0, "time": 0.0})
+            query["count"] += 1
+            query["time"] += duration
+        return {
+            "timestamp": time.time(),
+            "path": path,
+            "method": method,
+            "user_id": user_id,
+            "status_code": status_code,
+            "time": time.perf_counter() - self.start_time,
+            "queries": [{"sql": sql, **query} for sql, query in queries.items()],
+            "n_plus_one": [
+                sql for sql, query in queries.items() if query["count"] >= N_PLUS_ONE_THRESHOLD
+            ],
+            "cache": {
+                family: {"requests": count, "misses": self.cache_misses[family]}
+                for family, count in self.cache_requests.items()
+            },
+        }
+
+
+def should_profile_request(path: str) -> bool:
+    if not settings.REQUEST_PROFILING_PATHS and not settings.REQUEST_PROFILING_USER_IDS:
+        return False
+    if settings.REQUEST_PROFILING_PATHS and not path.startswith(
+        tuple(settings.REQUEST_PROFILING_PATHS)
+    ):
+        return False
+    return random.random() < settings.REQUEST_PROFILING_SAMPLE_RATE
+
+
+def resume_request_profile(profile: RequestProfile) -> None:
+    db.query_profiler = profile.record_query
+    cache.cache_profiler = profile.record_cache_get
+
+
+def pause_request_profile() -> None:
+    db.query_profiler = None
+    cache.cache_profiler = None
+
+
+def start_request_profile() -> RequestProfile:
+    profile = RequestProfile()
+    resume_request_profile(profile)
+    return profile
+
+
+def finish_request_profile(
+    profile: RequestProfile, *, path: str, method: str, user_id: int | None, status_code: int
+) -> None:
+    pause_request_profile()
+    # The user is only known once the request has been authenticated,
+    # so requests by other users are discarded here, rather than not
+    # profiled at all.
+    if settings.REQUEST_PROFILING_USER_IDS and user_id not in settings.REQUEST_PROFILING_USER_IDS:
+        return
+    summary = profile.summary(path=path, method=method, user_id=user_id, status_code=status_code)
+    try:
+        with get_request_profiles_redis_client().pipeline() as pipe:
+            pipe.lpush(REQUEST_PROFILES_KEY, orjson.dumps(summary))
+            pipe.ltrim(REQUEST_PROFILES_KEY, 0, settings.REQUEST_PROFILING_BUFFER_SIZE - 1)
+            pipe.execute()
+    except redis.exceptions.RedisError:
+        logging.warning("Could not save request profile", exc_info=True)
+
+
+def get_request_profiles_redis_client() -> "redis.StrictRedis[bytes]":
+    global redis_client
+    if redis_client is None:
+        redis_client = get_redis_client()
+    return redis_client
+
+
+def get_request_profiles() -> list[dict[str, Any]]:
+    return [
+        orjson.loads(profile)
+        for profile in get_request_profiles_redis_client().lrange(REQUEST_PROFILES_KEY, 0, -1)
+    ]
+
+
+def clear_request_profiles() -> None:
+    get_request_profiles_redis_client().delete(REQUEST_PROFILES_KEY)
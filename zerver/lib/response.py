@@ -1,8 +1,9 @@
-from collections.abc import Iterator, Mapping
+from collections.abc import Iterable, Iterator, Mapping
+from itertools import islice
 from typing import Any
 
 import orjson
-from django.http import HttpRequest, HttpResponse, HttpResponseNotAllowed
+from django.http import HttpRequest, HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
 from typing_extensions import override
 
 from zerver.lib.exceptions import JsonableError, UnauthorizedError
@@ -78,6 +79,67 @@ class MutableJsonResponse(HttpResponse):
         return iter([self.content])
 
 
+class StreamingJsonResponse(StreamingHttpResponse):
+    """A JSON response for very large lists, e.g. all the users of an
+    organization with 100,000s of users.  The lists in `streams` are
+    serialized a chunk of items at a time as the response is sent,
+    after the rest of the data, so the serialized response is never
+    held in memory as a whole; they may also be lazy iterables, e.g.
+    over a database cursor, so that the items aren't either.
+
+    As with MutableJsonResponse, the rest of the data can be modified
+    through get_data until the response is sent."""
+
+    CHUNK_SIZE = 1000
+
+    def __init__(
+        self,
+        data: dict[str, Any],
+        streams: Mapping[str, Iterable[Any]],
+        *,
+        content_type: str,
+        status: int,
+    ) -> None:
+        assert not set(data) & set(streams)
+        self._data = data
+        self._streams = streams
+        self._content: bytes | None = None
+        super().__init__(self._serialize(), content_type=content_type, status=status)
+
+    def get_data(self) -> dict[str, Any]:
+        return self._data
+
+    def _serialize(self) -> Iterator[bytes]:
+        # See MutableJsonResponse for OPT_PASSTHROUGH_DATETIME.
+        option = orjson.OPT_PASSTHROUGH_DATETIME
+        # We splice the streams in before the closing brace.
+        content = orjson.dumps(self._data, option=option)
+        yield content[:-1]
+        separator = b"," if self._data else b""
+        for key, items in self._streams.items():
+            yield separator + orjson.dumps(key) + b":["
+            separator = b","
+            iterator = iter(items)
+            item_separator = b""
+            while chunk := list(islice(iterator, self.CHUNK_SIZE)):
+                # Strip the brackets of the serialized chunk.
+                yield item_separator + orjson.dumps(chunk, option=option)[1:-1]
+                item_separator = b","
+            yield b"]"
+        yield b"}\n"
+
+    # StreamingHttpResponse deliberately has no content, but our tests
+    # read it.
+    @override  # type: ignore[explicit-override] # https://github.com/python/mypy/issues/15900
+    @property
+    def content(self) -> Any:
+        """The whole serialized response.  This consumes the stream, so
+        it should only be used in tests."""
+        if self._content is None:
+            self._content = b"".join(self.streaming_content)
+        return self._content
+
+
 def json_unauthorized(
     message: str | None = None, www_authenticate: str | None = None
 ) -> HttpResponse:
@@ -116,6 +178,21 @@ def json_success(request: HttpRequest, data: Mapping[str, Any] = {}) -> MutableJ
     return json_response(data=data)
 
 
+def json_success_streaming(
+    request: HttpRequest,
+    data: Mapping[str, Any] = {},
+    *,
+    streams: Mapping[str, Iterable[Any]],
+) -> StreamingJsonResponse:
+    """Like json_success, with the lists in `streams` serialized
+    incrementally; see StreamingJsonResponse."""
+    content = {"result": "success", "msg": ""}
+    content.update(data)
+    return StreamingJsonResponse(
+        data=content, streams=streams, content_type="application/json", status=200
+    )
+
+
 def json_response_from_error(exception: JsonableError) -> MutableJsonResponse:
     """
     This should only be needed in middleware; in app code, just raise.
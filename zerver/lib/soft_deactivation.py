@@ -12,7 +12,7 @@ from django.db.models.functions import Greatest
 from django.utils.timezone import now as timezone_now
 
 from zerver.lib.logging_util import log_to_file
-from zerver.lib.queue import queue_event_on_commit
+from zerver.lib.queue import queue_event_on_commit, sharded_queue_name
 from zerver.lib.user_message import bulk_insert_all_ums
 from zerver.lib.utils import assert_is_not_none
 from zerver.models import (
@@ -416,7 +416,7 @@ def queue_soft_reactivation(user_profile_id: int) -> None:
     if settings.DEDICATED_SOFT_REACTIVATION_QUEUE:
         queue_event_on_commit("soft_reactivation", event)
     else:
-        queue_event_on_commit("deferred_work", event)
+        queue_event_on_commit(sharded_queue_name("deferred_work", user_profile_id), event)
 
 
 def soft_reactivate_if_personal_notification(
@@ -0,0 +1,245 @@
+import logging
+import secrets
+from collections.abc import Collection, Iterable, Mapping
+from dataclasses import dataclass
+
+import redis
+from django.db import transaction
+
+from zerver.lib import redis_utils
+from zerver.lib.redis_utils import get_redis_client
+
+# Clients which register a new event queue, e.g. because their old one
+# was garbage-collected, can pass the `state_versions` returned by
+# their previous /register request, so that the server can skip
+# sending the sections of the initial state which they already have.
+#
+# Each realm has a Redis hash with a version counter for each section
+# in STATE_SECTION_EVENT_TYPES, which sending an event of one of the
+# section's event types increments.  For most sections, a client can
+# only resume from the current version, and otherwise gets the whole
+# section again.  For realm_user, we additionally log the IDs of the
+# changed users, with the version of their latest change, so that
+# clients with an older version get just those users.  That log is
+# bounded; the hash's "realm_user:floor" is the oldest version from
+# which it is complete.
+#
+# Versions are strings of the form "<epoch>:<counter>"; the random
+# epoch changes if the hash is lost (e.g. it expires, or the realm's
+# versions are reset), so that clients never resume from a counter
+# which was reused.
+#
+# Like the unread summaries, the versions are an optimization: if
+# Redis is unavailable, we log the error, and clients get the full
+# state.  Failing to record a change must not let clients resume
+# from a version which predates it, so we then reset the realm's
+# versions instead; if that fails too, this process keeps retrying
+# the reset, and does not let clients resume, until it succeeds.
+STATE_SECTION_EVENT_TYPES: dict[str, set[str]] = {
+    "custom_profile_fields": {"custom_profile_fields"},
+    # default_stream_groups lists channels in order of their names.
+    "default_stream_groups": {"default_stream_groups", "stream"},
+    "realm_domains": {"realm_domains"},
+    "realm_playgrounds": {"realm_playgrounds"},
+    # Changing custom profile fields can change every user's
+    # profile_data, so it resets the log of changed users.
+    "realm_user": {"custom_profile_fields", "realm_user"},
+    "realm_user_groups": {"user_group"},
+}
+STATE_VERSION_EVENT_TYPES = set().union(*STATE_SECTION_EVENT_TYPES.values())
+
+STATE_VERSIONS_TIMEOUT_SECONDS = 14 * 24 * 3600
+STATE_CHANGES_MAX_USERS = 5000
+
+RECORD_CHANGES_SCRIPT = """
+redis.call("HSETNX", KEYS[1], "epoch", ARGV[1])
+local section_count = tonumber(ARGV[4])
+for i = 5, 4 + section_count do
+    local section = ARGV[i]
+    local version = redis.call("HINCRBY", KEYS[1], section, 1)
+    if section == "realm_user" and #ARGV > 4 + section_count then
+        for j = 5 + section_count, #ARGV do
+            redis.call("ZADD", KEYS[2], version, ARGV[j])
+        end
+        local excess = redis.call("ZCARD", KEYS[2]) - tonumber(ARGV[3])
+        if excess > 0 then
+            -- Returns member, score pairs, in increasing order of score.
+            local removed = redis.call("ZPOPMIN", KEYS[2], excess)
+            redis.call("HSET", KEYS[1], "realm_user:floor", removed[#removed])
+        end
+    elseif section == "realm_user" then
+        redis.call("HSET", KEYS[1], "realm_user:floor", version)
+        redis.call("DEL", KEYS[2])
+    end
+end
+redis.call("EXPIRE", KEYS[1], ARGV[2])
+redis.call("EXPIRE", KEYS[2], ARGV[2])
+"""
+
+GET_VERSIONS_SCRIPT = """
+if redis.call("HSETNX", KEYS[1], "epoch", ARGV[1]) == 1 then
+    redis.call("EXPIRE", KEYS[1], ARGV[2])
+end
+local changed_user_ids = {}
+if ARGV[3] ~= "" then
+    changed_user_ids = redis.call("ZRANGEBYSCORE", KEYS[2], "(" .. ARGV[3], "+inf")
+end
+return {redis.call("HGETALL", KEYS[1]), changed_user_ids}
+"""
+
+redis_client: "redis.StrictRedis[bytes] | None" = None
+# Realms whose versions we failed to reset.
+realms_needing_reset: set[int] = set()
+
+
+@dataclass
+class StateVersions:
+    # The current version of each section, to return to the client.
+    versions: dict[str, str]
+    # The sections the client already has, up to changed_user_ids.
+    resumed: set[str]
+    # If realm_user is resumed, the users which changed since the
+    # client's version.
+    changed_user_ids: list[int]
+
+
+def get_state_versions_redis_client() -> "redis.StrictRedis[bytes]":
+    global redis_client
+    if redis_client is None:
+        redis_client = get_redis_client()
+    return redis_client
+
+
+def state_versions_key(realm_id: int) -> str:
+    return f"{redis_utils.REDIS_KEY_PREFIX}state_versions:{realm_id}"
+
+
+def state_changes_key(realm_id: int) -> str:
+    return f"{redis_utils.REDIS_KEY_PREFIX}state_changes:{realm_id}:realm_user"
+
+
+def record_state_changes(
+    realm_id: int, sections: Collection[str], user_ids: Iterable[int] = ()
+) -> None:
+    """Increments the versions of the sections.  For realm_user,
+    user_ids are the users whose data changed; if it is empty, the
+    client needs all users again."""
+    if realm_id in realms_needing_reset and not reset_state_versions(realm_id):
+        return
+    try:
+        get_state_versions_redis_client().eval(
+            RECORD_CHANGES_SCRIPT,
+            2,
+            state_versions_key(realm_id),
+            state_changes_key(realm_id),
+            secrets.token_hex(8),
+            STATE_VERSIONS_TIMEOUT_SECONDS,
+            STATE_CHANGES_MAX_USERS,
+            len(sections),
+            *sections,
+            *user_ids,
+        )
+    except redis.exceptions.RedisError:
+        logging.warning("Could not record state changes", exc_info=True)
+        reset_state_versions(realm_id)
+
+
+def record_state_changes_for_event(realm_id: int, event: Mapping[str, object]) -> None:
+    sections = [
+        section
+        for section, event_types in STATE_SECTION_EVENT_TYPES.items()
+        if event["type"] in event_types
+    ]
+    if not sections:
+        return
+    user_ids: list[int] = []
+    if event["type"] == "realm_user":
+        person = event["person"]
+        assert isinstance(person, dict)
+        user_ids = [person["user_id"]]
+    record_state_changes(realm_id, sections, user_ids)
+
+
+def record_user_state_changes(realm_id: int, user_ids: list[int]) -> None:
+    """For changes to users' data which do not send a realm_user event,
+    such as soft deactivation."""
+    transaction.on_commit(lambda: record_state_changes(realm_id, ["realm_user"], user_ids))
+
+
+def reset_state_versions(realm_id: int) -> bool:
+    """Discards the realm's versions, so that every client gets the full
+    state on its next /register.  Returns whether that succeeded."""
+    try:
+        get_state_versions_redis_client().delete(
+            state_versions_key(realm_id), state_changes_key(realm_id)
+        )
+    except redis.exceptions.RedisError:
+        logging.warning("Could not reset state versions", exc_info=True)
+        realms_needing_reset.add(realm_id)
+        return False
+    realms_needing_reset.discard(realm_id)
+    return True
+
+
+def get_state_versions(
+    realm_id: int,
+    sections: Collection[str],
+    client_versions: Mapping[str, str],
+    realm_user_variant: str | None,
+) -> StateVersions:
+    """Compares the versions the client passed with the current ones.
+
+    realm_user_variant identifies everything besides the users' data
+    which affects the realm_user section for this client, such as its
+    role; clients can only resume realm_user if it is unchanged.  It
+    must not contain ":".  If it is None, realm_user is never
+    resumed.  If Redis is unavailable, nothing is resumed, and there
+    are no versions to return."""
+    if realm_user_variant is None:
+        sections = [section for section in sections if section != "realm_user"]
+
+    client_epoch = client_realm_user_counter = ""
+    client_realm_user_version = client_versions.get("realm_user", "").split(":")
+    if "realm_user" in sections and len(client_realm_user_version) == 3:
+        version_epoch, version_counter, version_variant = client_realm_user_version
+        if version_counter.isdigit() and version_variant == realm_user_variant:
+            client_epoch, client_realm_user_counter = version_epoch, version_counter
+
+    result = StateVersions(versions={}, resumed=set(), changed_user_ids=[])
+    if realm_id in realms_needing_reset and not reset_state_versions(realm_id):
+        return result
+    try:
+        fields, changed_user_ids = get_state_versions_redis_client().eval(
+            GET_VERSIONS_SCRIPT,
+            2,
+            state_versions_key(realm_id),
+            state_changes_key(realm_id),
+            secrets.token_hex(8),
+            STATE_VERSIONS_TIMEOUT_SECONDS,
+            client_realm_user_counter,
+        )
+    except redis.exceptions.RedisError:
+        logging.warning("Could not fetch state versions", exc_info=True)
+        return result
+
+    hash_values = {fields[i].decode(): fields[i + 1].decode() for i in range(0, len(fields), 2)}
+    epoch = hash_values.pop("epoch")
+    counters = {field: int(value) for field, value in hash_values.items()}
+
+    for section in sections:
+        counter = counters.get(section, 0)
+        version = f"{epoch}:{counter}"
+        if section == "realm_user":
+            result.versions[section] = f"{version}:{realm_user_variant}"
+            if (
+                client_realm_user_counter != ""
+                and client_epoch == epoch
+                and counters.get("realm_user:floor", 0) <= int(client_realm_user_counter) <= counter
+            ):
+                result.resumed.add(section)
+                result.changed_user_ids = [int(user_id) for user_id in changed_user_ids]
+        else:
+            result.versions[section] = version
+            if client_versions.get(section) == version:
+                result.resumed.add(section)
+    return result
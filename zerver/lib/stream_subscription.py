@@ -1,15 +1,24 @@
 import itertools
+from array import array
 from collections import defaultdict
 from collections.abc import Set as AbstractSet
 from dataclasses import dataclass
 from operator import itemgetter
-from typing import Any, Literal
+from typing import Any, Literal, TypedDict, cast
 
 from django.db import connection, transaction
-from django.db.models import F, Q, QuerySet
+from django.db.models import F, QuerySet
 from psycopg2 import sql
 from psycopg2.extras import execute_values
 
+from zerver.lib.cache import (
+    cache_get,
+    cache_get_many,
+    cache_set,
+    cache_set_many,
+    flush_stream_recipient_info,
+    stream_recipient_info_cache_key,
+)
 from zerver.models import AlertWord, Recipient, Stream, Subscription, UserProfile, UserTopic
 
 
@@ -255,15 +264,152 @@ def subscriber_ids_with_stream_history_access(stream: Stream) -> set[int]:
     )
 
 
-def get_subscriptions_for_send_message(
+class SendMessageSubscriptionRow(TypedDict):
+    user_profile_id: int
+    is_muted: bool
+    push_notifications: bool | None
+    email_notifications: bool | None
+    wildcard_mentions_notify: bool | None
+    user_profile_push_notifications: bool
+    user_profile_email_notifications: bool
+    user_profile_wildcard_mentions_notify: bool
+    followed_topic_push_notifications: bool
+    followed_topic_email_notifications: bool
+    followed_topic_wildcard_mentions_notify: bool
+    long_term_idle: bool
+
+
+# How get_stream_subscribers_for_send_message packs each subscriber's
+# row into an integer: a bit for each boolean field, and two (is not
+# None, value) for each nullable one.
+SEND_MESSAGE_SUBSCRIPTION_BOOLEAN_FIELDS = (
+    "is_muted",
+    "user_profile_push_notifications",
+    "user_profile_email_notifications",
+    "user_profile_wildcard_mentions_notify",
+    "followed_topic_push_notifications",
+    "followed_topic_email_notifications",
+    "followed_topic_wildcard_mentions_notify",
+    "long_term_idle",
+)
+SEND_MESSAGE_SUBSCRIPTION_NULLABLE_FIELDS = (
+    "push_notifications",
+    "email_notifications",
+    "wildcard_mentions_notify",
+)
+
+
+assert (
+    len(SEND_MESSAGE_SUBSCRIPTION_BOOLEAN_FIELDS)
+    + 2 * len(SEND_MESSAGE_SUBSCRIPTION_NULLABLE_FIELDS)
+    <= 8 * array("H").itemsize
+)
+
+# At 6 bytes per subscriber, the cached data for a channel with more
+# subscribers than this would approach memcached's default 1MB limit
+# on the size of an item, so it is split into chunks of this many
+# subscribers, each cached under its own key.
+SEND_MESSAGE_SUBSCRIBERS_CACHE_CHUNK_SIZE = 100000
+
+
+def get_stream_subscribers_for_send_message(
+    realm_id: int, recipient_id: int
+) -> tuple["array[int]", "array[int]"]:
+    """The user IDs and packed settings of every active subscriber to
+    the channel, in the compact form we cache."""
+    key = stream_recipient_info_cache_key(realm_id, recipient_id)
+    cached = cache_get(key)
+    if cached is not None:
+        chunk_count, first_user_ids, first_packed_rows = cached[0]
+        if chunk_count == 1:
+            return first_user_ids, first_packed_rows
+        chunk_keys = [f"{key}:{i}" for i in range(1, chunk_count)]
+        cached_chunks = cache_get_many(chunk_keys)
+        if len(cached_chunks) == len(chunk_keys):
+            user_ids = array("I", first_user_ids)
+            packed_rows = array("H", first_packed_rows)
+            for chunk_key in chunk_keys:
+                chunk_user_ids, chunk_packed_rows = cached_chunks[chunk_key]
+                user_ids.extend(chunk_user_ids)
+                packed_rows.extend(chunk_packed_rows)
+            return user_ids, packed_rows
+
+    user_ids, packed_rows = fetch_stream_subscribers_for_send_message(recipient_id)
+    chunk_size = SEND_MESSAGE_SUBSCRIBERS_CACHE_CHUNK_SIZE
+    chunks = {
+        f"{key}:{i // chunk_size}": (user_ids[i : i + chunk_size], packed_rows[i : i + chunk_size])
+        for i in range(chunk_size, len(user_ids), chunk_size)
+    }
+    # The other chunks are stored first, so that a reader which finds
+    # the first chunk will usually find them too.
+    if chunks:
+        cache_set_many(chunks, timeout=3600 * 24)
+    cache_set(
+        key,
+        (len(chunks) + 1, user_ids[:chunk_size], packed_rows[:chunk_size]),
+        timeout=3600 * 24,
+    )
+    return user_ids, packed_rows
+
+
+def fetch_stream_subscribers_for_send_message(
+    recipient_id: int,
+) -> tuple["array[int]", "array[int]"]:
+    rows = (
+        Subscription.objects.filter(recipient_id=recipient_id, active=True, is_user_active=True)
+        .annotate(
+            user_profile_email_notifications=F("user_profile__enable_stream_email_notifications"),
+            user_profile_push_notifications=F("user_profile__enable_stream_push_notifications"),
+            user_profile_wildcard_mentions_notify=F("user_profile__wildcard_mentions_notify"),
+            followed_topic_email_notifications=F(
+                "user_profile__enable_followed_topic_email_notifications"
+            ),
+            followed_topic_push_notifications=F(
+                "user_profile__enable_followed_topic_push_notifications"
+            ),
+            followed_topic_wildcard_mentions_notify=F(
+                "user_profile__enable_followed_topic_wildcard_mentions_notify"
+            ),
+            long_term_idle=F("user_profile__long_term_idle"),
+        )
+        .values(
+            "user_profile_id",
+            *SEND_MESSAGE_SUBSCRIPTION_BOOLEAN_FIELDS,
+            *SEND_MESSAGE_SUBSCRIPTION_NULLABLE_FIELDS,
+        )
+        .order_by("user_profile_id")
+    )
+
+    user_ids = array("I")
+    packed_rows = array("H")
+    for row in rows:
+        packed = 0
+        bit = 1
+        for field in SEND_MESSAGE_SUBSCRIPTION_BOOLEAN_FIELDS:
+            if row[field]:
+                packed |= bit
+            bit <<= 1
+        for field in SEND_MESSAGE_SUBSCRIPTION_NULLABLE_FIELDS:
+            if row[field] is not None:
+                packed |= bit
+                if row[field]:
+                    packed |= bit << 1
+            bit <<= 2
+        user_ids.append(row["user_profile_id"])
+        packed_rows.append(packed)
+    return user_ids, packed_rows
+
+
+def get_subscription_rows_for_send_message(
     *,
     realm_id: int,
+    recipient_id: int,
     stream_id: int,
     topic_name: str,
     possible_stream_wildcard_mention: bool,
     topic_participant_user_ids: AbstractSet[int],
     possibly_mentioned_user_ids: AbstractSet[int],
-) -> QuerySet[Subscription]:
+) -> list[SendMessageSubscriptionRow]:
     """This function optimizes an important use case for large
     streams. Open realms often have many long_term_idle users, which
     can result in 10,000s of long_term_idle recipients in default
@@ -274,7 +420,7 @@ def get_subscriptions_for_send_message(
     However, it's expensive even to fetch and process them all in
     Python at all. This function returns all recipients of a stream
     message that could possibly require action in the send-message
-    codepath.
+    codepath, with the settings get_recipient_info needs.
 
     Basically, it returns all subscribers, excluding all long-term
     idle users who it can prove will not receive a UserMessage row or
@@ -290,38 +436,61 @@ def get_subscriptions_for_send_message(
 
     Downstream logic, which runs after the Markdown processor has
     parsed the message, will do the precise determination.
-    """
 
-    query = get_active_subscriptions_for_stream_id(
-        stream_id,
-        include_deactivated_users=False,
-    )
+    Sending a message to a busy channel repeatedly needs the same
+    subscriber data, so we cache it for the whole channel, and apply
+    the topic- and message-specific filtering here.
+    """
+    user_ids, packed_rows = get_stream_subscribers_for_send_message(realm_id, recipient_id)
+
+    rows: list[SendMessageSubscriptionRow] = []
+    for user_id, packed in zip(user_ids, packed_rows, strict=True):
+        row: dict[str, Any] = {"user_profile_id": user_id}
+        bit = 1
+        for field in SEND_MESSAGE_SUBSCRIPTION_BOOLEAN_FIELDS:
+            row[field] = bool(packed & bit)
+            bit <<= 1
+        for field in SEND_MESSAGE_SUBSCRIPTION_NULLABLE_FIELDS:
+            row[field] = bool(packed & (bit << 1)) if packed & bit else None
+            bit <<= 2
+        rows.append(cast(SendMessageSubscriptionRow, row))
 
     if possible_stream_wildcard_mention:
-        return query
-
-    query = query.filter(
-        Q(user_profile__long_term_idle=False)
-        | Q(push_notifications=True)
-        | (Q(push_notifications=None) & Q(user_profile__enable_stream_push_notifications=True))
-        | Q(email_notifications=True)
-        | (Q(email_notifications=None) & Q(user_profile__enable_stream_email_notifications=True))
-        | Q(user_profile_id__in=possibly_mentioned_user_ids)
-        | Q(user_profile_id__in=topic_participant_user_ids)
-        | Q(
-            user_profile_id__in=AlertWord.objects.filter(realm_id=realm_id).values_list(
-                "user_profile_id"
-            )
-        )
-        | Q(
-            user_profile_id__in=UserTopic.objects.filter(
+        return rows
+
+    def maybe_needed(row: SendMessageSubscriptionRow) -> bool:
+        if not row["long_term_idle"]:
+            return True
+        if row["push_notifications"] or (
+            row["push_notifications"] is None and row["user_profile_push_notifications"]
+        ):
+            return True
+        if row["email_notifications"] or (
+            row["email_notifications"] is None and row["user_profile_email_notifications"]
+        ):
+            return True
+        user_id = row["user_profile_id"]
+        return user_id in possibly_mentioned_user_ids or user_id in topic_participant_user_ids
+
+    rows_needed = [row for row in rows if maybe_needed(row)]
+    if len(rows_needed) == len(rows):
+        return rows
+
+    # Only fetched if some long-term idle subscribers remain.
+    idle_user_ids_needed = set(
+        AlertWord.objects.filter(realm_id=realm_id)
+        .values_list("user_profile_id", flat=True)
+        .union(
+            UserTopic.objects.filter(
                 stream_id=stream_id,
                 topic_name__iexact=topic_name,
                 visibility_policy=UserTopic.VisibilityPolicy.FOLLOWED,
-            ).values_list("user_profile_id")
+            ).values_list("user_profile_id", flat=True)
         )
     )
-    return query
+    return [
+        row for row in rows if maybe_needed(row) or row["user_profile_id"] in idle_user_ids_needed
+    ]
 
 
 def update_all_subscriber_counts_for_user(
@@ -412,3 +581,4 @@ def bulk_create_stream_subscriptions(  # nocoverage
     """
     Subscription.objects.bulk_create(subs)
     bulk_update_subscriber_counts(direction=1, streams=streams)
+    flush_stream_recipient_info(recipient_ids={sub.recipient_id for sub in subs})
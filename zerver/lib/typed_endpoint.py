@@ -29,7 +29,7 @@ from zerver.lib.request import (
     RequestVariableMissingError,
     arguments_map,
 )
-from zerver.lib.response import MutableJsonResponse
+from zerver.lib.response import MutableJsonResponse, StreamingJsonResponse
 
 T = TypeVar("T")
 ParamT = ParamSpec("ParamT")
@@ -548,7 +548,7 @@ def typed_endpoint(
         return_value = view_func(request, *args, **kwargs)
 
         if (
-            isinstance(return_value, MutableJsonResponse)
+            isinstance(return_value, MutableJsonResponse | StreamingJsonResponse)
             # TODO: Move is_webhook_view to the decorator
             and not request_notes.is_webhook_view
             # Implemented only for 200 responses.
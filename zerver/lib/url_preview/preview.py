@@ -1,7 +1,5 @@
 import re
-from collections.abc import Callable
 from re import Match
-from typing import Any
 from urllib.parse import urljoin
 
 import magic
@@ -10,7 +8,7 @@ from django.conf import settings
 from django.utils.encoding import smart_str
 
 from version import ZULIP_VERSION
-from zerver.lib.cache import cache_with_key, preview_url_cache_key
+from zerver.lib.cache import cache_get_many, cache_set_many, preview_url_cache_key
 from zerver.lib.outgoing_http import OutgoingSession
 from zerver.lib.pysa import mark_sanitized
 from zerver.lib.url_preview.oembed import get_oembed_data
@@ -36,6 +34,13 @@ ZULIP_URL_PREVIEW_USER_AGENT = (
 HEADERS = {"User-Agent": ZULIP_URL_PREVIEW_USER_AGENT}
 TIMEOUT = 15
 
+# Previews are cached, and shared by every message which links to the
+# URL.  A failure to fetch a preview may be transient, so is cached for
+# less time -- but long enough that a slow or unreachable site is not
+# requested again for every message which links to it.
+PREVIEW_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+PREVIEW_FETCH_ERROR_CACHE_TIMEOUT = 10 * 60
+
 
 class PreviewSession(OutgoingSession):
     def __init__(self) -> None:
@@ -72,19 +77,41 @@ def valid_content_type(url: str) -> bool:
     return content_type.startswith("text/html")
 
 
-def catch_network_errors(func: Callable[..., Any]) -> Callable[..., Any]:
-    def wrapper(*args: Any, **kwargs: Any) -> Any:
-        try:
-            return func(*args, **kwargs)
-        except requests.exceptions.RequestException:
-            pass
+def get_cached_link_embed_data(urls: list[str]) -> dict[str, UrlEmbedData | None]:
+    """Returns the cached preview data of those of the URLs which have
+    any; a URL which is known to have no preview maps to None."""
+    keys = {preview_url_cache_key(url): url for url in urls}
+    return {keys[key]: value[0] for key, value in cache_get_many(list(keys)).items()}
+
 
-    return wrapper
+def cache_link_embed_data(url_embed_data: dict[str, UrlEmbedData | None], timeout: int) -> None:
+    cache_set_many(
+        {preview_url_cache_key(url): (data,) for url, data in url_embed_data.items()},
+        timeout=timeout,
+    )
 
 
-@catch_network_errors
-@cache_with_key(preview_url_cache_key)
 def get_link_embed_data(url: str, maxwidth: int = 640, maxheight: int = 480) -> UrlEmbedData | None:
+    cached_data = get_cached_link_embed_data([url])
+    if url in cached_data:
+        return cached_data[url]
+
+    try:
+        data = fetch_link_embed_data(url, maxwidth=maxwidth, maxheight=maxheight)
+    except requests.exceptions.RequestException:
+        cache_link_embed_data({url: None}, timeout=PREVIEW_FETCH_ERROR_CACHE_TIMEOUT)
+        return None
+    cache_link_embed_data({url: data}, timeout=PREVIEW_CACHE_TIMEOUT)
+    return data
+
+
+def fetch_link_embed_data(
+    url: str, maxwidth: int = 640, maxheight: int = 480
+) -> UrlEmbedData | None:
+    """Fetches the preview data for the URL, without consulting the
+    cache; this raises requests' exceptions on network errors.  It
+    accesses neither the database nor the cache, so can be called from
+    other threads."""
     if not is_link(url):
         return None
 
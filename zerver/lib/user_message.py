@@ -1,4 +1,6 @@
-from django.db import connection
+from io import StringIO
+
+from django.db import connection, transaction
 from psycopg2.extras import execute_values
 from psycopg2.sql import SQL, Composable, Literal
 
@@ -23,6 +25,11 @@ class UserMessageLite:
 
 DEFAULT_HISTORICAL_FLAGS = UserMessage.flags.historical | UserMessage.flags.read
 
+# Above this many rows, bulk_insert_ums streams the rows to PostgreSQL
+# with COPY, rather than sending them as (many pages of) INSERT
+# statements.
+BULK_INSERT_UMS_COPY_THRESHOLD = 2000
+
 
 def create_historical_user_messages(
     *,
@@ -59,6 +66,10 @@ def bulk_insert_ums(ums: list[UserMessageLite]) -> None:
     if not ums:
         return
 
+    if len(ums) >= BULK_INSERT_UMS_COPY_THRESHOLD:
+        bulk_copy_ums(ums)
+        return
+
     vals = [(um.user_profile_id, um.message_id, um.flags) for um in ums]
     query = SQL(
         """
@@ -73,6 +84,47 @@ def bulk_insert_ums(ums: list[UserMessageLite]) -> None:
         execute_values(cursor.cursor, query, vals)
 
 
+def bulk_copy_ums(ums: list[UserMessageLite]) -> None:
+    """
+    For messages with many recipients (e.g. to large channels), the
+    INSERT statements sent by bulk_insert_ums dominate the time to
+    send the message.  COPY is several times faster, but cannot skip
+    conflicting rows, so we COPY into a temporary table, and insert
+    from there.
+    """
+    buffer = StringIO()
+    buffer.writelines(f"{um.user_profile_id}\t{um.message_id}\t{um.flags}\n" for um in ums)
+    buffer.seek(0)
+
+    # Creating and dropping the temporary table on every call would
+    # churn the system catalogs, so each database session keeps one.
+    # Its rows are deleted as they are inserted, so that later calls
+    # in the same transaction do not see them, and at the end of the
+    # transaction otherwise (e.g. if it is rolled back).
+    with transaction.atomic(savepoint=False), connection.cursor() as cursor:
+        cursor.execute(
+            """
+            CREATE TEMPORARY TABLE IF NOT EXISTS zerver_usermessage_copy
+            ON COMMIT DELETE ROWS AS
+            SELECT user_profile_id, message_id, flags FROM zerver_usermessage WITH NO DATA
+            """
+        )
+        cursor.cursor.copy_expert(
+            "COPY zerver_usermessage_copy (user_profile_id, message_id, flags) FROM STDIN", buffer
+        )
+        cursor.execute(
+            """
+            WITH copied AS (
+                DELETE FROM zerver_usermessage_copy
+                RETURNING user_profile_id, message_id, flags
+            )
+            INSERT INTO zerver_usermessage (user_profile_id, message_id, flags)
+            SELECT user_profile_id, message_id, flags FROM copied
+            ON CONFLICT DO NOTHING
+            """
+        )
+
+
 def bulk_insert_all_ums(
     user_ids: list[int], message_ids: list[int], flags: int, conflict: Composable | None = None
 ) -> None:
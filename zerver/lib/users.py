@@ -2,7 +2,7 @@ import itertools
 import re
 import unicodedata
 from collections import defaultdict
-from collections.abc import Iterable, Mapping, Sequence
+from collections.abc import Iterable, Iterator, Mapping, Sequence
 from email.headerregistry import Address
 from operator import itemgetter
 from typing import Any, TypedDict
@@ -17,7 +17,7 @@ from typing_extensions import NotRequired
 from zulip_bots.custom_exceptions import ConfigValidationError
 
 from zerver.lib.avatar import avatar_url, get_avatar_field, get_avatar_for_inaccessible_user
-from zerver.lib.cache import cache_with_key, get_cross_realm_dicts_key
+from zerver.lib.cache import cache_with_key, get_cross_realm_dicts_key, realm_user_dict_fields
 from zerver.lib.create_user import get_dummy_email_address_for_display_regex
 from zerver.lib.exceptions import JsonableError, OrganizationOwnerRequiredError
 from zerver.lib.string_validation import check_string_is_printable
@@ -1002,7 +1002,9 @@ def get_accessible_user_ids(
 
 def get_user_dicts_in_realm(
     realm: Realm, user_profile: UserProfile | None, user_ids: list[int] | None = None
-) -> tuple[list[RawUserDict], list[APIUserDict]]:
+) -> tuple[list[RawUserDict], list[int]]:
+    """Returns the rows of the users which user_profile can access,
+    and the IDs of the others."""
     if user_ids is not None:
         all_user_dicts = get_realm_user_dicts_from_ids(realm.id, user_ids)
     elif settings.PARTIAL_USERS:
@@ -1016,14 +1018,14 @@ def get_user_dicts_in_realm(
     accessible_user_ids = get_accessible_user_ids(user_profile, include_deactivated_users=True)
 
     accessible_user_dicts: list[RawUserDict] = []
-    inaccessible_user_dicts: list[APIUserDict] = []
+    inaccessible_user_ids: list[int] = []
     for user_dict in all_user_dicts:
         if user_dict["id"] in accessible_user_ids or user_dict["is_bot"]:
             accessible_user_dicts.append(user_dict)
         else:
-            inaccessible_user_dicts.append(get_data_for_inaccessible_user(realm, user_dict["id"]))
+            inaccessible_user_ids.append(user_dict["id"])
 
-    return (accessible_user_dicts, inaccessible_user_dicts)
+    return (accessible_user_dicts, inaccessible_user_ids)
 
 
 def get_custom_profile_field_values(
@@ -1064,12 +1066,12 @@ def get_users_for_api(
     # target_user is an optional parameter which is passed when user data of a specific user
     # is required. It is 'None' otherwise.
     accessible_user_dicts: list[RawUserDict] = []
-    inaccessible_user_dicts: list[APIUserDict] = []
+    inaccessible_user_ids: list[int] = []
     if target_user is not None:
         assert user_ids is None
         accessible_user_dicts = [user_profile_to_user_row(target_user)]
     else:
-        accessible_user_dicts, inaccessible_user_dicts = get_user_dicts_in_realm(
+        accessible_user_dicts, inaccessible_user_ids = get_user_dicts_in_realm(
             realm, acting_user, user_ids
         )
 
@@ -1079,6 +1081,10 @@ def get_users_for_api(
         # TODO: Consider optimizing this query away with caching.
         if target_user is not None:
             custom_profile_field_values = base_query.filter(user_profile=target_user)
+        elif user_ids is not None:
+            custom_profile_field_values = base_query.filter(
+                field__realm_id=realm.id, user_profile_id__in=user_ids
+            )
         else:
             custom_profile_field_values = base_query.filter(field__realm_id=realm.id)
         profiles_by_user_id = get_custom_profile_field_values(custom_profile_field_values)
@@ -1101,12 +1107,97 @@ def get_users_for_api(
         )
 
     if not user_list_incomplete:
-        for inaccessible_user_row in inaccessible_user_dicts:
-            # We already have the required data for inaccessible users
-            # in row object, so we can just add it to result directly.
-            user_id = inaccessible_user_row["user_id"]
-            result[user_id] = inaccessible_user_row
+        for user_id in inaccessible_user_ids:
+            result[user_id] = get_data_for_inaccessible_user(realm, user_id)
+
+    return result
+
 
+# Responses listing all the users of organizations with at least this
+# many users are streamed; see StreamingJsonResponse.
+STREAMING_USERS_MIN_COUNT = 10000
+
+
+def iter_users_for_api(
+    realm: Realm,
+    acting_user: UserProfile | None,
+    *,
+    client_gravatar: bool,
+    user_avatar_url_field_optional: bool,
+    include_custom_profile_fields: bool = True,
+    chunk_size: int = 1000,
+) -> Iterator[APIUserDict]:
+    """Like get_users_for_api for all of the realm's users which
+    acting_user can access, in order of ID.  The users are fetched
+    chunk_size at a time, so that callers which stream them to the
+    client don't need to hold them all in memory, as is important in
+    organizations with 100,000s of users."""
+    accessible_user_ids = None
+    if not check_user_can_access_all_users(acting_user):
+        assert acting_user is not None
+        accessible_user_ids = get_accessible_user_ids(acting_user, include_deactivated_users=True)
+
+    # The same users as get_user_dicts_in_realm, without the cache,
+    # which holds all of them.
+    query = UserProfile.objects.filter(realm_id=realm.id)
+    if settings.PARTIAL_USERS:
+        user_selection_clause = Q(is_bot=True)
+        if acting_user is not None:
+            user_selection_clause |= Q(id=acting_user.id)
+        query = query.filter(user_selection_clause)
+    rows = query.order_by("id").values(*realm_user_dict_fields).iterator(chunk_size=chunk_size)
+
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        if accessible_user_ids is not None:
+            chunk = [row for row in chunk if row["id"] in accessible_user_ids or row["is_bot"]]
+
+        profiles_by_user_id = None
+        if include_custom_profile_fields and acting_user is not None:
+            profiles_by_user_id = get_custom_profile_field_values(
+                CustomProfileFieldValue.objects.select_related("field").filter(
+                    user_profile_id__in=[row["id"] for row in chunk]
+                )
+            )
+
+        for row in chunk:
+            yield format_user_row(
+                realm.id,
+                acting_user=acting_user,
+                row=row,
+                client_gravatar=client_gravatar
+                and row["email_address_visibility"]
+                == UserProfile.EMAIL_ADDRESS_VISIBILITY_EVERYONE,
+                user_avatar_url_field_optional=user_avatar_url_field_optional,
+                custom_profile_field_data=None
+                if profiles_by_user_id is None
+                else profiles_by_user_id.get(row["id"], {}),
+            )
+
+
+def get_shareable_users_for_api(
+    realm: Realm,
+    acting_user: UserProfile,
+    *,
+    client_gravatar: bool,
+    user_avatar_url_field_optional: bool,
+) -> dict[int, APIUserDict]:
+    """Like get_users_for_api, but returns the same data for every
+    non-guest acting_user with the same role, for caching; the caller
+    is responsible for filling in acting_user's own delivery_email,
+    which is only included when the role allows seeing it."""
+    assert not acting_user.is_guest
+    result = get_users_for_api(
+        realm,
+        acting_user,
+        client_gravatar=client_gravatar,
+        user_avatar_url_field_optional=user_avatar_url_field_optional,
+    )
+    own_row = result.get(acting_user.id)
+    if own_row is not None and (
+        acting_user.email_address_visibility
+        not in UserProfile.ROLE_TO_ACCESSIBLE_EMAIL_ADDRESS_VISIBILITY_IDS[acting_user.role]
+    ):
+        own_row["delivery_email"] = None
     return result
 
 
@@ -77,12 +77,15 @@ class Command(ZulipBaseCommand):
         def run_threaded_workers(queues: list[str], logger: logging.Logger) -> None:
             cnt = 0
             for queue_name in queues:
-                if not settings.DEVELOPMENT:
-                    logger.info("launching queue worker thread %s", queue_name)
-                cnt += 1
-                td = ThreadedWorker(queue_name, logger)
-                td.start()
-            assert len(queues) == cnt
+                # A sharded queue needs a consumer for each of its shards.
+                shards = settings.QUEUE_SHARDS.get(queue_name, 1)
+                worker_nums: list[int | None] = [*range(1, shards + 1)] if shards > 1 else [None]
+                for worker_num in worker_nums:
+                    if not settings.DEVELOPMENT:
+                        logger.info("launching queue worker thread %s", queue_name)
+                    cnt += 1
+                    td = ThreadedWorker(queue_name, logger, worker_num)
+                    td.start()
             logger.info("%d queue worker threads were launched", cnt)
 
         if options["all"]:
@@ -116,10 +119,13 @@ class Command(ZulipBaseCommand):
 
 
 class ThreadedWorker(threading.Thread):
-    def __init__(self, queue_name: str, logger: logging.Logger) -> None:
+    def __init__(
+        self, queue_name: str, logger: logging.Logger, worker_num: int | None = None
+    ) -> None:
         threading.Thread.__init__(self)
         self.logger = logger
         self.queue_name = queue_name
+        self.worker_num = worker_num
 
     @override
     def run(self) -> None:
@@ -128,7 +134,7 @@ class ThreadedWorker(threading.Thread):
             log_and_exit_if_exception(self.logger, self.queue_name, threaded=True),
         ):
             scope.set_tag("queue_worker", self.queue_name)
-            worker = get_worker(self.queue_name, threaded=True)
+            worker = get_worker(self.queue_name, threaded=True, worker_num=self.worker_num)
             worker.setup()
             logging.debug("starting consuming %s", self.queue_name)
             worker.start()
@@ -0,0 +1,99 @@
+from collections import Counter, defaultdict
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import CommandParser
+from typing_extensions import override
+
+from zerver.lib.management import ZulipBaseCommand
+from zerver.lib.request_profiling import clear_request_profiles, get_request_profiles
+
+
+class Command(ZulipBaseCommand):
+    help = """Summarizes the request profiles recorded for the requests
+    selected by the REQUEST_PROFILING_* settings: the slowest endpoints,
+    the queries which took the most time in total, likely N+1 query
+    patterns, and the cache key families with the most misses."""
+
+    @override
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--path", help="Only include requests whose path starts with this")
+        parser.add_argument("--user-id", help="Only include requests by this user", type=int)
+        parser.add_argument("--limit", help="Number of entries in each list", default=10, type=int)
+        parser.add_argument(
+            "--clear", action="store_true", help="Delete the recorded profiles afterwards"
+        )
+
+    @override
+    def handle(self, *args: Any, **options: Any) -> None:
+        profiles = get_request_profiles()
+        if options["path"] is not None:
+            profiles = [p for p in profiles if p["path"].startswith(options["path"])]
+        if options["user_id"] is not None:
+            profiles = [p for p in profiles if p["user_id"] == options["user_id"]]
+        limit = options["limit"]
+
+        if not profiles:
+            if not settings.REQUEST_PROFILING_PATHS and not settings.REQUEST_PROFILING_USER_IDS:
+                print("No requests profiled; see the REQUEST_PROFILING_PATHS setting.")
+            else:
+                print("No requests profiled yet.")
+            return
+
+        endpoint_times: dict[str, list[float]] = defaultdict(list)
+        query_time: Counter[str] = Counter()
+        query_count: Counter[str] = Counter()
+        query_requests: Counter[str] = Counter()
+        n_plus_one_requests: Counter[str] = Counter()
+        n_plus_one_max: Counter[str] = Counter()
+        cache_requests: Counter[str] = Counter()
+        cache_misses: Counter[str] = Counter()
+        for profile in profiles:
+            endpoint_times[f"{profile['method']} {profile['path']}"].append(profile["time"])
+            for query in profile["queries"]:
+                query_time[query["sql"]] += query["time"]
+                query_count[query["sql"]] += query["count"]
+                query_requests[query["sql"]] += 1
+                if query["sql"] in profile["n_plus_one"]:
+                    n_plus_one_requests[query["sql"]] += 1
+                    n_plus_one_max[query["sql"]] = max(n_plus_one_max[query["sql"]], query["count"])
+            for family, counts in profile["cache"].items():
+                cache_requests[family] += counts["requests"]
+                cache_misses[family] += counts["misses"]
+
+        print(f"{len(profiles)} requests profiled.\n")
+
+        print("Endpoints by total time (requests, mean, max):")
+        for endpoint, times in sorted(
+            endpoint_times.items(), key=lambda item: sum(item[1]), reverse=True
+        )[:limit]:
+            print(
+                f"  {len(times):6} {1000 * sum(times) / len(times):8.1f}ms "
+                f"{1000 * max(times):8.1f}ms  {endpoint}"
+            )
+
+        print("\nQueries by total time (total, executions, requests):")
+        for sql, total in query_time.most_common(limit):
+            print(
+                f"  {1000 * total:9.1f}ms {query_count[sql]:7} {query_requests[sql]:6}  "
+                f"{shorten(sql)}"
+            )
+
+        print("\nLikely N+1 queries (requests, most executions in one request):")
+        if not n_plus_one_requests:
+            print("  None found.")
+        for sql, requests in n_plus_one_requests.most_common(limit):
+            print(f"  {requests:6} {n_plus_one_max[sql]:7}  {shorten(sql)}")
+
+        print("\nCache key families by misses (requests, misses):")
+        for family, misses in cache_misses.most_common(limit):
+            print(f"  {cache_requests[family]:7} {misses:7}  {family}")
+
+        if options["clear"]:
+            clear_request_profiles()
+
+
+def shorten(sql: str, length: int = 160) -> str:
+    if len(sql) <= length:
+        return sql
+    return sql[: length - 3] + "..."
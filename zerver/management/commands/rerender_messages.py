@@ -0,0 +1,51 @@
+from typing import Any
+
+from django.core.management.base import CommandParser
+from django.db.models import Q
+from typing_extensions import override
+
+from zerver.lib.management import ZulipBaseCommand
+from zerver.lib.markdown import version as markdown_version
+from zerver.lib.message_cache import rerender_messages
+from zerver.models import Message
+
+
+class Command(ZulipBaseCommand):
+    help = """Re-render the Markdown content of a realm's messages, e.g. after
+    changing its linkifiers.
+
+    By default, only messages rendered with an older version of the
+    Markdown processor are re-rendered."""
+
+    @override
+    def add_arguments(self, parser: CommandParser) -> None:
+        self.add_realm_args(parser, required=True)
+        parser.add_argument(
+            "--all", action="store_true", help="Re-render all of the realm's messages"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Messages to render at once"
+        )
+        parser.add_argument(
+            "--processes", type=int, default=1, help="Number of processes to render with"
+        )
+
+    @override
+    def handle(self, *args: Any, **options: Any) -> None:
+        realm = self.get_realm(options)
+        assert realm is not None
+
+        messages = Message.objects.filter(realm_id=realm.id)
+        if not options["all"]:
+            messages = messages.filter(
+                Q(rendered_content_version__isnull=True)
+                | Q(rendered_content_version__lt=markdown_version)
+            )
+        message_ids = list(messages.order_by("id").values_list("id", flat=True))
+        print(f"Re-rendering {len(message_ids)} messages")
+        rerender_messages(
+            realm,
+            message_ids,
+            batch_size=options["batch_size"],
+            processes=options["processes"],
+        )
@@ -0,0 +1,104 @@
+import os
+from argparse import ArgumentParser
+from collections import defaultdict
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from typing_extensions import override
+
+from zerver.lib.management import ZulipBaseCommand
+from zerver.models import Realm
+from zerver.tornado.event_queue import (
+    ClientDescriptor,
+    persistent_queue_filename,
+    read_event_queue_snapshot,
+    write_event_queue_snapshot,
+)
+from zerver.tornado.sharding import get_realm_tornado_ports, get_user_id_tornado_port
+
+
+class Command(ZulipBaseCommand):
+    help = """Moves the saved event queues of stopped Tornado processes to the
+Tornado port that each queue's user is now sharded to.
+
+Run this after updating the sharding configuration (e.g. to add a
+Tornado process), while all Tornado processes are stopped; otherwise,
+users whose port changed lose their event queues and must reload.
+"""
+
+    @override
+    def add_arguments(self, parser: ArgumentParser) -> None:
+        parser.add_argument(
+            "--old-ports",
+            nargs="+",
+            type=int,
+            help="Tornado ports whose saved event queues should be read; "
+            "defaults to the currently configured ports.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many event queues would move.",
+        )
+
+    @override
+    def handle(self, *args: Any, **options: Any) -> None:
+        old_ports: list[int] = options["old_ports"] or settings.TORNADO_PORTS
+        new_ports: list[int] = settings.TORNADO_PORTS
+
+        queues: dict[str, ClientDescriptor] = {}
+        old_port_by_queue: dict[str, int] = {}
+        for port in old_ports:
+            filename = persistent_queue_filename(port, tornado_processes=len(old_ports))
+            if not os.path.exists(filename):
+                continue
+            with open(filename, "rb") as stored_queues:
+                port_queues = read_event_queue_snapshot(stored_queues)
+            for qid in port_queues:
+                old_port_by_queue[qid] = port
+            queues.update(port_queues)
+
+        realm_ids = {client.realm_id for client in queues.values()}
+        realm_ports = {
+            realm.id: get_realm_tornado_ports(realm)
+            for realm in Realm.objects.filter(id__in=realm_ids)
+        }
+
+        new_port_queues: dict[int, dict[str, ClientDescriptor]] = defaultdict(dict)
+        moved_users: set[int] = set()
+        moved_queues = 0
+        for qid, client in queues.items():
+            if client.realm_id not in realm_ports:
+                # The realm was deleted; drop its queues.
+                continue
+            port = get_user_id_tornado_port(realm_ports[client.realm_id], client.user_profile_id)
+            if port not in new_ports:
+                raise CommandError(f"Port {port} is not a configured Tornado port")
+            new_port_queues[port][qid] = client
+            if port != old_port_by_queue[qid]:
+                moved_queues += 1
+                moved_users.add(client.user_profile_id)
+
+        print(
+            f"{moved_queues} of {len(queues)} event queues, "
+            f"owned by {len(moved_users)} users, change Tornado port."
+        )
+        for port in new_ports:
+            print(f"  Port {port}: {len(new_port_queues[port])} event queues")
+        if options["dry_run"]:
+            return
+
+        # Write out every new file before removing any old one, so
+        # that a failure partway leaves the old files in place.
+        for port in new_ports:
+            filename = persistent_queue_filename(port)
+            with open(filename + ".tmp", "wb") as stored_queues:
+                write_event_queue_snapshot(stored_queues, new_port_queues[port])
+        for port in old_ports:
+            filename = persistent_queue_filename(port, tornado_processes=len(old_ports))
+            if os.path.exists(filename):
+                os.remove(filename)
+        for port in new_ports:
+            filename = persistent_queue_filename(port)
+            os.rename(filename + ".tmp", filename)
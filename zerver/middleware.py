@@ -27,7 +27,12 @@ from sentry_sdk import set_tag
 from typing_extensions import ParamSpec, override
 
 from zerver.actions.message_summary import get_ai_requests, get_ai_time
-from zerver.lib.cache import get_remote_cache_requests, get_remote_cache_time
+from zerver.lib.cache import (
+    get_local_cache_hits,
+    get_local_cache_requests,
+    get_remote_cache_requests,
+    get_remote_cache_time,
+)
 from zerver.lib.db_connections import reset_queries
 from zerver.lib.debug import maybe_tracemalloc_listen
 from zerver.lib.exceptions import ErrorCode, JsonableError, MissingAuthenticationError, WebhookError
@@ -36,6 +41,13 @@ from zerver.lib.per_request_cache import flush_per_request_caches
 from zerver.lib.push_notifications import FailedToConnectBouncerError, InternalBouncerServerError
 from zerver.lib.rate_limiter import RateLimitResult
 from zerver.lib.request import RequestNotes
+from zerver.lib.request_profiling import (
+    finish_request_profile,
+    pause_request_profile,
+    resume_request_profile,
+    should_profile_request,
+    start_request_profile,
+)
 from zerver.lib.response import (
     AsynchronousResponse,
     json_response,
@@ -56,6 +68,8 @@ slow_query_logger = logging.getLogger("zulip.slow_queries")
 
 
 def record_request_stop_data(log_data: MutableMapping[str, Any]) -> None:
+    if "request_profile" in log_data:
+        pause_request_profile()
     log_data["time_stopped"] = time.time()
     log_data["remote_cache_time_stopped"] = get_remote_cache_time()
     log_data["remote_cache_requests_stopped"] = get_remote_cache_requests()
@@ -74,6 +88,8 @@ def async_request_timer_stop(request: HttpRequest) -> None:
 def record_request_restart_data(log_data: MutableMapping[str, Any]) -> None:
     if settings.PROFILE_ALL_REQUESTS:
         log_data["prof"].enable()
+    if "request_profile" in log_data:
+        resume_request_profile(log_data["request_profile"])
     log_data["time_restarted"] = time.time()
     log_data["remote_cache_time_restarted"] = get_remote_cache_time()
     log_data["remote_cache_requests_restarted"] = get_remote_cache_requests()
@@ -100,6 +116,8 @@ def record_request_start_data(log_data: MutableMapping[str, Any]) -> None:
     log_data["time_started"] = time.time()
     log_data["remote_cache_time_start"] = get_remote_cache_time()
     log_data["remote_cache_requests_start"] = get_remote_cache_requests()
+    log_data["local_cache_hits_start"] = get_local_cache_hits()
+    log_data["local_cache_requests_start"] = get_local_cache_requests()
     log_data["markdown_time_start"] = get_markdown_time()
     log_data["markdown_requests_start"] = get_markdown_requests()
     log_data["ai_time_start"] = get_ai_time()
@@ -169,6 +187,15 @@ def write_log_line(
                 f" (mem: {format_timedelta(remote_cache_time_delta)}/{remote_cache_count_delta})"
             )
 
+    local_cache_output = ""
+    if "local_cache_requests_start" in log_data:
+        local_cache_hits_delta = get_local_cache_hits() - log_data["local_cache_hits_start"]
+        local_cache_count_delta = (
+            get_local_cache_requests() - log_data["local_cache_requests_start"]
+        )
+        if local_cache_count_delta > 0:
+            local_cache_output = f" (lmem: {local_cache_hits_delta}/{local_cache_count_delta})"
+
     startup_output = ""
     if "startup_time_delta" in log_data and log_data["startup_time_delta"] > 0.005:
         startup_output = " (+start: {})".format(format_timedelta(log_data["startup_time_delta"]))
@@ -214,7 +241,7 @@ def write_log_line(
         logger_client = f"({requester_for_logs} via {client_name})"
     else:
         logger_client = f"({requester_for_logs} via {client_name}/{client_version})"
-    logger_timing = f"{format_timedelta(time_delta):>5}{optional_orig_delta}{remote_cache_output}{markdown_output}{ai_output}{db_time_output}{startup_output} {path}"
+    logger_timing = f"{format_timedelta(time_delta):>5}{optional_orig_delta}{remote_cache_output}{local_cache_output}{markdown_output}{ai_output}{db_time_output}{startup_output} {path}"
     logger_line = f"{remote_ip:<15} {method:<7} {status_code:3} {logger_timing}{extra_request_data} {logger_client}"
     if status_code in [200, 304] and method == "GET" and path.startswith("/static"):
         logger.debug(logger_line)
@@ -308,6 +335,11 @@ class LogRequests(MiddlewareMixin):
 
         request_notes.log_data = {}
         record_request_start_data(request_notes.log_data)
+        if should_profile_request(request.path):
+            request_notes.log_data["request_profile"] = start_request_profile()
+        else:
+            # In case an earlier request's profile was never finished.
+            pause_request_profile()
 
     def process_view(
         self,
@@ -362,6 +394,14 @@ class LogRequests(MiddlewareMixin):
 
         assert request_notes.client_name is not None and request_notes.log_data is not None
         assert request.method is not None
+        if "request_profile" in request_notes.log_data:
+            finish_request_profile(
+                request_notes.log_data.pop("request_profile"),
+                path=request.path,
+                method=request.method,
+                user_id=request.user.id if request.user.is_authenticated else None,
+                status_code=response.status_code,
+            )
         write_log_line(
             request_notes.log_data,
             request.path,
@@ -1159,7 +1159,7 @@ def get_user_by_id_in_realm_including_cross_realm(
     raise UserProfile.DoesNotExist
 
 
-@cache_with_key(realm_user_dicts_cache_key, timeout=3600 * 24 * 7)
+@cache_with_key(realm_user_dicts_cache_key, timeout=3600 * 24 * 7, stale_timeout=3600)
 def get_realm_user_dicts(realm_id: int) -> list[RawUserDict]:
     return list(
         UserProfile.objects.filter(
@@ -1198,7 +1198,7 @@ def get_realm_user_dicts_from_ids(realm_id: int, user_ids: list[int]) -> list[Ra
     )
 
 
-@cache_with_key(active_user_ids_cache_key, timeout=3600 * 24 * 7)
+@cache_with_key(active_user_ids_cache_key, timeout=3600 * 24 * 7, single_flight=True)
 def active_user_ids(realm_id: int) -> list[int]:
     query = UserProfile.objects.filter(
         realm_id=realm_id,
@@ -1207,7 +1207,7 @@ def active_user_ids(realm_id: int) -> list[int]:
     return list(query)
 
 
-@cache_with_key(active_non_guest_user_ids_cache_key, timeout=3600 * 24 * 7)
+@cache_with_key(active_non_guest_user_ids_cache_key, timeout=3600 * 24 * 7, single_flight=True)
 def active_non_guest_user_ids(realm_id: int) -> list[int]:
     query = (
         UserProfile.objects.filter(
@@ -1222,7 +1222,7 @@ def active_non_guest_user_ids(realm_id: int) -> list[int]:
     return list(query)
 
 
-@cache_with_key(active_guest_user_ids_cache_key, timeout=3600 * 24 * 7)
+@cache_with_key(active_guest_user_ids_cache_key, timeout=3600 * 24 * 7, single_flight=True)
 def active_guest_user_ids(realm_id: int) -> list[int]:
     query = UserProfile.objects.filter(
         realm_id=realm_id,
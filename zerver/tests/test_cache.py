@@ -1,12 +1,19 @@
+import time
 from unittest.mock import Mock, patch
 
+import redis
 from bmemcached.exceptions import MemcachedException
 from django.conf import settings
+from django.db import transaction
+from django.test import override_settings
+from typing_extensions import override
 
 from zerver.apps import flush_cache
 from zerver.lib.cache import (
     MEMCACHED_MAX_KEY_LENGTH,
     InvalidCacheKeyError,
+    LocalCache,
+    acquire_cache_lease,
     bulk_cached_fetch,
     cache_delete,
     cache_delete_many,
@@ -15,12 +22,17 @@ from zerver.lib.cache import (
     cache_set,
     cache_set_many,
     cache_with_key,
+    get_cache_backend,
+    get_local_cache_hits,
+    get_local_cache_requests,
+    local_cache,
+    release_cache_lease,
     safe_cache_get_many,
     safe_cache_set_many,
     user_profile_by_id_cache_key,
     validate_cache_key,
 )
-from zerver.lib.test_classes import ZulipTestCase
+from zerver.lib.test_classes import ZulipTestCase, ZulipTransactionTestCase
 from zerver.models import UserProfile
 from zerver.models.realms import get_realm
 from zerver.models.users import get_system_bot, get_user, get_user_profile_by_id
@@ -159,6 +171,100 @@ class CacheWithKeyDecoratorTest(ZulipTestCase):
         self.assertEqual(result_two, None)
 
 
+class CacheStampedeTest(ZulipTransactionTestCase):
+    """Simulates another process recomputing a value, by taking the
+    lease on it ourselves, and storing the value while we wait.  This
+    is not a ZulipTestCase, since the lease is skipped inside a
+    transaction."""
+
+    def test_single_flight_waits_for_lease_holder(self) -> None:
+        computed = []
+
+        @cache_with_key(lambda: "CacheStampedeTest:single_flight", single_flight=True)
+        def expensive_function() -> str:
+            computed.append(True)
+            return "computed here"
+
+        self.assertTrue(acquire_cache_lease("CacheStampedeTest:single_flight"))
+        self.assertFalse(acquire_cache_lease("CacheStampedeTest:single_flight"))
+
+        def other_process_finishes(seconds: float) -> None:
+            cache_set("CacheStampedeTest:single_flight", "computed elsewhere")
+            release_cache_lease("CacheStampedeTest:single_flight")
+
+        with patch("zerver.lib.cache.time.sleep", side_effect=other_process_finishes) as sleep:
+            self.assertEqual(expensive_function(), "computed elsewhere")
+        sleep.assert_called_once()
+        self.assertEqual(computed, [])
+
+        # The lease holder failing leaves us to compute the value.
+        cache_delete("CacheStampedeTest:single_flight")
+        self.assertTrue(acquire_cache_lease("CacheStampedeTest:single_flight"))
+        with patch(
+            "zerver.lib.cache.time.sleep",
+            side_effect=lambda seconds: release_cache_lease("CacheStampedeTest:single_flight"),
+        ):
+            self.assertEqual(expensive_function(), "computed here")
+        self.assertEqual(computed, [True])
+        self.assertEqual(expensive_function(), "computed here")
+        self.assertEqual(computed, [True])
+
+        # As does the lease holder taking too long.
+        cache_delete("CacheStampedeTest:single_flight")
+        self.assertTrue(acquire_cache_lease("CacheStampedeTest:single_flight"))
+        with patch("zerver.lib.cache.CACHE_LEASE_WAIT_SECONDS", 0):
+            self.assertEqual(expensive_function(), "computed here")
+        self.assertEqual(computed, [True, True])
+
+    def test_stale_while_revalidate(self) -> None:
+        computed = []
+
+        @cache_with_key(lambda: "CacheStampedeTest:stale", timeout=60, stale_timeout=3600)
+        def expensive_function() -> int:
+            computed.append(True)
+            return len(computed)
+
+        self.assertEqual(expensive_function(), 1)
+        self.assertEqual(expensive_function(), 1)
+
+        later = time.time() + 120
+        with patch("zerver.lib.cache.time.time", return_value=later):
+            # While another process recomputes the value, the stale
+            # value is returned immediately.
+            self.assertTrue(acquire_cache_lease("CacheStampedeTest:stale"))
+            self.assertEqual(expensive_function(), 1)
+            release_cache_lease("CacheStampedeTest:stale")
+
+            self.assertEqual(expensive_function(), 2)
+            self.assertEqual(expensive_function(), 2)
+        self.assertEqual(len(computed), 2)
+
+        # Deleting the key does not leave a stale value behind.
+        cache_delete("CacheStampedeTest:stale")
+        self.assertTrue(acquire_cache_lease("CacheStampedeTest:stale"))
+        with patch("zerver.lib.cache.CACHE_LEASE_WAIT_SECONDS", 0):
+            self.assertEqual(expensive_function(), 3)
+
+    def test_single_flight_in_transaction(self) -> None:
+        computed = []
+
+        @cache_with_key(lambda: "CacheStampedeTest:transaction", timeout=60, stale_timeout=3600)
+        def expensive_function() -> int:
+            computed.append(True)
+            return len(computed)
+
+        # Inside a transaction, we neither wait for the process holding
+        # the lease, nor return its stale value.
+        self.assertTrue(acquire_cache_lease("CacheStampedeTest:transaction"))
+        with transaction.atomic(), patch("zerver.lib.cache.time.sleep") as sleep:
+            self.assertEqual(expensive_function(), 1)
+            with patch("zerver.lib.cache.time.time", return_value=time.time() + 120):
+                self.assertEqual(expensive_function(), 2)
+        sleep.assert_not_called()
+        self.assertFalse(acquire_cache_lease("CacheStampedeTest:transaction"))
+        release_cache_lease("CacheStampedeTest:transaction")
+
+
 class SetCacheExceptionTest(ZulipTestCase):
     def test_set_cache_exception(self) -> None:
         with (
@@ -331,3 +437,83 @@ class GenericBulkCachedFetchTest(ZulipTestCase):
             id_fetcher=get_user_email,
         )
         self.assertEqual(result, {})
+
+
+@override_settings(LOCAL_CACHE_SIZE=100)
+class LocalCacheTest(ZulipTestCase):
+    @override
+    def setUp(self) -> None:
+        super().setUp()
+        local_cache.clear()
+        local_cache.synced_at = None
+        local_cache.next_sync_time = 0
+
+    def test_local_cache_hit(self) -> None:
+        hamlet = self.example_user("hamlet")
+        first = get_user_profile_by_id(hamlet.id)
+        # Not noticing other processes' deletions keeps this test
+        # independent of them.
+        local_cache.next_sync_time = float("inf")
+
+        hits = get_local_cache_hits()
+        requests = get_local_cache_requests()
+        with patch("zerver.lib.cache.get_cache_backend") as mock_backend:
+            second = get_user_profile_by_id(hamlet.id)
+            result: dict[int, UserProfile] = bulk_cached_fetch(
+                cache_key_function=user_profile_by_id_cache_key,
+                query_function=lambda ids: [],
+                object_ids=[hamlet.id],
+                id_fetcher=get_user_id,
+            )
+        mock_backend.assert_not_called()
+        self.assertEqual(get_local_cache_hits() - hits, 2)
+        self.assertEqual(get_local_cache_requests() - requests, 2)
+
+        # Each caller gets its own copy.
+        self.assertEqual(second, hamlet)
+        self.assertIsNot(second, first)
+        self.assertIsNot(result[hamlet.id], second)
+
+        # Other keys are never cached locally.
+        get_user("hamlet@zulip.com", hamlet.realm)
+        self.assertEqual(get_local_cache_requests() - requests, 2)
+
+    def test_local_cache_invalidation(self) -> None:
+        hamlet = self.example_user("hamlet")
+        key = user_profile_by_id_cache_key(hamlet.id)
+        get_user_profile_by_id(hamlet.id)
+        self.assertIn(key, local_cache.entries)
+
+        # A deletion by another process is noticed at the next sync.
+        local_cache.get_invalidation_script()(keys=[LocalCache.INVALIDATIONS_KEY], args=[60, key])
+        self.assertIn(key, local_cache.entries)
+        local_cache.next_sync_time = 0
+        with patch("zerver.lib.cache.get_cache_backend", wraps=get_cache_backend) as mock_backend:
+            get_user_profile_by_id(hamlet.id)
+        mock_backend.assert_called_once()
+
+        # Deleting the key drops it from this process's cache at once.
+        local_cache.next_sync_time = float("inf")
+        self.assertIn(key, local_cache.entries)
+        hamlet.full_name = "Hamlet, Prince of Denmark"
+        hamlet.save(update_fields=["full_name"])
+        self.assertNotIn(key, local_cache.entries)
+        self.assertEqual(get_user_profile_by_id(hamlet.id).full_name, hamlet.full_name)
+        self.assertIn(key, local_cache.entries)
+
+    def test_local_cache_redis_unavailable(self) -> None:
+        hamlet = self.example_user("hamlet")
+        get_user_profile_by_id(hamlet.id)
+        local_cache.next_sync_time = 0
+
+        with (
+            patch("redis.client.Pipeline.execute", side_effect=redis.exceptions.ConnectionError),
+            self.assertLogs(level="WARNING") as logs,
+            patch("zerver.lib.cache.get_cache_backend", wraps=get_cache_backend) as mock_backend,
+        ):
+            get_user_profile_by_id(hamlet.id)
+        mock_backend.assert_called_once()
+        self.assertEqual(local_cache.entries, {})
+        self.assertEqual(
+            logs.output[0].splitlines()[0], "WARNING:root:Could not sync the local cache with Redis"
+        )
@@ -1,3 +1,5 @@
+import os
+import tempfile
 import time
 from collections.abc import Callable, Collection
 from typing import Any
@@ -19,6 +21,7 @@ from zerver.lib.test_classes import ZulipTestCase
 from zerver.lib.test_helpers import HostRequestMock, dummy_handler, mock_queue_publish
 from zerver.models import Device, Recipient, Subscription, UserProfile, UserTopic
 from zerver.models.streams import get_stream
+from zerver.tornado.descriptors import set_descriptor_by_handler_id
 from zerver.tornado.event_queue import (
     DEFAULT_EVENT_QUEUE_TIMEOUT_SECS,
     EVENT_QUEUE_OFFLINE_TIMEOUT_SECS,
@@ -28,8 +31,12 @@ from zerver.tornado.event_queue import (
     access_client_descriptor,
     add_client_gc_hook,
     allocate_client_descriptor,
+    clear_client_event_queues_for_testing,
     clients,
+    dump_event_queues,
     gc_event_queues,
+    get_wrapped_process_notification,
+    load_event_queues,
     mark_clients_offline,
     maybe_enqueue_notifications,
     missedmessage_hook,
@@ -1282,6 +1289,102 @@ class FileReloadLogicTest(ZulipTestCase):
                 "/home/zulip/tornado/event_queues.9800.last.json",
             )
 
+    def test_dump_and_load_event_queues(self) -> None:
+        hamlet = self.example_user("hamlet")
+        queue_data = dict(
+            all_public_streams=False,
+            apply_markdown=True,
+            client_gravatar=True,
+            client_type_name="website",
+            event_types=None,
+            last_connection_time=time.time(),
+            queue_timeout=600,
+            realm_id=hamlet.realm_id,
+            user_profile_id=hamlet.id,
+        )
+        client = allocate_client_descriptor(dict(queue_data))
+        client.event_queue.push(dict(type="arbitrary", x="foo"))
+        client.event_queue.push(dict(type="arbitrary", x="bar"))
+        client.event_queue.prune(0)
+        empty_client = allocate_client_descriptor(dict(queue_data))
+        expected = {qid: client.to_dict() for qid, client in clients.items()}
+
+        with (
+            tempfile.TemporaryDirectory() as tmp_dir,
+            self.settings(
+                JSON_PERSISTENT_QUEUE_FILENAME_PATTERN=os.path.join(tmp_dir, "queues%s.json")
+            ),
+        ):
+            with self.assertLogs(level="INFO"):
+                dump_event_queues(9800)
+            clear_client_event_queues_for_testing()
+            with self.assertLogs(level="INFO"):
+                load_event_queues(9800)
+
+            # Queued events are only deserialized once they are accessed.
+            loaded_client = clients[client.event_queue.id]
+            loaded_empty_client = clients[empty_client.event_queue.id]
+            self.assertIsNotNone(loaded_client.event_queue.serialized_queue)
+            self.assertIsNone(loaded_empty_client.event_queue.serialized_queue)
+            self.assertFalse(loaded_client.event_queue.empty())
+            self.assertTrue(loaded_empty_client.event_queue.empty())
+
+            # Events pushed before that are spliced onto the end.
+            loaded_client.event_queue.push(dict(type="arbitrary", x="baz"))
+            self.assertEqual(
+                orjson.loads(loaded_client.event_queue.serialize_events()),
+                [
+                    dict(type="arbitrary", x="bar", id=1),
+                    dict(type="arbitrary", x="baz", id=2),
+                ],
+            )
+            self.assertIsNotNone(loaded_client.event_queue.serialized_queue)
+            self.assertEqual(
+                [event["x"] for event in loaded_client.event_queue.contents()],
+                ["bar", "baz"],
+            )
+            self.assertIsNone(loaded_client.event_queue.serialized_queue)
+
+            expected[client.event_queue.id]["event_queue"]["queue"].append(
+                dict(type="arbitrary", x="baz", id=2)
+            )
+            expected[client.event_queue.id]["event_queue"]["next_event_id"] = 3
+            self.assertEqual(
+                {qid: client.to_dict() for qid, client in clients.items()},
+                expected,
+            )
+
+    def test_load_legacy_event_queues(self) -> None:
+        hamlet = self.example_user("hamlet")
+        client = allocate_client_descriptor(
+            dict(
+                all_public_streams=False,
+                apply_markdown=True,
+                client_gravatar=True,
+                client_type_name="website",
+                event_types=None,
+                last_connection_time=time.time(),
+                queue_timeout=600,
+                realm_id=hamlet.realm_id,
+                user_profile_id=hamlet.id,
+            )
+        )
+        client.event_queue.push(dict(type="arbitrary", x="foo"))
+        expected = client.to_dict()
+
+        with (
+            tempfile.TemporaryDirectory() as tmp_dir,
+            self.settings(
+                JSON_PERSISTENT_QUEUE_FILENAME_PATTERN=os.path.join(tmp_dir, "queues%s.json")
+            ),
+        ):
+            with open(persistent_queue_filename(9800), "wb") as stored_queues:
+                stored_queues.write(orjson.dumps([(client.event_queue.id, expected)]))
+            clear_client_event_queues_for_testing()
+            with self.assertLogs(level="INFO"):
+                load_event_queues(9800)
+            self.assertEqual(clients[client.event_queue.id].to_dict(), expected)
+
 
 class PruneInternalDataTest(ZulipTestCase):
     def test_prune_internal_data(self) -> None:
@@ -1369,6 +1472,58 @@ class EventQueueTest(ZulipTestCase):
         self.assertEqual(queue.contents(), [out_dict])
         self.verify_to_dict_end_to_end(client)
 
+    def test_shared_payload(self) -> None:
+        client1 = self.get_client_descriptor()
+        client2 = self.get_client_descriptor()
+        event = dict(type="message", message=dict(id=1, content="hello"))
+        overlay = dict(flags=["read"], internal_data=dict(mention_push_notify=False))
+
+        client1.event_queue.push(dict(type="arbitrary"))
+        client1.event_queue.push(event, overlay)
+        client2.event_queue.push(event, overlay)
+
+        # Both queues reference the same payload, rather than a copy.
+        entry1 = client1.event_queue.queue[1]
+        entry2 = client2.event_queue.queue[0]
+        self.assertIs(entry1.payload, event)
+        self.assertIs(entry2.payload, event)
+        self.assertEqual((entry1.id, entry2.id), (1, 0))
+
+        self.assertEqual(
+            client1.event_queue.contents(),
+            [
+                dict(type="arbitrary", id=0),
+                dict(type="message", message=dict(id=1, content="hello"), flags=["read"], id=1),
+            ],
+        )
+        self.assertEqual(
+            client2.event_queue.contents(include_internal_data=True),
+            [dict(**event, **overlay, id=0)],
+        )
+        # Materializing the events does not modify the shared data.
+        self.assertEqual(event, dict(type="message", message=dict(id=1, content="hello")))
+        self.assertIn("internal_data", overlay)
+        self.verify_to_dict_end_to_end(client1)
+        self.verify_to_dict_end_to_end(client2)
+
+    def test_finish_handlers_after_batch(self) -> None:
+        hamlet = self.example_user("hamlet")
+        client = self.get_client_descriptor()
+        client.current_handler_id = 42
+        set_descriptor_by_handler_id(42, client)
+
+        notices = [dict(event=dict(type="arbitrary", x=i), users=[hamlet.id]) for i in range(3)]
+        with mock.patch("zerver.tornado.event_queue.finish_handler") as mock_finish_handler:
+            get_wrapped_process_notification("notify_tornado")(notices)
+
+        # The waiting handler is only finished once, with all of the events.
+        mock_finish_handler.assert_called_once_with(
+            42,
+            client.event_queue.id,
+            [dict(type="arbitrary", x=i, id=i) for i in range(3)],
+        )
+        self.assertIsNone(client.current_handler_id)
+
     def test_event_collapsing(self) -> None:
         client = self.get_client_descriptor()
         queue = client.event_queue
@@ -1563,7 +1718,10 @@ class EventQueueTest(ZulipTestCase):
         self.verify_to_dict_end_to_end(client)
 
         queue.push({"type": "unknown", "timestamp": "1"})
-        self.assertEqual(list(queue.queue), [{"id": 1, "type": "unknown", "timestamp": "1"}])
+        self.assertEqual(
+            [entry.materialize() for entry in queue.queue],
+            [{"id": 1, "type": "unknown", "timestamp": "1"}],
+        )
         self.assertEqual(queue.virtual_events, {"flags/add/read": event})
         # And we can still reconstruct newest_pruned_id etc. correctly
         self.verify_to_dict_end_to_end(client)
@@ -1740,6 +1898,49 @@ class OfflineEventQueueTest(ZulipTestCase):
             # last_client_for_user is False and it short-circuits.
             mock_enqueue.assert_called_once()
 
+    @time_machine.travel(NOW, tick=False)
+    def test_gc_event_queues_incremental(self) -> None:
+        hamlet = self.example_user("hamlet")
+        expired_clients = [
+            self.allocate_queue(hamlet, queue_timeout=DEFAULT_EVENT_QUEUE_TIMEOUT_SECS)
+            for i in range(150)
+        ]
+        connected_client = self.allocate_queue(hamlet, queue_timeout=None)
+        idle_client = self.allocate_queue(hamlet, queue_timeout=None)
+
+        # Queues which are not yet due are not even examined.
+        with mock.patch.object(ClientDescriptor, "expired") as mock_expired:
+            self.assertFalse(gc_event_queues(port=9993))
+            mock_expired.assert_not_called()
+
+        last_connection_time = time.time() - DEFAULT_EVENT_QUEUE_TIMEOUT_SECS
+        for client in expired_clients:
+            client.last_connection_time = last_connection_time
+        # This makes the connected queue the first one examined.
+        connected_client.last_connection_time = last_connection_time - 1
+        connected_client.current_handler_id = 999
+
+        # With no time budget, we stop after the first 99 queues...
+        with mock.patch("zerver.tornado.event_queue.EVENT_QUEUE_GC_BUDGET_SECS", -1):
+            self.assertTrue(gc_event_queues(port=9993))
+        self.assert_length(
+            [client for client in expired_clients if client.event_queue.id in clients], 52
+        )
+
+        # ... and pick up where we left off on the next pass.
+        self.assertFalse(gc_event_queues(port=9993))
+        for client in expired_clients:
+            self.assertNotIn(client.event_queue.id, clients)
+        self.assertIn(connected_client.event_queue.id, clients)
+        self.assertIn(idle_client.event_queue.id, clients)
+
+        # The connected queue is checked again once it disconnects.
+        connected_client.current_handler_id = None
+        with time_machine.travel(self.NOW + 61, tick=False):
+            self.assertFalse(gc_event_queues(port=9993))
+        self.assertNotIn(connected_client.event_queue.id, clients)
+        self.assertIn(idle_client.event_queue.id, clients)
+
     def test_idle_queue_timeout_resolution(self) -> None:
         hamlet = self.example_user("hamlet")
 
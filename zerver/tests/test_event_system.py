@@ -5,6 +5,7 @@ from unittest import mock
 from urllib.parse import urlsplit
 
 import orjson
+import redis
 from django.conf import settings
 from django.http import HttpRequest, HttpResponse
 from django.test import override_settings
@@ -15,22 +16,34 @@ from zerver.actions.channel_folders import check_add_channel_folder
 from zerver.actions.custom_profile_fields import try_update_realm_custom_profile_field
 from zerver.actions.message_send import check_send_message
 from zerver.actions.presence import do_update_user_presence
+from zerver.actions.realm_domains import do_add_realm_domain
 from zerver.actions.streams import do_change_stream_folder
-from zerver.actions.user_settings import do_change_avatar_fields, do_change_user_setting
+from zerver.actions.user_settings import (
+    do_change_avatar_fields,
+    do_change_full_name,
+    do_change_user_setting,
+)
 from zerver.actions.users import do_change_user_role
+from zerver.lib.cache import flush_realm_state_snapshots
 from zerver.lib.event_schema import check_web_reload_client_event
 from zerver.lib.events import fetch_initial_state_data, post_process_state
 from zerver.lib.exceptions import AccessDeniedError
 from zerver.lib.request import RequestVariableMissingError
+from zerver.lib.state_versions import (
+    get_state_versions_redis_client,
+    record_state_changes,
+    reset_state_versions,
+)
 from zerver.lib.test_classes import ZulipTestCase
 from zerver.lib.test_helpers import (
     HostRequestMock,
     dummy_handler,
+    queries_captured,
     reset_email_visibility_to_everyone_in_zulip_realm,
     stub_event_queue_user_events,
 )
 from zerver.lib.users import get_users_for_api
-from zerver.models import CustomProfileField, UserMessage, UserPresence, UserProfile
+from zerver.models import CustomProfileField, Message, UserMessage, UserPresence, UserProfile
 from zerver.models.clients import get_client
 from zerver.models.realms import get_realm
 from zerver.models.streams import get_stream
@@ -41,6 +54,8 @@ from zerver.tornado.event_queue import (
     MOBILE_EVENT_QUEUE_TIMEOUT_SECS,
     allocate_client_descriptor,
     clear_client_event_queues_for_testing,
+    do_gc_event_queues,
+    get_client_descriptors_for_realm_all_streams,
     get_client_info_for_message_event,
     mark_clients_to_reload,
     process_message_event,
@@ -223,6 +238,160 @@ class EventsEndpointTest(ZulipTestCase):
         )
         self.assert_json_error_contains(result, "idle_queue_timeout")
 
+    def test_state_versions(self) -> None:
+        hamlet = self.example_user("hamlet")
+        iago = self.example_user("iago")
+        queue_data = EventQueueData(queue_id="1", idle_queue_timeout_secs=600)
+
+        def register(state_versions: dict[str, str]) -> dict[str, Any]:
+            with stub_event_queue_user_events(queue_data, []):
+                result = self.api_post(
+                    hamlet,
+                    "/api/v1/register",
+                    {"state_versions": orjson.dumps(state_versions).decode()},
+                )
+            return self.assert_json_success(result)
+
+        result = register({})
+        self.assertEqual(result["resumed_state_sections"], [])
+        self.assertEqual(
+            set(result["state_versions"]),
+            {
+                "custom_profile_fields",
+                "default_stream_groups",
+                "realm_domains",
+                "realm_playgrounds",
+                "realm_user",
+                "realm_user_groups",
+            },
+        )
+        self.assertIn("realm_user_groups", result)
+        self.assertGreater(len(result["realm_users"]), 1)
+
+        # Nothing changed, so the client can skip every section.
+        versions = result["state_versions"]
+        result = register(versions)
+        self.assertEqual(result["resumed_state_sections"], sorted(versions))
+        self.assertEqual(result["state_versions"], versions)
+        self.assertEqual(result["realm_users"], [])
+        for field in [
+            "custom_profile_fields",
+            "realm_default_stream_groups",
+            "realm_domains",
+            "realm_playgrounds",
+            "realm_user_groups",
+        ]:
+            self.assertNotIn(field, result)
+
+        # After a change to a user, only that user is sent.
+        with self.captureOnCommitCallbacks(execute=True):
+            do_change_full_name(iago, "New Iago", acting_user=iago, notify=False)
+        result = register(versions)
+        self.assertIn("realm_user", result["resumed_state_sections"])
+        self.assertEqual([user["user_id"] for user in result["realm_users"]], [iago.id])
+        self.assertEqual(result["realm_users"][0]["full_name"], "New Iago")
+        self.assertNotEqual(result["state_versions"]["realm_user"], versions["realm_user"])
+
+        # Other sections are sent in full when changed.
+        with self.captureOnCommitCallbacks(execute=True):
+            do_add_realm_domain(hamlet.realm, "resume.example.com", False, acting_user=None)
+        result = register(versions)
+        self.assertNotIn("realm_domains", result["resumed_state_sections"])
+        self.assertIn(
+            {"domain": "resume.example.com", "allow_subdomains": False}, result["realm_domains"]
+        )
+
+        # Versions from a different epoch are not resumable.
+        reset_state_versions(hamlet.realm_id)
+        result = register(versions)
+        self.assertEqual(result["resumed_state_sections"], [])
+
+        # Neither are invalid versions.
+        result = register({"realm_user": "invalid", "realm_domains": "invalid"})
+        self.assertEqual(result["resumed_state_sections"], [])
+
+        # If Redis is unavailable, clients get the full state.
+        versions = result["state_versions"]
+        with (
+            mock.patch(
+                "zerver.lib.state_versions.get_state_versions_redis_client"
+            ) as get_redis_client,
+            self.assertLogs(level="WARNING") as logs,
+        ):
+            get_redis_client.return_value.eval.side_effect = redis.exceptions.RedisError
+            result = register(versions)
+        self.assertEqual(
+            [log.split("\n")[0] for log in logs.output],
+            ["WARNING:root:Could not fetch state versions"],
+        )
+        self.assertEqual(result["resumed_state_sections"], [])
+        self.assertEqual(result["state_versions"], {})
+        self.assertGreater(len(result["realm_users"]), 1)
+        self.assertIn("realm_domains", result)
+
+        # A change which cannot be recorded resets the versions
+        # instead, so that clients cannot resume from before it.
+        with (
+            mock.patch.object(
+                get_state_versions_redis_client(),
+                "eval",
+                side_effect=redis.exceptions.RedisError,
+            ),
+            self.assertLogs(level="WARNING") as logs,
+        ):
+            record_state_changes(hamlet.realm_id, ["realm_domains"])
+        self.assertEqual(
+            [log.split("\n")[0] for log in logs.output],
+            ["WARNING:root:Could not record state changes"],
+        )
+        self.assertEqual(register(versions)["resumed_state_sections"], [])
+
+        # If the reset fails too, nothing is resumed until it succeeds.
+        versions = register({})["state_versions"]
+        with (
+            mock.patch(
+                "zerver.lib.state_versions.get_state_versions_redis_client"
+            ) as get_redis_client,
+            self.assertLogs(level="WARNING") as logs,
+        ):
+            get_redis_client.return_value.eval.side_effect = redis.exceptions.RedisError
+            get_redis_client.return_value.delete.side_effect = redis.exceptions.RedisError
+            record_state_changes(hamlet.realm_id, ["realm_domains"])
+        self.assertEqual(
+            [log.split("\n")[0] for log in logs.output],
+            [
+                "WARNING:root:Could not record state changes",
+                "WARNING:root:Could not reset state versions",
+            ],
+        )
+        result = register(versions)
+        self.assertEqual(result["resumed_state_sections"], [])
+        self.assertEqual(
+            register(result["state_versions"])["resumed_state_sections"], sorted(versions)
+        )
+
+    def test_streamed_register(self) -> None:
+        hamlet = self.example_user("hamlet")
+        queue_data = EventQueueData(queue_id="1", idle_queue_timeout_secs=600)
+
+        def register(streaming: bool) -> dict[str, Any]:
+            with (
+                stub_event_queue_user_events(queue_data, []),
+                mock.patch(
+                    "zerver.views.events_register.STREAMING_USERS_MIN_COUNT",
+                    0 if streaming else 10000,
+                ),
+            ):
+                result = self.api_post(hamlet, "/api/v1/register", {})
+            self.assertEqual(result.streaming, streaming)
+            return self.assert_json_success(result)
+
+        expected = register(streaming=False)
+        result = register(streaming=True)
+        self.assertEqual(set(result), set(expected))
+        for key in ["realm_users", "realm_non_active_users", "realm_user_groups"]:
+            self.assertEqual(result[key], expected[key])
+
     def test_events_register_spectators(self) -> None:
         # Verify that POST /register works for spectators, but not for
         # normal users.
@@ -1135,6 +1304,60 @@ class ClientDescriptorsTest(ZulipTestCase):
         dct = client_info[client.event_queue.id]
         self.assertEqual(dct["is_sender"], True)
 
+    def test_get_client_descriptors_for_realm_all_streams(self) -> None:
+        hamlet = self.example_user("hamlet")
+        realm = hamlet.realm
+
+        def allocate(narrow: list[list[str]], **kwargs: Any) -> str:
+            queue_data = dict(
+                all_public_streams=False,
+                apply_markdown=True,
+                client_gravatar=True,
+                client_type_name="website",
+                event_types=["message"],
+                last_connection_time=time.time(),
+                queue_timeout=0,
+                realm_id=realm.id,
+                user_profile_id=hamlet.id,
+                narrow=narrow,
+            )
+            queue_data.update(kwargs)
+            return allocate_client_descriptor(queue_data).event_queue.id
+
+        all_streams = allocate([], all_public_streams=True)
+        verona = allocate([["stream", "Verona"]])
+        denmark = allocate([["channel", "Denmark"]])
+        verona_lunch = allocate([["stream", "verona"], ["topic", "lunch"]])
+        lunch = allocate([["topic", "Lunch"]])
+        general_chat = allocate([["topic", Message.EMPTY_TOPIC_FALLBACK_NAME]])
+        dms = allocate([["is", "dm"]])
+        # Clients which cannot receive messages are not indexed at all.
+        allocate([], all_public_streams=True, event_types=["presence"])
+        # Nor are clients which only receive messages they can access.
+        allocate([])
+
+        def get_queue_ids(stream_name: str, topic_name: str | None) -> set[str]:
+            return {
+                client.event_queue.id
+                for client in get_client_descriptors_for_realm_all_streams(
+                    realm.id, stream_name, topic_name
+                )
+            }
+
+        self.assertEqual(
+            get_queue_ids("Verona", "Lunch"), {all_streams, dms, verona, verona_lunch, lunch}
+        )
+        self.assertEqual(get_queue_ids("verona", "dinner"), {all_streams, dms, verona})
+        self.assertEqual(get_queue_ids("Denmark", "lunch"), {all_streams, dms, denmark, lunch})
+        self.assertEqual(get_queue_ids("Denmark", ""), {all_streams, dms, denmark, general_chat})
+        self.assertEqual(get_queue_ids("Verona", None), {all_streams, dms, verona, verona_lunch})
+        self.assertEqual(
+            get_client_descriptors_for_realm_all_streams(realm.id + 1, "Verona", None), []
+        )
+
+        do_gc_event_queues({verona, verona_lunch}, {hamlet.id}, {realm.id})
+        self.assertEqual(get_queue_ids("Verona", "lunch"), {all_streams, dms, lunch})
+
     def test_get_client_info_for_narrow_guest(self) -> None:
         polonius = self.example_user("polonius")
         realm = polonius.realm
@@ -1338,8 +1561,10 @@ class ClientDescriptorsTest(ZulipTestCase):
                 assert event["type"] == "message"
                 return True
 
-            def add_event(self, event: dict[str, Any]) -> None:
-                self.events.append(event)
+            def add_event(
+                self, event: dict[str, Any], overlay: dict[str, Any] | None = None
+            ) -> None:
+                self.events.append({**event, **(overlay or {})})
 
         client1 = MockClient(
             user_profile_id=hamlet.id,
@@ -1537,7 +1762,7 @@ class ReloadWebClientsTest(ZulipTestCase):
         mark_clients_to_reload([client.event_queue.id])
         send_web_reload_client_events()
         self.assert_length(client.event_queue.queue, 1)
-        reload_event = client.event_queue.queue[0]
+        reload_event = client.event_queue.queue[0].materialize()
 
         check_web_reload_client_event("web_reload_client_event", reload_event)
         self.assertEqual(
@@ -1629,6 +1854,43 @@ class FetchQueriesTest(ZulipTestCase):
 
                 fetch_initial_state_data(user, realm=user.realm, event_types=event_types)
 
+    def test_realm_state_snapshots(self) -> None:
+        hamlet = self.example_user("hamlet")
+        iago = self.example_user("iago")
+        realm = hamlet.realm
+        flush_realm_state_snapshots(realm.id)
+
+        expected_states = {
+            user.id: fetch_initial_state_data(user, realm=realm) for user in [hamlet, iago]
+        }
+        with override_settings(REALM_STATE_SNAPSHOTS=True):
+            with queries_captured() as cold_queries:
+                state = fetch_initial_state_data(hamlet, realm=realm)
+            self.assertEqual(state, expected_states[hamlet.id])
+
+            # The snapshot saves the queries for the realm's users,
+            # user groups, custom profile fields, etc.
+            with queries_captured() as warm_queries:
+                state = fetch_initial_state_data(hamlet, realm=realm)
+            self.assertEqual(state, expected_states[hamlet.id])
+            self.assertLess(len(warm_queries), len(cold_queries))
+
+            # Administrators can see more email addresses, so they
+            # don't share the users section with members; but each
+            # user still gets their own delivery email.
+            state = fetch_initial_state_data(iago, realm=realm)
+            self.assertEqual(state, expected_states[iago.id])
+            self.assertEqual(state["raw_users"][iago.id]["delivery_email"], iago.delivery_email)
+
+            # Sending an event for a change discards the snapshot.
+            with self.captureOnCommitCallbacks(execute=True):
+                do_add_realm_domain(realm, "snapshot.example.com", False, acting_user=None)
+            state = fetch_initial_state_data(hamlet, realm=realm)
+            self.assertIn(
+                {"domain": "snapshot.example.com", "allow_subdomains": False},
+                state["realm_domains"],
+            )
+
 
 class TestEventsRegisterAllPublicStreamsDefaults(ZulipTestCase):
     @override
@@ -56,6 +56,7 @@ from zerver.lib.export import (
 )
 from zerver.lib.import_realm import (
     do_import_realm,
+    fix_message_content_attributes,
     get_db_table,
     get_incoming_message_ids,
     reset_import_state,
@@ -2723,6 +2724,34 @@ class RealmImportExportTest(ExportFile):
 
         self.assertEqual(message_ids, [555, 888, 999])
 
+    def test_fix_message_content_attributes(self) -> None:
+        realm = get_realm("zulip")
+        hamlet = self.example_user("hamlet")
+        sender_map = {hamlet.id: {"is_bot": False, "translate_emoticons": False}}
+
+        def get_messages() -> list[dict[str, Any]]:
+            return [
+                {"id": 1, "sender_id": hamlet.id, "content": "**bold**", "rendered_content": None},
+                {"id": 2, "sender_id": hamlet.id, "content": ":smile:", "rendered_content": None},
+            ]
+
+        messages = get_messages()
+        fix_message_content_attributes(realm, sender_map, messages)
+        self.assertEqual(messages[0]["rendered_content"], "<p><strong>bold</strong></p>")
+        rendered = [message["rendered_content"] for message in messages]
+
+        # If fetching the data for the whole batch fails, each message
+        # is rendered with its own.
+        messages = get_messages()
+        with (
+            patch("zerver.lib.import_realm.get_db_data", side_effect=Exception("error")),
+            self.assertLogs(level="WARNING") as logs,
+        ):
+            fix_message_content_attributes(realm, sender_map, messages)
+        self.assert_length(logs.output, 1)
+        self.assertIn("Error fetching Markdown data for 2 messages", logs.output[0])
+        self.assertEqual([message["rendered_content"] for message in messages], rendered)
+
     def test_import_of_authentication_methods(self) -> None:
         with self.settings(
             AUTHENTICATION_BACKENDS=(
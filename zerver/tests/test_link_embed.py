@@ -1,5 +1,7 @@
 import re
-from collections import OrderedDict
+import threading
+import time
+from collections import Counter, OrderedDict
 from typing import Any
 from unittest import mock
 from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
@@ -19,7 +21,7 @@ from zerver.lib.test_classes import ZulipTestCase
 from zerver.lib.test_helpers import mock_queue_publish
 from zerver.lib.url_preview.oembed import get_oembed_data, strip_cdata
 from zerver.lib.url_preview.parsers import GenericParser, OpenGraphParser
-from zerver.lib.url_preview.preview import get_link_embed_data
+from zerver.lib.url_preview.preview import get_cached_link_embed_data, get_link_embed_data
 from zerver.lib.url_preview.types import UrlEmbedData, UrlOEmbedData
 from zerver.models import Message, Realm, UserMessage, UserProfile
 from zerver.worker.embed_links import FetchLinksEmbedData
@@ -1008,8 +1010,8 @@ class PreviewTestCase(ZulipTestCase):
                 in info_logs.output[0]
             )
 
-            # This did not get cached -- hence the lack of [0] on the cache_get
-            cached_data = cache_get(preview_url_cache_key(url))
+            # Network errors are cached too, for less time.
+            cached_data = cache_get(preview_url_cache_key(url))[0]
             self.assertIsNone(cached_data)
 
         msg.refresh_from_db()
@@ -1125,7 +1127,7 @@ class PreviewTestCase(ZulipTestCase):
             with (
                 self.assertLogs(level="INFO") as info_logs,
                 mock.patch(
-                    "zerver.worker.embed_links.url_preview.get_link_embed_data",
+                    "zerver.worker.embed_links.url_preview.fetch_link_embed_data",
                     lambda *args, **kwargs: mocked_data,
                 ),
             ):
@@ -1165,7 +1167,7 @@ class PreviewTestCase(ZulipTestCase):
             with (
                 self.assertLogs(level="INFO") as info_logs,
                 mock.patch(
-                    "zerver.worker.embed_links.url_preview.get_link_embed_data",
+                    "zerver.worker.embed_links.url_preview.fetch_link_embed_data",
                     lambda *args, **kwargs: mocked_data,
                 ),
             ):
@@ -1178,3 +1180,47 @@ class PreviewTestCase(ZulipTestCase):
         msg.refresh_from_db()
         expected_content = f"""<p><a href="https://www.youtube.com/watch?v=eSJTXC7Ixgg">YouTube link</a></p>\n<div class="youtube-video message_inline_image"><a data-id="eSJTXC7Ixgg" href="https://www.youtube.com/watch?v=eSJTXC7Ixgg"><img src="{get_camo_url("https://i.ytimg.com/vi/eSJTXC7Ixgg/mqdefault.jpg")}"></a></div>"""
         self.assertEqual(expected_content, msg.rendered_content)
+
+    def test_fetch_urls_concurrently(self) -> None:
+        urls = [
+            "http://a.test.org/1",
+            "http://a.test.org/2",
+            "http://a.test.org/3",
+            "http://b.test.org/",
+        ]
+        lock = threading.Lock()
+        in_flight: Counter[str] = Counter()
+        max_in_flight: Counter[str] = Counter()
+
+        def fetch(url: str) -> UrlEmbedData:
+            domain = urlsplit(url).netloc
+            with lock:
+                in_flight[domain] += 1
+                max_in_flight[domain] = max(max_in_flight[domain], in_flight[domain])
+            time.sleep(0.05)
+            with lock:
+                in_flight[domain] -= 1
+            return UrlEmbedData(title=url)
+
+        with (
+            mock.patch(
+                "zerver.worker.embed_links.url_preview.fetch_link_embed_data", side_effect=fetch
+            ),
+            mock.patch.object(FetchLinksEmbedData, "MAX_CONCURRENT_FETCHES_PER_DOMAIN", 2),
+            self.assertLogs(level="INFO") as info_logs,
+        ):
+            url_embed_data = FetchLinksEmbedData().fetch_urls(urls)
+        self.assert_length(info_logs.output, 4)
+        self.assertEqual(max_in_flight, Counter({"a.test.org": 2, "b.test.org": 1}))
+        self.assertEqual(
+            {url: data.title for url, data in url_embed_data.items() if data is not None},
+            {url: url for url in urls},
+        )
+
+        # The previews were cached, so are not fetched again.
+        self.assertEqual(get_cached_link_embed_data(urls), url_embed_data)
+        with mock.patch(
+            "zerver.worker.embed_links.url_preview.fetch_link_embed_data"
+        ) as mock_fetch:
+            self.assertEqual(get_link_embed_data(urls[0]), url_embed_data[urls[0]])
+        mock_fetch.assert_not_called()
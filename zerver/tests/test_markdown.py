@@ -46,10 +46,12 @@ from zerver.lib.markdown import (
     markdown_convert,
     possible_linked_stream_names,
     render_message_markdown,
+    render_message_markdown_batch,
     topic_links,
     url_embed_preview_enabled,
     url_to_a,
 )
+from zerver.lib.markdown import version as markdown_version
 from zerver.lib.markdown.fenced_code import FencedBlockPreprocessor
 from zerver.lib.markdown.from_html import convert_html_to_markdown
 from zerver.lib.mdiff import diff_strings
@@ -64,9 +66,11 @@ from zerver.lib.mention import (
     stream_wildcards,
     topic_wildcards,
 )
+from zerver.lib.message_cache import rerender_messages
 from zerver.lib.per_request_cache import flush_per_request_caches
 from zerver.lib.streams import user_has_content_access, user_has_metadata_access
 from zerver.lib.test_classes import ZulipTestCase
+from zerver.lib.test_helpers import queries_captured
 from zerver.lib.tex import render_tex
 from zerver.lib.types import UserGroupMembersData
 from zerver.lib.upload import get_emoji_url, upload_message_attachment
@@ -2862,6 +2866,67 @@ class MarkdownMentionTest(ZulipTestCase):
         )
         self.assertEqual(rendering_result.mentions_user_ids, {hamlet.id, cordelia.id})
 
+    def test_render_message_markdown_batch(self) -> None:
+        realm = get_realm("zulip")
+        othello = self.example_user("othello")
+        hamlet = self.example_user("hamlet")
+        self.make_stream("secret", invite_only=True)
+        self.subscribe(othello, "secret")
+        self.create_user_group_for_test("support")
+        contents = [
+            "@**King Hamlet** and @_*support*, see #**Denmark>foo**",
+            "@**Cordelia, Lear's daughter** :smile: @*support* #**secret**",
+            "@**all** in #**secret**",
+            "Nothing to look up here",
+        ]
+        messages = [
+            Message(sender=sender, sending_client=get_client("test"), realm=realm)
+            for sender in [othello, othello, hamlet, hamlet]
+        ]
+
+        with queries_captured() as queries:
+            expected = [
+                render_message_markdown(message, content)
+                for message, content in zip(messages, contents, strict=True)
+            ]
+        with queries_captured() as batch_queries:
+            results = render_message_markdown_batch(messages, realm, contents)
+        self.assertLess(len(batch_queries), len(queries))
+
+        for result, expected_result in zip(results, expected, strict=True):
+            self.assertEqual(result.rendered_content, expected_result.rendered_content)
+            self.assertEqual(result.mentions_user_ids, expected_result.mentions_user_ids)
+            self.assertEqual(
+                result.mentions_user_group_ids, expected_result.mentions_user_group_ids
+            )
+            self.assertEqual(
+                result.mentions_stream_wildcard, expected_result.mentions_stream_wildcard
+            )
+        # Hamlet cannot access the private channel which Othello linked.
+        self.assertIn('class="stream"', results[1].rendered_content)
+        self.assertNotIn('class="stream"', results[2].rendered_content)
+
+    def test_rerender_messages(self) -> None:
+        hamlet = self.example_user("hamlet")
+        message_ids = [
+            self.send_stream_message(
+                hamlet, "Denmark", f"**bold** @**Othello, the Moor of Venice** {i}"
+            )
+            for i in range(3)
+        ]
+        expected = {
+            message.id: message.rendered_content
+            for message in Message.objects.filter(id__in=message_ids)
+        }
+        Message.objects.filter(id__in=message_ids).update(
+            rendered_content="stale", rendered_content_version=None
+        )
+
+        rerender_messages(hamlet.realm, message_ids, batch_size=2)
+        for message in Message.objects.filter(id__in=message_ids):
+            self.assertEqual(message.rendered_content, expected[message.id])
+            self.assertEqual(message.rendered_content_version, markdown_version)
+
     def test_mention_in_quotes(self) -> None:
         othello = self.example_user("othello")
         hamlet = self.example_user("hamlet")
@@ -1621,7 +1621,7 @@ class MessageMoveStreamTest(ZulipTestCase):
             "iago", "test move stream", "new stream", "test"
         )
 
-        with self.assert_database_query_count(57), self.assert_memcached_count(19):
+        with self.assert_database_query_count(56), self.assert_memcached_count(23):
             result = self.client_patch(
                 f"/json/messages/{msg_id}",
                 {
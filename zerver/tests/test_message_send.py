@@ -5,6 +5,7 @@ from unittest import mock
 
 import orjson
 from django.conf import settings
+from django.db import connection
 from django.db.models import Q
 from django.test import override_settings
 from django.utils.timezone import now as timezone_now
@@ -41,6 +42,7 @@ from zerver.actions.user_groups import add_subgroups_to_user_group, check_add_us
 from zerver.actions.user_settings import do_change_user_setting
 from zerver.actions.users import do_change_can_forge_sender, do_deactivate_user
 from zerver.lib.addressee import Addressee
+from zerver.lib.cache import cache_delete, cache_get, stream_recipient_info_cache_key
 from zerver.lib.exceptions import (
     DirectMessageInitiationError,
     DirectMessagePermissionError,
@@ -51,7 +53,10 @@ from zerver.lib.exceptions import (
 from zerver.lib.message import get_raw_unread_data, get_recent_private_conversations
 from zerver.lib.message_cache import MessageDict
 from zerver.lib.per_request_cache import flush_per_request_caches
-from zerver.lib.stream_subscription import create_stream_subscription
+from zerver.lib.stream_subscription import (
+    create_stream_subscription,
+    get_stream_subscribers_for_send_message,
+)
 from zerver.lib.streams import create_stream_if_needed
 from zerver.lib.test_classes import ZulipTestCase
 from zerver.lib.test_helpers import (
@@ -64,6 +69,7 @@ from zerver.lib.test_helpers import (
 )
 from zerver.lib.timestamp import datetime_to_timestamp
 from zerver.lib.types import UserGroupMembersData
+from zerver.lib.user_message import UserMessageLite, bulk_insert_ums
 from zerver.models import (
     Message,
     NamedUserGroup,
@@ -1902,6 +1908,67 @@ class StreamMessagesTest(ZulipTestCase):
         num_active_users = num_extra_users / 2
         self.assertTrue(ums_created > (num_active_users * num_messages))
 
+    def test_bulk_copy_user_messages(self) -> None:
+        sender = self.example_user("hamlet")
+
+        def user_message_flags(message_id: int) -> dict[int, int]:
+            return dict(
+                UserMessage.objects.filter(message_id=message_id).values_list(
+                    "user_profile_id", "flags"
+                )
+            )
+
+        inserted_message_id = self.send_stream_message(sender, "Verona")
+        with mock.patch("zerver.lib.user_message.BULK_INSERT_UMS_COPY_THRESHOLD", 1):
+            message_id = self.send_stream_message(sender, "Verona")
+        self.assertGreater(len(user_message_flags(message_id)), 1)
+        self.assertEqual(user_message_flags(message_id), user_message_flags(inserted_message_id))
+
+        # Rows which already exist are skipped, as with INSERT.
+        with mock.patch("zerver.lib.user_message.BULK_INSERT_UMS_COPY_THRESHOLD", 1):
+            bulk_insert_ums(
+                [UserMessageLite(user_profile_id=sender.id, message_id=message_id, flags=0)]
+            )
+        self.assertTrue(
+            UserMessage.objects.get(user_profile=sender, message_id=message_id).flags.read
+        )
+
+        # The temporary table is reused within the transaction, but
+        # nothing is left in it for the next call.
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM zerver_usermessage_copy")
+            self.assertEqual(cursor.fetchone(), (0,))
+
+    def test_stream_subscribers_cache_chunks(self) -> None:
+        realm = get_realm("zulip")
+        stream = get_stream("Verona", realm)
+        assert stream.recipient_id is not None
+
+        # Large channels are cached in several chunks, under their
+        # own keys.
+        with mock.patch(
+            "zerver.lib.stream_subscription.SEND_MESSAGE_SUBSCRIBERS_CACHE_CHUNK_SIZE", 2
+        ):
+            with self.assert_database_query_count(1):
+                user_ids, packed_rows = get_stream_subscribers_for_send_message(
+                    realm.id, stream.recipient_id
+                )
+            self.assertGreater(len(user_ids), 4)
+            self.assertEqual(list(user_ids), sorted(user_ids))
+            key = stream_recipient_info_cache_key(realm.id, stream.recipient_id)
+            self.assertEqual(cache_get(key)[0][0], (len(user_ids) + 1) // 2)
+            self.assertIsNotNone(cache_get(f"{key}:1"))
+
+            with self.assert_database_query_count(0, keep_cache_warm=True):
+                cached = get_stream_subscribers_for_send_message(realm.id, stream.recipient_id)
+            self.assertEqual(cached, (user_ids, packed_rows))
+
+            # A missing chunk means fetching them all again.
+            cache_delete(f"{key}:1")
+            with self.assert_database_query_count(1, keep_cache_warm=True):
+                refetched = get_stream_subscribers_for_send_message(realm.id, stream.recipient_id)
+            self.assertEqual(refetched, (user_ids, packed_rows))
+
     def test_not_too_many_queries(self) -> None:
         recipient_list = [
             self.example_user("hamlet"),
@@ -1929,7 +1996,9 @@ class StreamMessagesTest(ZulipTestCase):
         # caches don't come into play. If we count queries while caches are
         # filled, we will get a lower count. Caches are not supposed to be
         # persistent, so our test can also fail if cache is invalidated
-        # during the course of the unit test.
+        # during the course of the unit test.  The channel's cached
+        # subscriber data is warm after the first message, saving a query
+        # for each later one.
         flush_per_request_caches()
         do_change_user_setting(
             user_profile=sender,
@@ -1957,7 +2026,7 @@ class StreamMessagesTest(ZulipTestCase):
         # 5 queries: 1 to check if it is the first message in the topic +
         # 1 to check if the topic is already followed + 3 to follow the topic.
         flush_per_request_caches()
-        with self.assert_database_query_count(20):
+        with self.assert_database_query_count(19):
             check_send_stream_message(
                 sender=sender,
                 client=sending_client,
@@ -1977,7 +2046,7 @@ class StreamMessagesTest(ZulipTestCase):
         # a message to a topic with visibility policy other than FOLLOWED.
         # 1 to check if the topic is already followed + 3 queries to follow the topic.
         flush_per_request_caches()
-        with self.assert_database_query_count(19):
+        with self.assert_database_query_count(18):
             check_send_stream_message(
                 sender=sender,
                 client=sending_client,
@@ -1988,7 +2057,7 @@ class StreamMessagesTest(ZulipTestCase):
         # If the topic is already FOLLOWED, there will be an increase in the query
         # count of 1 to check if the topic is already followed.
         flush_per_request_caches()
-        with self.assert_database_query_count(16):
+        with self.assert_database_query_count(15):
             check_send_stream_message(
                 sender=sender,
                 client=sending_client,
@@ -2013,7 +2082,7 @@ class StreamMessagesTest(ZulipTestCase):
         # 1 to get the user_id of the mentioned user + 1 to check if the topic
         # is already followed + 3 queries to follow the topic.
         flush_per_request_caches()
-        with self.assert_database_query_count(24):
+        with self.assert_database_query_count(23):
             check_send_stream_message(
                 sender=sender,
                 client=sending_client,
@@ -2026,7 +2095,7 @@ class StreamMessagesTest(ZulipTestCase):
         # 1 to get the user_id of the mentioned user + 1 to check if the topic is
         # already followed.
         flush_per_request_caches()
-        with self.assert_database_query_count(21):
+        with self.assert_database_query_count(20):
             check_send_stream_message(
                 sender=sender,
                 client=sending_client,
@@ -2036,7 +2105,7 @@ class StreamMessagesTest(ZulipTestCase):
             )
 
         flush_per_request_caches()
-        with self.assert_database_query_count(18):
+        with self.assert_database_query_count(17):
             check_send_stream_message(
                 sender=sender,
                 client=sending_client,
@@ -2059,7 +2128,7 @@ class StreamMessagesTest(ZulipTestCase):
         )
         flush_per_request_caches()
 
-        with self.assert_database_query_count(19):
+        with self.assert_database_query_count(18):
             check_send_stream_message(
                 sender=sender,
                 client=sending_client,
@@ -1,16 +1,27 @@
 import time
+from contextlib import redirect_stdout
+from io import StringIO
 from unittest.mock import patch
 
 from bs4 import BeautifulSoup
-from django.http import HttpResponse
+from django.core.management import call_command
+from django.http import HttpRequest, HttpResponse
+from django.test import override_settings
+from typing_extensions import override
 
 from zerver.actions.realm_settings import do_set_realm_property
 from zerver.lib.realm_icon import get_realm_icon_url
 from zerver.lib.request import RequestNotes
+from zerver.lib.request_profiling import (
+    clear_request_profiles,
+    fingerprint_query,
+    get_request_profiles,
+)
 from zerver.lib.test_classes import ZulipTestCase
 from zerver.lib.test_helpers import HostRequestMock
 from zerver.lib.utils import assert_is_not_none
 from zerver.middleware import LogRequests, is_slow_query, write_log_line
+from zerver.models import UserProfile
 from zerver.models.realms import get_realm
 from zilencer.models import RemoteZulipServer
 
@@ -212,3 +223,82 @@ class LogRequestsTest(ZulipTestCase):
         with self.assertLogs("zulip.requests", level="INFO") as m:
             LogRequests(lambda _: HttpResponse())(request)
             self.assertIn(expected_requester, m.output[0])
+
+
+class RequestProfilingTest(ZulipTestCase):
+    @override
+    def setUp(self) -> None:
+        super().setUp()
+        clear_request_profiles()
+
+    def test_fingerprint_query(self) -> None:
+        self.assertEqual(
+            fingerprint_query(
+                """SELECT "zerver_userprofile"."id" FROM "zerver_userprofile"
+                WHERE ("zerver_userprofile"."realm_id" = %s AND "zerver_userprofile"."id" IN (%s, %s, %s))
+                LIMIT 21"""
+            ),
+            'SELECT "zerver_userprofile"."id" FROM "zerver_userprofile" '
+            'WHERE ("zerver_userprofile"."realm_id" = ? AND "zerver_userprofile"."id" IN (...)) '
+            "LIMIT ?",
+        )
+        self.assertEqual(
+            fingerprint_query("SELECT 'it''s' WHERE id = ANY(ARRAY[1, 2]) AND x = %(x)s"),
+            "SELECT ? WHERE id = ANY(ARRAY[...]) AND x = ?",
+        )
+
+    @override_settings(REQUEST_PROFILING_PATHS=["/json/users/me"])
+    def test_profile_request(self) -> None:
+        hamlet = self.example_user("hamlet")
+        self.login_user(hamlet)
+        self.client_get("/json/users/me")
+        self.client_get("/json/realm/emoji")
+
+        [profile] = get_request_profiles()
+        self.assertEqual(profile["path"], "/json/users/me")
+        self.assertEqual(profile["user_id"], hamlet.id)
+        self.assertEqual(profile["status_code"], 200)
+        self.assertNotEqual(profile["queries"], [])
+        self.assertTrue(all("%s" not in query["sql"] for query in profile["queries"]))
+        self.assertIn("user_profile_narrow_by_id", profile["cache"])
+
+        stdout = StringIO()
+        with redirect_stdout(stdout):
+            call_command("request_profiles", "--clear")
+        self.assertIn("1 requests profiled.", stdout.getvalue())
+        self.assertIn("GET /json/users/me", stdout.getvalue())
+        self.assertEqual(get_request_profiles(), [])
+
+    def test_profile_requests_by_user(self) -> None:
+        othello = self.example_user("othello")
+        with override_settings(REQUEST_PROFILING_USER_IDS=[othello.id]):
+            self.login("hamlet")
+            self.client_get("/json/users/me")
+            self.assertEqual(get_request_profiles(), [])
+
+            self.login_user(othello)
+            self.client_get("/json/users/me")
+            [profile] = get_request_profiles()
+            self.assertEqual(profile["user_id"], othello.id)
+
+        # Nothing is profiled without either setting.
+        self.client_get("/json/users/me")
+        self.assert_length(get_request_profiles(), 1)
+
+    def test_n_plus_one_queries(self) -> None:
+        hamlet = self.example_user("hamlet")
+        with override_settings(REQUEST_PROFILING_USER_IDS=[hamlet.id]):
+            request = HostRequestMock(user_profile=hamlet, meta_data={"REMOTE_ADDR": "127.0.0.1"})
+            RequestNotes.get_notes(request).log_data = None
+
+            def view(request: HttpRequest) -> HttpResponse:
+                for user_id in range(1, 12):
+                    UserProfile.objects.filter(id=user_id).first()
+                return HttpResponse()
+
+            with self.assertLogs("zulip.requests", level="INFO"):
+                LogRequests(view)(request)
+
+        [profile] = get_request_profiles()
+        [query] = profile["n_plus_one"]
+        self.assertIn('WHERE "zerver_userprofile"."id" = ?', query)
@@ -1,3 +1,5 @@
+import threading
+import time
 from typing import Any
 from unittest import mock
 
@@ -14,15 +16,17 @@ from zerver.lib.outgoing_webhook import (
     SlackOutgoingWebhookService,
     do_rest_call,
     fail_with_message,
+    make_outgoing_webhook_session,
 )
 from zerver.lib.test_classes import ZulipTestCase
 from zerver.lib.topic import TOPIC_NAME
 from zerver.lib.url_encoding import message_link_url
 from zerver.lib.users import add_service
-from zerver.models import Recipient, Service, SubMessage, UserProfile
+from zerver.models import Recipient, Service, SubMessage, UserMessage, UserProfile
 from zerver.models.realms import get_realm
 from zerver.models.recipients import get_or_create_direct_message_group
 from zerver.models.streams import get_stream
+from zerver.worker.outgoing_webhooks import OutgoingWebhookWorker
 
 
 class ResponseMock:
@@ -745,3 +749,109 @@ class TestOutgoingWebhookMessaging(ZulipTestCase):
         # by the response_not_required option.
         last_message = self.get_last_message()
         self.assertEqual(last_message.id, stream_message_id)
+
+    @responses.activate
+    def test_concurrent_requests_per_bot(self) -> None:
+        bot_owner = self.example_user("othello")
+        bot = self.create_outgoing_bot(bot_owner)
+        sender = self.example_user("hamlet")
+
+        events: list[dict[str, Any]] = []
+        with mock.patch.object(OutgoingWebhookWorker, "consume_batch", side_effect=events.extend):
+            for i in range(6):
+                self.send_personal_message(sender, bot, content=f"message {i}")
+        self.assert_length(events, 6)
+
+        lock = threading.Lock()
+        in_flight = 0
+        max_in_flight = 0
+
+        def callback(request: requests.PreparedRequest) -> tuple[int, dict[str, str], bytes]:
+            nonlocal in_flight, max_in_flight
+            with lock:
+                in_flight += 1
+                max_in_flight = max(max_in_flight, in_flight)
+            time.sleep(0.05)
+            with lock:
+                in_flight -= 1
+            return (200, {}, orjson.dumps({"response_not_required": True}))
+
+        responses.add_callback(responses.POST, "https://bot.example.com/", callback=callback)
+        session_threads: list[int] = []
+
+        def make_session() -> requests.Session:
+            session_threads.append(threading.get_ident())
+            return make_outgoing_webhook_session()
+
+        worker = OutgoingWebhookWorker()
+        with (
+            mock.patch.object(OutgoingWebhookWorker, "MAX_CONCURRENT_REQUESTS_PER_BOT", 2),
+            mock.patch(
+                "zerver.worker.outgoing_webhooks.make_outgoing_webhook_session",
+                side_effect=make_session,
+            ),
+            self.assertLogs(level="INFO") as logs,
+        ):
+            worker.consume_batch(events)
+            worker.consume_batch(events)
+        # Each thread has its own session for the bot's URL, which it
+        # keeps using for later batches.
+        self.assertEqual(len(session_threads), len(set(session_threads)))
+
+        self.assert_length(responses.calls, 12)
+        self.assert_length(logs.output, 12)
+        self.assertEqual(max_in_flight, 2)
+        self.assertEqual(
+            sorted(orjson.loads(call.request.body or b"")["data"] for call in responses.calls),
+            [f"message {i}" for i in range(6)],
+        )
+
+    @responses.activate
+    def test_batch_failures_are_isolated(self) -> None:
+        bot_owner = self.example_user("othello")
+        bot = self.create_outgoing_bot(bot_owner)
+        other_bot = self.create_test_bot(
+            "other-outgoing-webhook",
+            bot_owner,
+            full_name="Other Outgoing Webhook bot",
+            bot_type=UserProfile.OUTGOING_WEBHOOK_BOT,
+            service_name="bar-service",
+            payload_url='"https://other-bot.example.com/"',
+        )
+        sender = self.example_user("hamlet")
+
+        events: list[dict[str, Any]] = []
+        with mock.patch.object(OutgoingWebhookWorker, "consume_batch", side_effect=events.extend):
+            bot_message_id = self.send_personal_message(sender, bot, content="hello")
+            other_bot_message_id = self.send_personal_message(sender, other_bot, content="hello")
+        # An event for a bot which no longer exists fails before its
+        # request is built.
+        events.insert(0, {**events[0], "user_profile_id": 0})
+
+        responses.add(responses.POST, "https://bot.example.com/", json={"content": "hi"})
+        responses.add(responses.POST, "https://other-bot.example.com/", json={"content": "hi"})
+
+        def fail_for_bot(
+            event: dict[str, Any], service_handler: Any, response: requests.Response
+        ) -> None:
+            if service_handler.user_profile.id == bot.id:
+                raise Exception("Unexpected failure")
+
+        with (
+            mock.patch(
+                "zerver.worker.outgoing_webhooks.process_response", side_effect=fail_for_bot
+            ) as mock_process_response,
+            self.assertLogs(level="INFO") as logs,
+        ):
+            OutgoingWebhookWorker().consume_batch(events)
+
+        self.assertEqual(mock_process_response.call_count, 2)
+        self.assertEqual(
+            [record.message for record in logs.records if record.levelname == "ERROR"],
+            ["Problem handling data on queue outgoing_webhooks"] * 2,
+        )
+        # Both bots' messages are still flagged as processed.
+        for bot_profile, message_id in [(bot, bot_message_id), (other_bot, other_bot_message_id)]:
+            self.assertTrue(
+                UserMessage.objects.get(user_profile=bot_profile, message_id=message_id).flags.read
+            )
@@ -7,7 +7,7 @@ from collections.abc import Callable, Iterator, Mapping
 from contextlib import contextmanager, suppress
 from datetime import datetime, timedelta, timezone
 from typing import Any, TypeAlias
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock, call, patch
 
 import orjson
 import time_machine
@@ -17,7 +17,7 @@ from django.test import override_settings
 from typing_extensions import override
 
 from zerver.lib.email_mirror_helpers import encode_email_address, get_channel_email_token
-from zerver.lib.queue import MAX_REQUEST_RETRIES
+from zerver.lib.queue import MAX_REQUEST_RETRIES, sharded_queue_name
 from zerver.lib.remote_server import PushNotificationBouncerRetryLaterError
 from zerver.lib.send_email import EmailNotDeliveredError, FromAddress
 from zerver.lib.test_classes import ZulipTestCase
@@ -29,6 +29,7 @@ from zerver.models.scheduled_jobs import NotificationTriggers
 from zerver.models.streams import get_stream
 from zerver.tornado.event_queue import build_offline_notification
 from zerver.worker import base as base_worker
+from zerver.worker.deferred_work import DeferredWorker
 from zerver.worker.email_mirror import MirrorWorker
 from zerver.worker.email_senders import ImmediateEmailSenderWorker
 from zerver.worker.embed_links import FetchLinksEmbedData
@@ -51,20 +52,24 @@ class FakeClient:
         self,
         queue_name: str,
         callback: Callable[[list[dict[str, Any]]], None],
-        batch_size: int = 1,
-        timeout: int | None = None,
+        batch_size: int | Callable[[], int] = 1,
+        timeout: float | None = None,
     ) -> None:
+        get_batch_size = batch_size if callable(batch_size) else lambda: batch_size
         chunk: list[dict[str, Any]] = []
         queue = self.queues[queue_name]
         while queue:
             chunk.append(queue.pop(0))
-            if len(chunk) >= batch_size or not len(queue):
+            if len(chunk) >= get_batch_size() or not len(queue):
                 callback(chunk)
                 chunk = []
 
     def local_queue_size(self) -> int:
         return sum(len(q) for q in self.queues.values())
 
+    def set_prefetch(self, prefetch: int) -> None:
+        pass
+
 
 @contextmanager
 def simulated_queue_client(client: FakeClient) -> Iterator[None]:
@@ -285,7 +290,7 @@ class WorkerTest(ZulipTestCase):
             self.assertEqual(row.scheduled_timestamp, scheduled_timestamp)
             self.assertEqual(row.mentioned_user_group_id, mentioned_user_group_id)
 
-        def advance() -> float | None:
+        def advance() -> datetime | None:
             mmw.stopping = False
 
             def inner(check: Callable[[], bool], timeout: float | None) -> bool:
@@ -301,13 +306,13 @@ class WorkerTest(ZulipTestCase):
 
             with patch.object(mmw.cv, "wait_for", side_effect=inner):
                 mmw.work()
-            return mmw.has_timeout
+            return mmw.next_due
 
         # With nothing enqueued, the condition variable is pending
         # forever.  We double-check that the condition is false in
         # steady-state.
-        has_timeout = advance()
-        self.assertFalse(has_timeout)
+        next_due = advance()
+        self.assertIsNone(next_due)
 
         # Enqueues the events to the internal queue, as if from RabbitMQ
         time_zero = datetime(2021, 1, 1, tzinfo=timezone.utc)
@@ -317,20 +322,20 @@ class WorkerTest(ZulipTestCase):
         ):
             for event in events:
                 mmw.consume_single_event(event)
-        # All of these notify, because has_timeout is still false in
+        # All of these notify, because next_due is still None in
         # each case.  This represents multiple consume() calls getting
         # the lock before the worker escapes the wait_for, and is
         # unlikely in real life but does not lead to incorrect
         # behaviour.
         self.assertEqual(notify_mock.call_count, 3)
 
-        # This leaves a timeout set, since there are objects pending
-        with time_machine.travel(time_zero, tick=False):
-            has_timeout = advance()
-        self.assertTrue(has_timeout)
-
         expected_scheduled_timestamp = time_zero + batch_duration
 
+        # This leaves a timeout set, until the objects pending are due
+        with time_machine.travel(time_zero, tick=False):
+            next_due = advance()
+        self.assertEqual(next_due, expected_scheduled_timestamp)
+
         # The events should be saved in the database
         hamlet_row1 = ScheduledMessageNotificationEmail.objects.get(
             user_profile_id=hamlet.id, message_id=hamlet1_msg_id
@@ -359,8 +364,8 @@ class WorkerTest(ZulipTestCase):
         self.assertEqual(notify_mock.call_count, 0)
 
         with time_machine.travel(few_moments_later, tick=False):
-            has_timeout = advance()
-        self.assertTrue(has_timeout)
+            next_due = advance()
+        self.assertEqual(next_due, expected_scheduled_timestamp)
         hamlet_row3 = ScheduledMessageNotificationEmail.objects.get(
             user_profile_id=hamlet.id, message_id=hamlet3_msg_id
         )
@@ -370,8 +375,8 @@ class WorkerTest(ZulipTestCase):
         # If called too early, it shouldn't process the emails.
         one_minute_premature = expected_scheduled_timestamp - timedelta(seconds=60)
         with time_machine.travel(one_minute_premature, tick=False):
-            has_timeout = advance()
-        self.assertTrue(has_timeout)
+            next_due = advance()
+        self.assertEqual(next_due, expected_scheduled_timestamp)
         self.assertEqual(ScheduledMessageNotificationEmail.objects.count(), 4)
 
         # If called after `expected_scheduled_timestamp`, it should process all emails.
@@ -381,11 +386,11 @@ class WorkerTest(ZulipTestCase):
             send_mock as sm,
             self.assertLogs(level="INFO") as info_logs,
         ):
-            has_timeout = advance()
-            self.assertTrue(has_timeout)
+            next_due = advance()
+            self.assertEqual(next_due, expected_scheduled_timestamp)
             self.assertEqual(ScheduledMessageNotificationEmail.objects.count(), 0)
-            has_timeout = advance()
-            self.assertFalse(has_timeout)
+            next_due = advance()
+            self.assertIsNone(next_due)
 
         self.assertEqual(
             [
@@ -430,14 +435,20 @@ class WorkerTest(ZulipTestCase):
         # raise `IntegrityError` by mocking.
         with (
             patch(
-                "zerver.models.ScheduledMessageNotificationEmail.objects.create",
+                "zerver.models.ScheduledMessageNotificationEmail.objects.bulk_create",
                 side_effect=IntegrityError,
             ),
+            patch(
+                "zerver.models.ScheduledMessageNotificationEmail.objects.create",
+                side_effect=[IntegrityError, ScheduledMessageNotificationEmail()],
+            ) as create_mock,
             self.assertLogs(level="DEBUG") as debug_logs,
             patch.object(mmw.cv, "notify") as notify_mock,
         ):
-            mmw.consume_single_event(hamlet_event1)
-            self.assertEqual(notify_mock.call_count, 0)
+            mmw.do_consume(mmw.consume_batch, [hamlet_event1, othello_event])
+            # The rows are retried one at a time, skipping the failed one.
+            self.assertEqual(create_mock.call_count, 2)
+            self.assertEqual(notify_mock.call_count, 1)
             self.assertIn(
                 "DEBUG:root:ScheduledMessageNotificationEmail row could not be created. The message may have been deleted. Skipping event.",
                 debug_logs.output,
@@ -456,8 +467,8 @@ class WorkerTest(ZulipTestCase):
             mmw.consume_single_event(othello_event)
             # See above note about multiple notifies
             self.assertEqual(notify_mock.call_count, 3)
-            has_timeout = advance()
-            self.assertTrue(has_timeout)
+            next_due = advance()
+            self.assertEqual(next_due, expected_scheduled_timestamp)
 
         # Next, set up a fail-y consumer:
         def fail_some(user: UserProfile, *args: Any) -> None:
@@ -471,11 +482,11 @@ class WorkerTest(ZulipTestCase):
             send_mock as sm,
         ):
             sm.side_effect = fail_some
-            has_timeout = advance()
-            self.assertTrue(has_timeout)
+            next_due = advance()
+            self.assertEqual(next_due, expected_scheduled_timestamp)
             self.assertEqual(ScheduledMessageNotificationEmail.objects.count(), 0)
-            has_timeout = advance()
-            self.assertFalse(has_timeout)
+            next_due = advance()
+            self.assertIsNone(next_due)
         self.assertIn(
             "ERROR:root:Failed to process 2 missedmessage_emails for user 10",
             error_logs.output[0],
@@ -598,6 +609,92 @@ class WorkerTest(ZulipTestCase):
                     "WARNING:zerver.worker.missedmessage_mobile_notifications:Maximum retries exceeded for device_id:3 event:register_push_device_to_bouncer",
                 )
 
+    def test_push_notifications_worker_coalesces_removes(self) -> None:
+        fake_client = FakeClient()
+        hamlet = self.example_user("hamlet")
+        cordelia = self.example_user("cordelia")
+        events = [
+            {"type": "remove", "user_profile_id": hamlet.id, "message_ids": [1, 2]},
+            build_offline_notification(hamlet.id, 3),
+            {"type": "remove", "user_profile_id": cordelia.id, "message_ids": [4]},
+            {"type": "remove", "user_profile_id": hamlet.id, "message_ids": [2, 5]},
+        ]
+        for event in events:
+            fake_client.enqueue("missedmessage_mobile_notifications", event)
+
+        calls: list[tuple[str, int]] = []
+        with (
+            simulated_queue_client(fake_client),
+            patch(
+                "zerver.worker.missedmessage_mobile_notifications.handle_push_notification",
+                side_effect=lambda user_id, event: calls.append(("new", user_id)),
+            ),
+            patch(
+                "zerver.worker.missedmessage_mobile_notifications.handle_remove_push_notification"
+            ) as mock_handle_remove,
+            patch("zerver.worker.missedmessage_mobile_notifications.initialize_push_notifications"),
+        ):
+            mock_handle_remove.side_effect = lambda user_id, message_ids: calls.append(
+                ("remove", user_id)
+            )
+            worker = PushNotificationsWorker()
+            worker.setup()
+            worker.start()
+
+        # Hamlet's two remove events are sent as one, in place of the later.
+        self.assertEqual(
+            calls, [("new", hamlet.id), ("remove", cordelia.id), ("remove", hamlet.id)]
+        )
+        self.assertEqual(
+            mock_handle_remove.call_args_list,
+            [call(cordelia.id, [4]), call(hamlet.id, [1, 2, 5])],
+        )
+
+    def test_push_notifications_worker_isolates_failures(self) -> None:
+        fake_client = FakeClient()
+        hamlet = self.example_user("hamlet")
+        cordelia = self.example_user("cordelia")
+        events = [
+            build_offline_notification(hamlet.id, 1),
+            build_offline_notification(cordelia.id, 2),
+        ]
+        for event in events:
+            fake_client.enqueue("missedmessage_mobile_notifications", event)
+
+        def fail_for_hamlet(user_id: int, event: dict[str, Any]) -> None:
+            if user_id == hamlet.id:
+                raise Exception("Unexpected failure")
+
+        fn = os.path.join(settings.QUEUE_ERROR_DIR, "missedmessage_mobile_notifications.errors")
+        with suppress(FileNotFoundError):
+            os.remove(fn)
+
+        with (
+            simulated_queue_client(fake_client),
+            patch(
+                "zerver.worker.missedmessage_mobile_notifications.handle_push_notification",
+                side_effect=fail_for_hamlet,
+            ) as mock_handle_new,
+            patch("zerver.worker.missedmessage_mobile_notifications.initialize_push_notifications"),
+            self.assertLogs(level="ERROR") as error_logs,
+        ):
+            worker = PushNotificationsWorker()
+            worker.setup()
+            worker.start()
+
+        # Cordelia's notification is still sent after Hamlet's fails.
+        self.assertEqual(
+            mock_handle_new.call_args_list,
+            [call(hamlet.id, events[0]), call(cordelia.id, events[1])],
+        )
+        self.assertEqual(
+            error_logs.records[0].message,
+            "Problem handling data on queue missedmessage_mobile_notifications",
+        )
+        with open(fn) as f:
+            line = f.readline().strip()
+        self.assertEqual(orjson.loads(line.split("\t")[1]), [events[0]])
+
     @patch("zerver.worker.email_mirror.mirror_email")
     def test_mirror_worker(self, mock_mirror_email: MagicMock) -> None:
         fake_client = FakeClient()
@@ -819,6 +916,68 @@ class WorkerTest(ZulipTestCase):
                     "Timed out in timeout_worker after 1 seconds while fetching URLs for message 15: ['first', 'second']",
                 )
 
+    def test_adaptive_batching(self) -> None:
+        batches: list[int] = []
+
+        @base_worker.assign_queue("adaptive_worker", is_test_queue=True)
+        class AdaptiveWorker(base_worker.LoopQueueProcessingWorker):
+            ADAPTIVE_BATCHING = True
+            batch_size = 10
+            MAX_BATCH_SIZE = 40
+
+            @override
+            def consume_batch(self, events: list[dict[str, Any]]) -> None:
+                batches.append(len(events))
+
+        fake_client = FakeClient()
+        for i in range(200):
+            fake_client.enqueue("adaptive_worker", {"i": i})
+
+        with simulated_queue_client(fake_client):
+            worker = AdaptiveWorker()
+            worker.setup()
+            worker.start()
+
+        # Consuming is fast, so the batch size doubles up to its maximum
+        # while there's a backlog.
+        self.assertEqual(batches, [10, 20, 40, 40, 40, 40, 10])
+        self.assertEqual(worker.batch_size, 40)
+        self.assertEqual(worker.prefetch, 1000)
+
+        with open(os.path.join(settings.QUEUE_STATS_DIR, "adaptive_worker.stats")) as f:
+            stats = orjson.loads(f.read())
+        self.assertEqual(stats["batch_size"], 40)
+        self.assertEqual(stats["prefetch"], 1000)
+        self.assertEqual(
+            [(d["batch_size"], d["prefetch"]) for d in stats["recent_tuning_decisions"]],
+            [(20, 200), (40, 400), (40, 800), (40, 1000)],
+        )
+
+        # Slow batches halve the batch size and prefetch, down to their
+        # minimums, whether or not there's a backlog.
+        worker.recent_consume_times.extend([(40, 20.0)] * 50)
+        self.assertTrue(worker.autotune_batching(0))
+        self.assertEqual((worker.batch_size, worker.prefetch), (20, 500))
+        for _ in range(5):
+            worker.autotune_batching(0)
+        self.assertEqual((worker.batch_size, worker.prefetch), (10, 20))
+        self.assertFalse(worker.autotune_batching(0))
+
+    def test_sharded_queues(self) -> None:
+        self.assertEqual(sharded_queue_name("deferred_work", 7), "deferred_work")
+        self.assertEqual(DeferredWorker(worker_num=3).queue_name, "deferred_work")
+
+        with override_settings(QUEUE_SHARDS={"deferred_work": 4}):
+            # Events for the same key always go to the same shard.
+            self.assertEqual(sharded_queue_name("deferred_work", 7), "deferred_work_shard4")
+            self.assertEqual(sharded_queue_name("deferred_work", 11), "deferred_work_shard4")
+            self.assertEqual(sharded_queue_name("deferred_work", 8), "deferred_work_shard1")
+            self.assertEqual(sharded_queue_name("embed_links", 7), "embed_links")
+
+            # Each numbered worker consumes its own shard.
+            self.assertEqual(DeferredWorker(worker_num=4).queue_name, "deferred_work_shard4")
+            self.assertEqual(DeferredWorker().queue_name, "deferred_work")
+
     def test_worker_noname(self) -> None:
         class TestWorker(base_worker.QueueProcessingWorker):
             def __init__(self) -> None:
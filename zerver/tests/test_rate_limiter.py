@@ -6,6 +6,7 @@ from unittest import mock
 from typing_extensions import override
 
 from zerver.lib.rate_limiter import (
+    LocalBudgetRateLimiterBackend,
     RateLimitedIPAddr,
     RateLimitedObject,
     RateLimitedUser,
@@ -186,6 +187,71 @@ class RedisRateLimiterBackendTest(RateLimiterBackendBase):
         self.make_request(obj, expect_ratelimited=True, verify_api_calls_left=False)
 
 
+class LocalBudgetRateLimiterBackendTest(ZulipTestCase):
+    @override
+    def setUp(self) -> None:
+        super().setUp()
+        LocalBudgetRateLimiterBackend.budgets.clear()
+        LocalBudgetRateLimiterBackend.last_report_time = time.time()
+
+    def test_local_budget(self) -> None:
+        obj = RateLimitedTestObject("local", [(60, 20)], LocalBudgetRateLimiterBackend)
+        obj.clear_history()
+        now = time.time()
+        with (
+            self.settings(RATE_LIMITING_LOCAL_BUDGET=5),
+            mock.patch("time.time", return_value=now),
+            mock.patch.object(
+                LocalBudgetRateLimiterBackend,
+                "run_script",
+                wraps=LocalBudgetRateLimiterBackend.run_script,
+            ) as run_script,
+        ):
+            # The first request goes to Redis, which grants a budget
+            # of 5 more; the request after those goes to Redis again,
+            # and counts them too.
+            for i in range(7):
+                self.assertEqual(obj.rate_limit(), (False, 0.0))
+            self.assertEqual(run_script.call_count, 2)
+            self.assertEqual(obj.api_calls_left()[0], 20 - 7)
+
+            # Requests from the new budget are reported in bulk.
+            for i in range(3):
+                obj.rate_limit()
+            self.assertEqual(obj.api_calls_left()[0], 20 - 7)
+            LocalBudgetRateLimiterBackend.report_usage()
+            self.assertEqual(obj.api_calls_left()[0], 20 - 10)
+            self.assertEqual(run_script.call_count, 3)
+
+    def test_local_budget_near_limit(self) -> None:
+        obj = RateLimitedTestObject("local", [(60, 4)], LocalBudgetRateLimiterBackend)
+        obj.clear_history()
+        with (
+            self.settings(RATE_LIMITING_LOCAL_BUDGET=5),
+            mock.patch("time.time", return_value=time.time()),
+        ):
+            # The budget shrinks as the limit approaches, so the limit
+            # is still enforced.
+            for i in range(4):
+                self.assertFalse(obj.rate_limit()[0])
+            self.assertTrue(obj.rate_limit()[0])
+            self.assertEqual(obj.api_calls_left()[0], 0)
+
+    def test_strict_domains(self) -> None:
+        user_profile = self.example_user("hamlet")
+        self.assertEqual(RateLimitedUser(user_profile).backend, RedisRateLimiterBackend)
+        with self.settings(RATE_LIMITING_LOCAL_BUDGET=5):
+            self.assertEqual(RateLimitedUser(user_profile).backend, LocalBudgetRateLimiterBackend)
+            self.assertEqual(
+                RateLimitedUser(user_profile, domain="email_change_by_user").backend,
+                RedisRateLimiterBackend,
+            )
+            self.assertEqual(
+                RateLimitedIPAddr("127.0.0.1", domain="sends_email_by_ip").backend,
+                RedisRateLimiterBackend,
+            )
+
+
 class RateLimitedObjectsTest(ZulipTestCase):
     def test_user_rate_limits(self) -> None:
         user_profile = self.example_user("hamlet")
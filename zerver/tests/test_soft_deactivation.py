@@ -18,7 +18,7 @@ from zerver.lib.soft_deactivation import (
     queue_soft_reactivation,
     reactivate_user_if_soft_deactivated,
 )
-from zerver.lib.stream_subscription import get_subscriptions_for_send_message
+from zerver.lib.stream_subscription import get_subscription_rows_for_send_message
 from zerver.lib.test_classes import ZulipTestCase
 from zerver.lib.test_helpers import get_subscription, get_user_messages, make_client
 from zerver.models import (
@@ -649,7 +649,10 @@ class SoftDeactivationMessageTest(ZulipTestCase):
         self.subscribe(cordelia, stream_name)
         self.subscribe(sender, stream_name)
 
-        stream_id = get_stream(stream_name, cordelia.realm).id
+        stream = get_stream(stream_name, cordelia.realm)
+        stream_id = stream.id
+        assert stream.recipient_id is not None
+        recipient_id = stream.recipient_id
 
         def send_stream_message(content: str) -> None:
             self.send_stream_message(sender, stream_name, content, topic_name)
@@ -690,8 +693,9 @@ class SoftDeactivationMessageTest(ZulipTestCase):
         ) -> None:
             self.assertEqual(
                 len(
-                    get_subscriptions_for_send_message(
+                    get_subscription_rows_for_send_message(
                         realm_id=realm_id,
+                        recipient_id=recipient_id,
                         stream_id=stream_id,
                         topic_name=topic_name,
                         possible_stream_wildcard_mention=possible_stream_wildcard_mention,
@@ -1,5 +1,6 @@
 import asyncio
 import socket
+from collections import Counter
 from collections.abc import AsyncIterator, Iterator
 from contextlib import asynccontextmanager, contextmanager
 from typing import Any, TypeVar
@@ -24,6 +25,7 @@ from zerver.models import UserProfile
 from zerver.tornado import event_queue
 from zerver.tornado.application import create_tornado_application
 from zerver.tornado.event_queue import process_event
+from zerver.tornado.sharding import get_user_id_tornado_port
 
 T = TypeVar("T")
 
@@ -227,3 +229,50 @@ class ErrorHandlingTestCase(TornadoWebTestCase):
                 {"result": "error", "msg": "Internal server error"},
             )
             self.assertIn("Internal Server Error: /json/events", error_log.output[0])
+
+
+class TornadoMetricsTestCase(TornadoWebTestCase):
+    async def test_metrics(self) -> None:
+        async with self.with_tornado():
+            await sync_to_async(lambda: self.login_user(self.example_user("hamlet")))()
+            await self.create_queue()
+            response = await self.fetch_async("GET", "/api/internal/tornado_metrics")
+            self.assertEqual(response.code, 200)
+            self.assertTrue(response.headers["Content-Type"].startswith("text/plain"))
+            body = response.body.decode()
+            self.assertIn(f"tornado_event_queues {float(len(event_queue.clients))}\n", body)
+            self.assertIn("# TYPE tornado_ioloop_lag_seconds histogram\n", body)
+            self.assertIn("# TYPE tornado_notification_processing_seconds histogram\n", body)
+
+            response = await self.fetch_async(
+                "POST", "/api/internal/tornado_metrics", body="", raise_error=False
+            )
+            self.assertEqual(response.code, 405)
+
+
+class TornadoShardingTest(ZulipTestCase):
+    def test_get_user_id_tornado_port(self) -> None:
+        self.assertEqual(get_user_id_tornado_port([9800], 17), 9800)
+
+        ports = [9800, 9801, 9802]
+        user_ids = range(1, 3001)
+        assignments = {user_id: get_user_id_tornado_port(ports, user_id) for user_id in user_ids}
+        # The order in which the ports are listed doesn't matter.
+        self.assertEqual(get_user_id_tornado_port([9802, 9800, 9801], 17), assignments[17])
+
+        # Users are spread roughly evenly across the ports.
+        port_counts = Counter(assignments.values())
+        self.assertEqual(set(port_counts), set(ports))
+        for port in ports:
+            self.assertGreater(port_counts[port], 700)
+
+        # Adding a port only moves users onto that new port, and
+        # leaves most users where they were.
+        new_assignments = {
+            user_id: get_user_id_tornado_port([*ports, 9803], user_id) for user_id in user_ids
+        }
+        moved_user_ids = [
+            user_id for user_id in user_ids if new_assignments[user_id] != assignments[user_id]
+        ]
+        self.assertEqual({new_assignments[user_id] for user_id in moved_user_ids}, {9803})
+        self.assertLess(len(moved_user_ids), 1100)
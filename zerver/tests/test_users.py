@@ -3302,6 +3302,36 @@ class BulkUsersTest(ZulipTestCase):
             assert_is_not_none(get_hamlet_avatar(client_gravatar=False)),
         )
 
+    def test_streamed_users(self) -> None:
+        def get_members(result: Any) -> list[dict[str, Any]]:
+            members = self.assert_json_success(result)["members"]
+            return sorted(members, key=lambda member: member["user_id"])
+
+        def check_streamed(params: dict[str, str]) -> None:
+            expected = get_members(self.client_get("/json/users", params))
+            with (
+                mock.patch("zerver.views.users.STREAMING_USERS_MIN_COUNT", 0),
+                mock.patch("zerver.lib.response.StreamingJsonResponse.CHUNK_SIZE", 3),
+            ):
+                result = self.client_get("/json/users", params)
+            self.assertTrue(result.streaming)
+            self.assertEqual(get_members(result), expected)
+
+        self.login("hamlet")
+        check_streamed({})
+        check_streamed({"include_custom_profile_fields": "true", "client_gravatar": "false"})
+        with self.settings(PARTIAL_USERS=True):
+            check_streamed({})
+
+        # Guests only get the users they can access.
+        self.set_up_db_for_testing_user_access()
+        self.login("polonius")
+        check_streamed({"include_custom_profile_fields": "true"})
+
+        with mock.patch("zerver.views.users.STREAMING_USERS_MIN_COUNT", 0):
+            result = self.client_get("/json/users", {"invalid_param": "1"})
+        self.assert_json_success(result, ignored_parameters=["invalid_param"])
+
 
 class GetProfileTest(ZulipTestCase):
     def test_cache_behavior(self) -> None:
@@ -3591,7 +3621,7 @@ class GetProfileTest(ZulipTestCase):
         self.set_up_db_for_testing_user_access()
 
         self.login("polonius")
-        with self.assert_database_query_count(7):
+        with self.assert_database_query_count(8):
             result = orjson.loads(self.client_get("/json/users").content)
         accessible_users = result["members"]
         # The user can access 3 bot users and 7 human users.
@@ -3753,7 +3783,7 @@ class GetProfileTest(ZulipTestCase):
             result = self.client_get(f"/json/users/{user.id}")
             self.assert_json_error(result, "Insufficient permission")
 
-        with self.settings(PARTIAL_USERS=True), self.assert_database_query_count(7):
+        with self.settings(PARTIAL_USERS=True), self.assert_database_query_count(8):
             result = self.client_get("/json/users")
         self.assert_json_success(result)
 
@@ -3863,7 +3893,7 @@ class GetProfileTest(ZulipTestCase):
                 status_code=401,
             )
 
-        with self.assert_database_query_count(4):
+        with self.assert_database_query_count(5):
             result = self.client_get("/json/users")
         self.assert_json_success(result)
         result_dict = orjson.loads(result.content)
@@ -3886,7 +3916,7 @@ class GetProfileTest(ZulipTestCase):
             user_ids_to_fetch,
         )
 
-        with self.settings(PARTIAL_USERS=True), self.assert_database_query_count(4):
+        with self.settings(PARTIAL_USERS=True), self.assert_database_query_count(5):
             result = self.client_get("/json/users")
         self.assert_json_success(result)
         result_dict = orjson.loads(result.content)
@@ -3914,7 +3944,7 @@ class GetProfileTest(ZulipTestCase):
         # A spectator passing the flag must not trigger the extra query
         # for custom profile field values, and the response must not
         # contain profile_data for any user.
-        with self.assert_database_query_count(4):
+        with self.assert_database_query_count(5):
             result = self.client_get("/json/users", {"include_custom_profile_fields": "true"})
         self.assert_json_success(result)
         self.assertNotIn(sentinel_value, result.content.decode())
@@ -14,8 +14,11 @@ from requests.models import PreparedRequest, Response
 from typing_extensions import override
 from urllib3.util import Retry
 
+from zerver.lib.cache import flush_realm_state_snapshots
 from zerver.lib.partial import partial
 from zerver.lib.queue import queue_json_publish_rollback_unsafe
+from zerver.lib.realm_state_snapshot import REALM_STATE_SNAPSHOT_EVENT_TYPES
+from zerver.lib.state_versions import STATE_VERSION_EVENT_TYPES, record_state_changes_for_event
 from zerver.models import Client, Realm, UserProfile
 from zerver.models.users import get_user_profile_narrow_by_id
 from zerver.tornado.sharding import (
@@ -220,6 +223,11 @@ def send_event_rollback_unsafe(
 ) -> None:
     """`users` is a list of user IDs, or in some special cases like message
     send/update or embeds, dictionaries containing extra data."""
+    if event["type"] in REALM_STATE_SNAPSHOT_EVENT_TYPES:
+        flush_realm_state_snapshots(realm.id)
+    if event["type"] in STATE_VERSION_EVENT_TYPES:
+        record_state_changes_for_event(realm.id, event)
+
     realm_ports = get_realm_tornado_ports(realm)
     if len(realm_ports) == 1:
         port_user_map = {realm_ports[0]: list(users)}
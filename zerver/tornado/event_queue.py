@@ -1,23 +1,35 @@
 # See https://zulip.readthedocs.io/en/latest/subsystems/events-system.html for
 # high-level documentation on how this system works.
 import copy
+import heapq
 import logging
 import os
 import random
+import struct
 import time
 import traceback
 import uuid
 from collections import deque
-from collections.abc import Callable, Collection, Iterable, Mapping, MutableMapping, Sequence
+from collections.abc import (
+    Callable,
+    Collection,
+    Iterable,
+    Iterator,
+    Mapping,
+    MutableMapping,
+    Sequence,
+)
 from collections.abc import Set as AbstractSet
-from contextlib import suppress
+from contextlib import contextmanager, suppress
 from functools import cache
-from typing import Any, Literal, TypedDict, cast
+from typing import IO, Any, Literal, TypedDict, TypeVar, cast
 
 import orjson
 import tornado.ioloop
 from django.conf import settings
 from django.utils.translation import gettext as _
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
 from tornado import autoreload
 from typing_extensions import override
 
@@ -25,27 +37,41 @@ from version import API_FEATURE_LEVEL, ZULIP_MERGE_BASE, ZULIP_VERSION
 from zerver.lib.exceptions import JsonableError
 from zerver.lib.message_cache import MessageDict
 from zerver.lib.narrow_helpers import narrow_dataclasses_from_tuples
-from zerver.lib.narrow_predicate import build_narrow_predicate
+from zerver.lib.narrow_predicate import build_narrow_predicate, channel_operators
 from zerver.lib.notification_data import UserMessageNotificationsData
 from zerver.lib.queue import (
     mobile_notifications_queue_name,
     queue_json_publish_rollback_unsafe,
     retry_event,
+    sharded_queue_name,
 )
-from zerver.lib.topic import ORIG_TOPIC, TOPIC_NAME
+from zerver.lib.topic import ORIG_TOPIC, TOPIC_NAME, get_topic_from_message_info
 from zerver.middleware import async_request_timer_restart
 from zerver.models import CustomProfileField, Message
 from zerver.tornado.descriptors import clear_descriptor_by_handler_id, set_descriptor_by_handler_id
 from zerver.tornado.exceptions import BadEventQueueIdError
 from zerver.tornado.handlers import finish_handler, get_handler_by_id, handler_stats_string
+from zerver.tornado.metrics import (
+    gc_event_queues_seconds,
+    message_fanout_clients,
+    notification_processing_seconds,
+    registry,
+    start_ioloop_lag_probe,
+)
+
+KeyT = TypeVar("KeyT")
 
 # The idle timeout used to be a week, but we found that in that
 # situation, queues from dead browser sessions would grow quite large
 # due to the accumulation of message data in those queues.
 DEFAULT_EVENT_QUEUE_TIMEOUT_SECS = 60 * 10
-# We garbage-collect every minute; this is totally fine given that the
-# GC scan takes ~2ms with 1000 event queues.
+# We garbage-collect every minute.  Each pass only examines the queues
+# which are due to expire or be marked offline (see gc_schedule), and
+# yields the IOLoop after EVENT_QUEUE_GC_BUDGET_SECS, continuing on the
+# next IOLoop iteration, so that a burst of expirations does not stall
+# event delivery.
 EVENT_QUEUE_GC_FREQ_MSECS = 1000 * 60 * 1
+EVENT_QUEUE_GC_BUDGET_SECS = 0.005
 
 # Capped limit for how long a client can request an event queue
 # to live
@@ -111,6 +137,9 @@ class ClientDescriptor:
         self.current_client_name: str | None = None
         self.event_queue = event_queue
         self.event_types = event_types
+        # When this client is next due to be examined by
+        # gc_event_queues; None until it is added to the client dicts.
+        self.gc_check_time: float | None = None
         self.last_connection_time = time.time()
         self.apply_markdown = apply_markdown
         self.client_gravatar = client_gravatar
@@ -142,14 +171,14 @@ class ClientDescriptor:
             queue_timeout_secs = idle_queue_timeout
         self.queue_timeout = min(queue_timeout_secs, MAX_QUEUE_TIMEOUT_SECS)
 
-    def to_dict(self) -> dict[str, Any]:
+    def to_dict(self, include_events: bool = True) -> dict[str, Any]:
         # If you add a new key to this dict, make sure you add appropriate
         # migration code in from_dict or load_event_queues to account for
         # loading event queues that lack that key.
         return dict(
             user_profile_id=self.user_profile_id,
             realm_id=self.realm_id,
-            event_queue=self.event_queue.to_dict(),
+            event_queue=self.event_queue.to_dict(include_events),
             queue_timeout=self.queue_timeout,
             event_types=self.event_types,
             last_connection_time=self.last_connection_time,
@@ -215,14 +244,18 @@ class ClientDescriptor:
         ret.offline = d.get("offline", False)
         return ret
 
-    def add_event(self, event: Mapping[str, Any]) -> None:
+    def add_event(self, event: Mapping[str, Any], overlay: Mapping[str, Any] | None = None) -> None:
         if self.current_handler_id is not None:
             handler = get_handler_by_id(self.current_handler_id)
             if handler is not None:
                 assert handler._request is not None
                 async_request_timer_restart(handler._request)
 
-        self.event_queue.push(event)
+        self.event_queue.push(event, overlay)
+        if deferred_finish_clients is not None:
+            if self.current_handler_id is not None:
+                deferred_finish_clients[self.event_queue.id] = self
+            return
         self.finish_current_handler()
 
     def finish_current_handler(self) -> bool:
@@ -282,6 +315,27 @@ class ClientDescriptor:
             return self.archived_channels
         return True
 
+    @property
+    def last_connection_time(self) -> float:
+        return self._last_connection_time
+
+    @last_connection_time.setter
+    def last_connection_time(self, last_connection_time: float) -> None:
+        self._last_connection_time = last_connection_time
+        if self.gc_check_time is not None:
+            # Connecting only ever pushes back when the client is due,
+            # so this is a no-op except when the time is moved earlier.
+            schedule_gc_check(
+                self,
+                last_connection_time + min(self.queue_timeout, EVENT_QUEUE_OFFLINE_TIMEOUT_SECS),
+            )
+
+    def next_gc_check_time(self) -> float:
+        timeout = self.queue_timeout
+        if not self.offline:
+            timeout = min(timeout, EVENT_QUEUE_OFFLINE_TIMEOUT_SECS)
+        return self.last_connection_time + timeout
+
     # TODO: Refactor so we don't need this function
     def accepts_messages(self) -> bool:
         return self.event_types is None or "message" in self.event_types
@@ -354,28 +408,81 @@ def compute_full_event_type(event: Mapping[str, Any]) -> str:
     return event["type"]
 
 
+class QueuedEvent:
+    """A single entry in an EventQueue.
+
+    `payload` is shared between every queue the event was pushed to,
+    and must not be mutated once pushed; data specific to this queue
+    (e.g. the recipient's message flags) lives in `overlay`, which may
+    itself be shared between the queues of a single user.  The actual
+    event dictionary is only built by `materialize`, when the event is
+    returned to the client.
+    """
+
+    __slots__ = ("id", "overlay", "payload")
+
+    def __init__(
+        self, id: int, payload: Mapping[str, Any], overlay: Mapping[str, Any] | None = None
+    ) -> None:
+        self.id = id
+        self.payload = payload
+        self.overlay = overlay
+
+    def materialize(self, include_internal_data: bool = True) -> dict[str, Any]:
+        event = dict(self.payload)
+        if self.overlay is not None:
+            event.update(self.overlay)
+        if not include_internal_data:
+            # The internal_data data structures are not intended to
+            # be exposed to API clients.
+            event.pop("internal_data", None)
+        event["id"] = self.id
+        return event
+
+
 class EventQueue:
     def __init__(self, id: str) -> None:
         # When extending this list of properties, one must be sure to
         # update to_dict and from_dict.
 
-        self.queue: deque[dict[str, Any]] = deque()
+        self._queue: deque[QueuedEvent] = deque()
+        # Events restored from a persistent snapshot by
+        # load_event_queues, which have not been deserialized yet;
+        # these logically precede any events in _queue.
+        self.serialized_queue: bytes | None = None
         self.next_event_id: int = 0
         # will only be None for migration from old versions
         self.newest_pruned_id: int | None = -1
         self.id: str = id
         self.virtual_events: dict[str, dict[str, Any]] = {}
 
-    def to_dict(self) -> dict[str, Any]:
+    @property
+    def queue(self) -> deque[QueuedEvent]:
+        if self.serialized_queue is not None:
+            loaded = deque(
+                QueuedEvent(event["id"], event) for event in orjson.loads(self.serialized_queue)
+            )
+            loaded.extend(self._queue)
+            self._queue = loaded
+            self.serialized_queue = None
+        return self._queue
+
+    @queue.setter
+    def queue(self, queue: deque[QueuedEvent]) -> None:
+        self._queue = queue
+        self.serialized_queue = None
+
+    def to_dict(self, include_events: bool = True) -> dict[str, Any]:
         # If you add a new key to this dict, make sure you add appropriate
         # migration code in from_dict or load_event_queues to account for
         # loading event queues that lack that key.
         d = dict(
             id=self.id,
             next_event_id=self.next_event_id,
-            queue=list(self.queue),
             virtual_events=self.virtual_events,
         )
+        if include_events:
+            d["queue"] = [entry.materialize() for entry in self.queue]
         if self.newest_pruned_id is not None:
             d["newest_pruned_id"] = self.newest_pruned_id
         return d
@@ -385,21 +492,32 @@ class EventQueue:
         ret = cls(d["id"])
         ret.next_event_id = d["next_event_id"]
         ret.newest_pruned_id = d.get("newest_pruned_id")
-        ret.queue = deque(d["queue"])
+        ret.queue = deque(QueuedEvent(event["id"], event) for event in d.get("queue", []))
         ret.virtual_events = d.get("virtual_events", {})
         return ret
 
-    def push(self, orig_event: Mapping[str, Any]) -> None:
-        # By default, we make a shallow copy of the event dictionary
-        # to push into the target event queue; this allows the calling
-        # code to send the same "event" object to multiple queues.
-        # This behavior is important because the event_queue system is
-        # about to mutate the event dictionary, minimally to add the
-        # event_id attribute.
-        event = dict(orig_event)
-        event["id"] = self.next_event_id
+    def serialize_events(self) -> bytes:
+        """The queued events, as a JSON list; the counterpart of
+        setting serialized_queue."""
+        if self.serialized_queue is None:
+            return orjson.dumps([entry.materialize() for entry in self._queue])
+        if len(self._queue) == 0:
+            # Never deserialized, so we can write it back out as-is.
+            return self.serialized_queue
+        # Splice the events pushed since we were loaded (e.g. restart
+        # events) onto the end of the still-serialized list.
+        pending = orjson.dumps([entry.materialize() for entry in self._queue])
+        return self.serialized_queue[:-1] + b"," + pending[1:]
+
+    def push(self, orig_event: Mapping[str, Any], overlay: Mapping[str, Any] | None = None) -> None:
+        # We never copy or mutate the event dictionary we are passed;
+        # the queue just holds a reference to it, alongside the
+        # event_id and any queue-specific overlay.  This allows the
+        # calling code to send the same "event" object to many queues
+        # while only paying for one copy of it.
+        event_id = self.next_event_id
         self.next_event_id += 1
-        full_event_type = compute_full_event_type(event)
+        full_event_type = compute_full_event_type(orig_event)
         if full_event_type.startswith("flags/") and not full_event_type.startswith(
             "flags/remove/read"
         ):
@@ -417,6 +535,7 @@ class EventQueue:
             # presence of mark-as-unread, since it does not respect
             # the ordering of "mark as read" and "mark as unread"
             # updates for a given message.
+            event = QueuedEvent(event_id, orig_event, overlay).materialize()
             if full_event_type not in self.virtual_events:
                 self.virtual_events[full_event_type] = copy.deepcopy(event)
                 return
@@ -429,67 +548,54 @@ class EventQueue:
                 virtual_event["timestamp"] = event["timestamp"]
 
         else:
-            self.queue.append(event)
+            # Appending to _queue directly avoids deserializing any
+            # events restored from a snapshot; see the queue property.
+            self._queue.append(QueuedEvent(event_id, orig_event, overlay))
 
     # Note that pop ignores virtual events.  This is fine in our
     # current usage since virtual events should always be resolved to
     # a real event before being given to users.
-    def pop(self) -> dict[str, Any]:
+    def pop(self) -> QueuedEvent:
         return self.queue.popleft()
 
     def empty(self) -> bool:
-        return len(self.queue) == 0 and len(self.virtual_events) == 0
+        # serialized_queue is only set if it contains events.
+        return (
+            self.serialized_queue is None
+            and len(self._queue) == 0
+            and len(self.virtual_events) == 0
+        )
 
     # See the comment on pop; that applies here as well
     def prune(self, through_id: int) -> None:
-        while len(self.queue) != 0 and self.queue[0]["id"] <= through_id:
-            self.newest_pruned_id = self.queue[0]["id"]
+        while len(self.queue) != 0 and self.queue[0].id <= through_id:
+            self.newest_pruned_id = self.queue[0].id
             self.pop()
 
     def contents(self, include_internal_data: bool = False) -> list[dict[str, Any]]:
-        contents: list[dict[str, Any]] = []
-        virtual_id_map: dict[str, dict[str, Any]] = {}
-        for event_type in self.virtual_events:
-            virtual_id_map[self.virtual_events[event_type]["id"]] = self.virtual_events[event_type]
-        virtual_ids = sorted(virtual_id_map.keys())
-
-        # Merge the virtual events into their final place in the queue
-        index = 0
-        length = len(virtual_ids)
-        for event in self.queue:
-            while index < length and virtual_ids[index] < event["id"]:
-                contents.append(virtual_id_map[virtual_ids[index]])
-                index += 1
-            contents.append(event)
-        while index < length:
-            contents.append(virtual_id_map[virtual_ids[index]])
-            index += 1
-
-        self.virtual_events = {}
-        self.queue = deque(contents)
-
-        if include_internal_data:
-            return contents
-        return prune_internal_data(contents)
-
-
-def prune_internal_data(events: list[dict[str, Any]]) -> list[dict[str, Any]]:
-    """Prunes the internal_data data structures, which are not intended to
-    be exposed to API clients.
-    """
-    # This performs the most shallow copy possible, since events may
-    # have significant data.
-    if not any(event["type"] == "message" for event in events):
-        return events
-    new_events = []
-    for orig_event in events:
-        if orig_event["type"] == "message" and "internal_data" in orig_event:
-            event = dict(orig_event)
-            del event["internal_data"]
-            new_events.append(event)
-        else:
-            new_events.append(orig_event)
-    return new_events
+        if self.virtual_events:
+            # Merge the virtual events into their final place in the queue
+            virtual_entries = sorted(
+                (
+                    QueuedEvent(virtual_event["id"], virtual_event)
+                    for virtual_event in self.virtual_events.values()
+                ),
+                key=lambda entry: entry.id,
+            )
+            merged: deque[QueuedEvent] = deque()
+            index = 0
+            length = len(virtual_entries)
+            for entry in self.queue:
+                while index < length and virtual_entries[index].id < entry.id:
+                    merged.append(virtual_entries[index])
+                    index += 1
+                merged.append(entry)
+            merged.extend(virtual_entries[index:])
+
+            self.virtual_events = {}
+            self.queue = merged
+
+        return [entry.materialize(include_internal_data) for entry in self.queue]
 
 
 # Queue-ids which still need to be sent a web_reload_client event.
@@ -501,8 +607,23 @@ web_reload_clients: dict[str, Literal[True]] = {}
 clients: dict[str, ClientDescriptor] = {}
 # maps user id to list of client descriptors
 user_clients: dict[int, list[ClientDescriptor]] = {}
-# maps realm id to list of client descriptors with all_public_streams=True
-realm_clients_all_streams: dict[int, list[ClientDescriptor]] = {}
+# maps realm id to the message-receiving client descriptors which are
+# sent public channel messages beyond their subscriptions (those with
+# all_public_streams=True or a narrow), indexed by the channel and
+# topic their narrow restricts them to, if any; see
+# get_client_descriptors_for_realm_all_streams.
+NarrowIndexKey = tuple[str | None, str | None]
+realm_clients_all_streams: dict[int, dict[NarrowIndexKey, list[ClientDescriptor]]] = {}
+# A heap of (time, queue id) pairs, for when each client may next
+# expire or need to be marked offline.  Entries are never removed or
+# updated in place; one whose time no longer matches the client's
+# gc_check_time (or whose client is gone) is skipped when popped.
+gc_schedule: list[tuple[float, str]] = []
+
+# While processing a batch of notices, maps queue ids to the clients
+# whose waiting handler should be finished once the batch is done; see
+# finish_handlers_after_batch.
+deferred_finish_clients: dict[str, ClientDescriptor] | None = None
 
 # list of registered gc hooks.
 # each one will be called with a user profile id, queue, and bool
@@ -518,6 +639,7 @@ def clear_client_event_queues_for_testing() -> None:
     web_reload_clients.clear()
     user_clients.clear()
     realm_clients_all_streams.clear()
+    gc_schedule.clear()
     gc_hooks.clear()
 
 
@@ -544,14 +666,65 @@ def get_client_descriptors_for_user(user_profile_id: int) -> list[ClientDescript
     return user_clients.get(user_profile_id, [])
 
 
-def get_client_descriptors_for_realm_all_streams(realm_id: int) -> list[ClientDescriptor]:
-    return realm_clients_all_streams.get(realm_id, [])
+def get_client_descriptors_for_realm_all_streams(
+    realm_id: int, stream_name: str, topic_name: str | None
+) -> list[ClientDescriptor]:
+    """Returns the clients whose narrow might match a message to the
+    given public channel and topic; the caller is still responsible
+    for checking accepts_event.  If topic_name is None, clients for
+    all topics in the channel are returned.
+    """
+    realm_index = realm_clients_all_streams.get(realm_id)
+    if realm_index is None:
+        return []
+
+    stream_key = stream_name.lower()
+    if topic_name is None:
+        return [
+            client
+            for (narrow_stream, narrow_topic), client_list in realm_index.items()
+            if narrow_stream in (None, stream_key)
+            for client in client_list
+        ]
+
+    topic_keys = [topic_name.lower()]
+    if topic_name == "":
+        # Clients without the empty_topic_name capability see, and
+        # narrow on, the fallback name for the empty topic.
+        topic_keys.append(Message.EMPTY_TOPIC_FALLBACK_NAME.lower())
+
+    client_list: list[ClientDescriptor] = []
+    for narrow_stream in [None, stream_key]:
+        for narrow_topic in [None, *topic_keys]:
+            client_list += realm_index.get((narrow_stream, narrow_topic), [])
+    return client_list
+
+
+def narrow_index_key(narrow: Collection[Sequence[str]]) -> NarrowIndexKey:
+    # Matching is case-insensitive; see build_narrow_predicate.
+    stream_key: str | None = None
+    topic_key: str | None = None
+    for operator, operand in narrow:
+        if operator in channel_operators and stream_key is None:
+            stream_key = operand.lower()
+        elif operator == "topic" and topic_key is None:
+            topic_key = operand.lower()
+    return (stream_key, topic_key)
+
+
+def schedule_gc_check(client: ClientDescriptor, check_time: float) -> None:
+    if client.gc_check_time is not None and client.gc_check_time <= check_time:
+        return
+    client.gc_check_time = check_time
+    heapq.heappush(gc_schedule, (check_time, client.event_queue.id))
 
 
 def add_to_client_dicts(client: ClientDescriptor) -> None:
+    schedule_gc_check(client, client.next_gc_check_time())
     user_clients.setdefault(client.user_profile_id, []).append(client)
-    if client.all_public_streams or client.narrow != []:
-        realm_clients_all_streams.setdefault(client.realm_id, []).append(client)
+    if (client.all_public_streams or client.narrow != []) and client.accepts_messages():
+        realm_index = realm_clients_all_streams.setdefault(client.realm_id, {})
+        realm_index.setdefault(narrow_index_key(client.narrow), []).append(client)
 
 
 def allocate_client_descriptor(new_queue_data: MutableMapping[str, Any]) -> ClientDescriptor:
@@ -567,7 +740,7 @@ def do_gc_event_queues(
     to_remove: AbstractSet[str], affected_users: AbstractSet[int], affected_realms: AbstractSet[int]
 ) -> None:
     def filter_client_dict(
-        client_dict: MutableMapping[int, list[ClientDescriptor]], key: int
+        client_dict: MutableMapping[KeyT, list[ClientDescriptor]], key: KeyT
     ) -> None:
         if key not in client_dict:
             return
@@ -582,7 +755,13 @@ def do_gc_event_queues(
         filter_client_dict(user_clients, user_id)
 
     for realm_id in affected_realms:
-        filter_client_dict(realm_clients_all_streams, realm_id)
+        realm_index = realm_clients_all_streams.get(realm_id)
+        if realm_index is None:
+            continue
+        for narrow_key in list(realm_index):
+            filter_client_dict(realm_index, narrow_key)
+        if len(realm_index) == 0:
+            del realm_clients_all_streams[realm_id]
 
     # TODO: If a user has multiple queues and all of them are being
     # removed in the same sweep, `last_client_for_user` will be
@@ -631,23 +810,41 @@ def mark_clients_offline(
         client.offline = True
 
 
-def gc_event_queues(port: int) -> None:
+def gc_event_queues(port: int) -> bool:
+    """Expires, or marks offline, the queues which are due.  Returns
+    True if it stopped early, with due queues remaining, because it
+    ran out of time."""
     # We cannot use perf_counter here, since we store and compare UNIX
     # timestamps to it in the queues.
     start = time.time()
+    deadline = time.perf_counter() + EVENT_QUEUE_GC_BUDGET_SECS
     to_remove: set[str] = set()
     affected_users: set[int] = set()
     affected_realms: set[int] = set()
     to_mark_offline: set[str] = set()
     offline_affected_users: set[int] = set()
-    for id, client in clients.items():
+    to_reschedule: list[ClientDescriptor] = []
+    more_due = False
+    examined = 0
+    while gc_schedule and gc_schedule[0][0] <= start:
+        examined += 1
+        if examined % 100 == 0 and time.perf_counter() > deadline:
+            more_due = True
+            break
+        check_time, id = heapq.heappop(gc_schedule)
+        client = clients.get(id)
+        if client is None or client.gc_check_time != check_time:
+            continue
+        client.gc_check_time = None
         if client.expired(start):
             to_remove.add(id)
             affected_users.add(client.user_profile_id)
             affected_realms.add(client.realm_id)
-        elif client.should_mark_offline(start):
+            continue
+        if client.should_mark_offline(start):
             to_mark_offline.add(id)
             offline_affected_users.add(client.user_profile_id)
+        to_reschedule.append(client)
 
     # We don't need to call e.g. finish_current_handler on the clients
     # being removed because they are guaranteed to be idle (because
@@ -658,6 +855,15 @@ def gc_event_queues(port: int) -> None:
     # removed, so that last_client_for_user is computed correctly.
     mark_clients_offline(to_mark_offline, offline_affected_users)
 
+    for client in to_reschedule:
+        check_time = client.next_gc_check_time()
+        if check_time <= start:
+            # Clients with a connected handler are never due, so we
+            # just check on them again on a later pass.
+            check_time = start + EVENT_QUEUE_GC_FREQ_MSECS / 1000
+        schedule_gc_check(client, check_time)
+    gc_event_queues_seconds.observe(time.time() - start)
+
     if settings.PRODUCTION:
         logging.info(
             "Tornado %d removed %d expired event queues owned by %d users in %.3fs."
@@ -669,10 +875,44 @@ def gc_event_queues(port: int) -> None:
             len(clients),
             handler_stats_string(),
         )
+    return more_due
+
+
+class EventQueueCollector(Collector):
+    """Reports the size of this process's event queues when scraped,
+    rather than maintaining gauges as every event is pushed."""
+
+    @override
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        events = 0
+        serialized_bytes = 0
+        for client in clients.values():
+            event_queue = client.event_queue
+            # Avoid deserializing queues restored from a snapshot
+            # just to count their events.
+            events += len(event_queue._queue) + len(event_queue.virtual_events)
+            if event_queue.serialized_queue is not None:
+                serialized_bytes += len(event_queue.serialized_queue)
+        yield GaugeMetricFamily("tornado_event_queues", "Number of event queues", len(clients))
+        yield GaugeMetricFamily(
+            "tornado_event_queue_events", "Number of events held in event queues", events
+        )
+        yield GaugeMetricFamily(
+            "tornado_event_queue_serialized_bytes",
+            "Size of restored events which have not been deserialized yet",
+            serialized_bytes,
+        )
 
 
-def persistent_queue_filename(port: int, last: bool = False) -> str:
-    if settings.TORNADO_PROCESSES == 1:
+registry.register(EventQueueCollector())
+
+
+def persistent_queue_filename(
+    port: int, last: bool = False, tornado_processes: int | None = None
+) -> str:
+    if tornado_processes is None:
+        tornado_processes = settings.TORNADO_PROCESSES
+    if tornado_processes == 1:
         # Use non-port-aware, legacy version.
         if last:
             return settings.JSON_PERSISTENT_QUEUE_FILENAME_PATTERN % ("",) + ".last"
@@ -682,13 +922,57 @@ def persistent_queue_filename(port: int, last: bool = False) -> str:
     return settings.JSON_PERSISTENT_QUEUE_FILENAME_PATTERN % ("." + str(port),)
 
 
+# Persistent event queue snapshots start with this header, followed by
+# one record per queue: the lengths of the two orjson documents which
+# follow (the client descriptor without its events, and the list of
+# queued events).  Keeping the events separate allows them to be
+# streamed out and back in one queue at a time, and to stay serialized
+# until a queue is next used.  Snapshots without this header are the
+# legacy single-JSON-document format.
+EVENT_QUEUE_SNAPSHOT_HEADER = b"ZULIPEQ1"
+EVENT_QUEUE_SNAPSHOT_RECORD = struct.Struct("!II")
+
+
+def write_event_queue_snapshot(
+    stored_queues: IO[bytes], queues: Mapping[str, ClientDescriptor]
+) -> None:
+    stored_queues.write(EVENT_QUEUE_SNAPSHOT_HEADER)
+    for qid, client in queues.items():
+        descriptor = orjson.dumps([qid, client.to_dict(include_events=False)])
+        events = client.event_queue.serialize_events()
+        stored_queues.write(EVENT_QUEUE_SNAPSHOT_RECORD.pack(len(descriptor), len(events)))
+        stored_queues.write(descriptor)
+        stored_queues.write(events)
+
+
+def read_event_queue_snapshot(stored_queues: IO[bytes]) -> dict[str, ClientDescriptor]:
+    header = stored_queues.read(len(EVENT_QUEUE_SNAPSHOT_HEADER))
+    if header != EVENT_QUEUE_SNAPSHOT_HEADER:
+        # TODO/compatibility: Snapshots written by older Zulip versions
+        # are a single JSON list; remove this when one can no longer
+        # directly upgrade from 11.x to main.
+        data = orjson.loads(header + stored_queues.read())
+        return {qid: ClientDescriptor.from_dict(client) for (qid, client) in data}
+
+    loaded_clients: dict[str, ClientDescriptor] = {}
+    while record := stored_queues.read(EVENT_QUEUE_SNAPSHOT_RECORD.size):
+        descriptor_length, events_length = EVENT_QUEUE_SNAPSHOT_RECORD.unpack(record)
+        qid, client_dict = orjson.loads(stored_queues.read(descriptor_length))
+        events = stored_queues.read(events_length)
+        if len(events) != events_length:
+            raise ValueError("Truncated event queue snapshot")
+        client = ClientDescriptor.from_dict(client_dict)
+        if events != b"[]":
+            client.event_queue.serialized_queue = events
+        loaded_clients[qid] = client
+    return loaded_clients
+
+
 def dump_event_queues(port: int) -> None:
     start = time.perf_counter()
 
     with open(persistent_queue_filename(port), "wb") as stored_queues:
-        stored_queues.write(
-            orjson.dumps([(qid, client.to_dict()) for (qid, client) in clients.items()])
-        )
+        write_event_queue_snapshot(stored_queues, clients)
 
     if len(clients) > 0 or settings.PRODUCTION:
         logging.info(
@@ -700,23 +984,15 @@ def dump_event_queues(port: int) -> None:
 
 
 def load_event_queues(port: int) -> None:
-    global clients
     start = time.perf_counter()
 
     try:
         with open(persistent_queue_filename(port), "rb") as stored_queues:
-            data = orjson.loads(stored_queues.read())
+            clients.update(read_event_queue_snapshot(stored_queues))
     except FileNotFoundError:
         pass
-    except orjson.JSONDecodeError:
+    except Exception:
         logging.exception("Tornado %d could not deserialize event queues", port, stack_info=True)
-    else:
-        try:
-            clients = {qid: ClientDescriptor.from_dict(client) for (qid, client) in data}
-        except Exception:
-            logging.exception(
-                "Tornado %d could not deserialize event queues", port, stack_info=True
-            )
 
     mark_clients_to_reload(clients.keys())
 
@@ -787,9 +1063,15 @@ async def setup_event_queue(
         os.rename(persistent_queue_filename(port), persistent_queue_filename(port, last=True))
 
     # Set up event queue garbage collection
-    pc = tornado.ioloop.PeriodicCallback(lambda: gc_event_queues(port), EVENT_QUEUE_GC_FREQ_MSECS)
+    def gc_tick() -> None:
+        if gc_event_queues(port):
+            tornado.ioloop.IOLoop.current().add_callback(gc_tick)
+
+    pc = tornado.ioloop.PeriodicCallback(gc_tick, EVENT_QUEUE_GC_FREQ_MSECS)
     pc.start()
 
+    start_ioloop_lag_probe()
+
     send_restart_events()
     if send_reloads:
         send_web_reload_client_events(immediate=settings.DEVELOPMENT)
@@ -1076,7 +1358,11 @@ def maybe_enqueue_notifications(
         )
         notice["mentioned_user_group_id"] = mentioned_user_group_id
         if not already_notified.get("email_notified"):
-            queue_json_publish_rollback_unsafe("missedmessage_emails", notice, lambda notice: None)
+            queue_json_publish_rollback_unsafe(
+                sharded_queue_name("missedmessage_emails", user_notifications_data.user_id),
+                notice,
+                lambda notice: None,
+            )
             notified["email_notified"] = True
 
     return notified
@@ -1111,7 +1397,12 @@ def get_client_info_for_message_event(
         realm_id = event_template["realm_id"]
         is_web_public = event_template.get("is_web_public", False)
         realm_guest_user_ids = set(event_template.get("realm_guest_user_ids", []))
-        for client in get_client_descriptors_for_realm_all_streams(realm_id):
+        topic_name: str | None = None
+        if "message_dict" in event_template:
+            topic_name = get_topic_from_message_info(event_template["message_dict"])
+        for client in get_client_descriptors_for_realm_all_streams(
+            realm_id, event_template["stream_name"], topic_name
+        ):
             # Guest users cannot access non-subscribed non web-public
             # channels.
             if not is_web_public and client.user_profile_id in realm_guest_user_ids:
@@ -1248,8 +1539,30 @@ def process_message_event(
             realm_host=realm_host,
         )
 
+    @cache
+    def get_client_event(
+        *,
+        apply_markdown: bool,
+        client_gravatar: bool,
+        allow_empty_topic_name: bool,
+        can_access_sender: bool,
+    ) -> dict[str, Any]:
+        # This is shared between every event queue that receives this
+        # variant of the message; see QueuedEvent.
+        return dict(
+            type="message",
+            message=get_client_payload(
+                apply_markdown=apply_markdown,
+                client_gravatar=client_gravatar,
+                allow_empty_topic_name=allow_empty_topic_name,
+                can_access_sender=can_access_sender,
+            ),
+        )
+
     # Extra user-specific data to include
     extra_user_data: dict[int, Any] = {}
+    # Per-user overlays for the shared events, built lazily below.
+    user_overlays: dict[int, dict[str, Any]] = {}
 
     for user_data in users:
         user_profile_id: int = user_data["id"]
@@ -1310,6 +1623,7 @@ def process_message_event(
             )
         )
 
+    delivered_count = 0
     for client_data in send_to_clients.values():
         client = client_data["client"]
         flags = client_data["flags"]
@@ -1323,7 +1637,7 @@ def process_message_event(
             continue
 
         can_access_sender = client.user_profile_id not in user_ids_without_access_to_sender
-        message_dict = get_client_payload(
+        shared_event = get_client_event(
             apply_markdown=client.apply_markdown,
             client_gravatar=client.client_gravatar,
             allow_empty_topic_name=client.empty_topic_name,
@@ -1332,26 +1646,42 @@ def process_message_event(
 
         # Make sure mirroring bots know whether stream is invite-only
         if "mirror" in client.client_type_name and event_template.get("invite_only"):
-            message_dict = message_dict.copy()
+            message_dict = shared_event["message"].copy()
             message_dict["invite_only_stream"] = True
-
-        user_event: dict[str, Any] = dict(type="message", message=message_dict, flags=flags)
-        if extra_data is not None:
-            user_event.update(extra_data)
+            shared_event = dict(type="message", message=message_dict)
+
+        # The flags and internal_data are the same for all of a
+        # user's clients, so they share a single overlay; only the
+        # sender's own client needs its own copy.
+        overlay: dict[str, Any] | None = user_overlays.get(client.user_profile_id)
+        if overlay is None or overlay["flags"] is not flags:
+            overlay = dict(flags=flags)
+            if extra_data is not None:
+                overlay.update(extra_data)
+            user_overlays[client.user_profile_id] = overlay
 
         if is_sender:
             local_message_id = event_template.get("local_id", None)
             if local_message_id is not None:
-                user_event["local_message_id"] = local_message_id
+                overlay = dict(overlay, local_message_id=local_message_id)
 
-        if not client.accepts_event(user_event):
+        if not client.accepts_event({**shared_event, **overlay}):
             continue
 
         # The below prevents mirroring loops.
         if "mirror" in sending_client and sending_client.lower() == client.client_type_name.lower():
             continue
 
-        client.add_event(user_event)
+        client.add_event(shared_event, overlay)
+        delivered_count += 1
+
+    message_fanout_clients.observe(delivered_count)
+    logging.debug(
+        "Tornado: Message %d evaluated for %d clients, delivered to %d",
+        message_id,
+        len(send_to_clients),
+        delivered_count,
+    )
 
 
 def process_presence_event(event: Mapping[str, Any], users: Iterable[int]) -> None:
@@ -1840,14 +2170,36 @@ def process_notification(notice: Mapping[str, Any]) -> None:
             client.cleanup()
     else:
         process_event(event, cast(list[int], users))
+    duration = time.perf_counter() - start_time
+    notification_processing_seconds.labels(event_type=event["type"]).observe(duration)
     logging.debug(
         "Tornado: Event %s for %s users took %sms",
         event["type"],
         len(users),
-        int(1000 * (time.perf_counter() - start_time)),
+        int(1000 * duration),
     )
 
 
+@contextmanager
+def finish_handlers_after_batch() -> Iterator[None]:
+    """Bursts of notices tend to have many events for the same users;
+    rather than finishing each client's waiting get_events request as
+    soon as its first event arrives, only for it to immediately
+    reconnect for the next one, we finish each such client once, with
+    all of the events for it from the batch.
+    """
+    global deferred_finish_clients
+    assert deferred_finish_clients is None
+    deferred_finish_clients = {}
+    try:
+        yield
+    finally:
+        to_finish = deferred_finish_clients
+        deferred_finish_clients = None
+        for client in to_finish.values():
+            client.finish_current_handler()
+
+
 def get_wrapped_process_notification(queue_name: str) -> Callable[[list[dict[str, Any]]], None]:
     def failure_processor(notice: dict[str, Any]) -> None:
         logging.error(
@@ -1857,10 +2209,11 @@ def get_wrapped_process_notification(queue_name: str) -> Callable[[list[dict[str
         )
 
     def wrapped_process_notification(notices: list[dict[str, Any]]) -> None:
-        for notice in notices:
-            try:
-                process_notification(notice)
-            except Exception:
-                retry_event(queue_name, notice, failure_processor)
+        with finish_handlers_after_batch():
+            for notice in notices:
+                try:
+                    process_notification(notice)
+                except Exception:
+                    retry_event(queue_name, notice, failure_processor)
 
     return wrapped_process_notification
@@ -0,0 +1,56 @@
+import tornado.ioloop
+from prometheus_client import CollectorRegistry, Histogram, generate_latest
+
+# Each Tornado process exports its own metrics from its own port, so
+# we use a dedicated registry rather than the global default one,
+# which would also pick up the process and platform collectors.
+registry = CollectorRegistry(auto_describe=True)
+
+# How often we check how promptly the IOLoop runs a callback; a
+# process stuck in a slow callback delays every connected client.
+IOLOOP_LAG_PROBE_INTERVAL_SECS = 1
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+ioloop_lag_seconds = Histogram(
+    "tornado_ioloop_lag_seconds",
+    "How late the IOLoop ran a callback scheduled for a fixed time",
+    buckets=LATENCY_BUCKETS,
+    registry=registry,
+)
+notification_processing_seconds = Histogram(
+    "tornado_notification_processing_seconds",
+    "Time spent in process_notification, by event type",
+    ["event_type"],
+    buckets=LATENCY_BUCKETS,
+    registry=registry,
+)
+message_fanout_clients = Histogram(
+    "tornado_message_fanout_clients",
+    "Number of event queues each message event was delivered to",
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+    registry=registry,
+)
+gc_event_queues_seconds = Histogram(
+    "tornado_gc_event_queues_seconds",
+    "Time spent garbage-collecting expired event queues",
+    buckets=LATENCY_BUCKETS,
+    registry=registry,
+)
+
+
+def start_ioloop_lag_probe() -> None:
+    loop = tornado.ioloop.IOLoop.current()
+
+    def probe(expected: float) -> None:
+        now = loop.time()
+        ioloop_lag_seconds.observe(max(0, now - expected))
+        next_time = now + IOLOOP_LAG_PROBE_INTERVAL_SECS
+        loop.call_at(next_time, probe, next_time)
+
+    next_time = loop.time() + IOLOOP_LAG_PROBE_INTERVAL_SECS
+    loop.call_at(next_time, probe, next_time)
+
+
+def metrics_text() -> bytes:
+    return generate_latest(registry)
@@ -1,6 +1,9 @@
+import bisect
+import hashlib
 import json
 import os
 import re
+from functools import cache
 from re import Pattern
 
 from django.conf import settings
@@ -34,8 +37,36 @@ def get_realm_tornado_ports(realm: Realm) -> list[int]:
     return [settings.TORNADO_PORTS[0]]
 
 
+# Users are assigned to one of their realm's Tornado ports by
+# consistent hashing: each port owns this many points on a hash ring,
+# and a user belongs to the port owning the first point at or after
+# the user's own hash.  Adding or removing a port thus only moves the
+# users adjacent to its points, about 1/N of them, rather than
+# reshuffling nearly every user between ports.
+TORNADO_SHARD_VIRTUAL_NODES = 128
+
+
+def shard_hash(key: str) -> int:
+    # This must be stable across processes, so we cannot use hash().
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+@cache
+def get_shard_ring(realm_ports: tuple[int, ...]) -> tuple[list[int], list[int]]:
+    points = sorted(
+        (shard_hash(f"tornado:{port}:{vnode}"), port)
+        for port in realm_ports
+        for vnode in range(TORNADO_SHARD_VIRTUAL_NODES)
+    )
+    return [point for point, port in points], [port for point, port in points]
+
+
 def get_user_id_tornado_port(realm_ports: list[int], user_id: int) -> int:
-    return realm_ports[user_id % len(realm_ports)]
+    if len(realm_ports) == 1:
+        return realm_ports[0]
+    ring_points, ring_ports = get_shard_ring(tuple(sorted(realm_ports)))
+    index = bisect.bisect_left(ring_points, shard_hash(f"user:{user_id}"))
+    return ring_ports[index % len(ring_ports)]
 
 
 def get_user_tornado_port(user: UserProfile) -> int:
@@ -6,12 +6,15 @@ from asgiref.sync import async_to_sync
 from django.conf import settings
 from django.http import HttpRequest, HttpResponse
 from django.utils.translation import gettext as _
+from django.views.decorators.http import require_GET
+from prometheus_client import CONTENT_TYPE_LATEST
 from pydantic import BaseModel, Json, PositiveInt, StringConstraints, model_validator
 from typing_extensions import ParamSpec
 
 from zerver.decorator import internal_api_view, process_client
-from zerver.lib.exceptions import JsonableError
+from zerver.lib.exceptions import AccessDeniedError, JsonableError
 from zerver.lib.queue import get_queue_client
+from zerver.lib.rate_limiter import is_local_addr
 from zerver.lib.request import RequestNotes
 from zerver.lib.response import AsynchronousResponse, json_response, json_success
 from zerver.lib.sessions import narrow_request_user
@@ -25,6 +28,7 @@ from zerver.tornado.event_queue import (
     process_notification,
     send_web_reload_client_events,
 )
+from zerver.tornado.metrics import metrics_text
 from zerver.tornado.sharding import get_user_tornado_port, notify_tornado_queue_name
 
 P = ParamSpec("P")
@@ -76,6 +80,15 @@ def web_reload_clients(
     )
 
 
+@require_GET
+def metrics(request: HttpRequest) -> HttpResponse:
+    # Scraped by Prometheus on each Tornado port; Tornado only listens
+    # on localhost, but check anyway, as for other internal endpoints.
+    if not is_local_addr(request.META["REMOTE_ADDR"]):
+        raise AccessDeniedError
+    return HttpResponse(in_tornado_thread(metrics_text)(), content_type=CONTENT_TYPE_LATEST)
+
+
 @typed_endpoint
 def cleanup_event_queue(
     request: HttpRequest, user_profile: UserProfile, *, queue_id: str
@@ -1,4 +1,5 @@
-from typing import Annotated, Literal, TypeAlias
+from collections.abc import Iterator
+from typing import Annotated, Literal, TypeAlias, TypeVar
 
 from annotated_types import Len
 from django.conf import settings
@@ -13,8 +14,9 @@ from zerver.lib.events import DEFAULT_CLIENT_CAPABILITIES, ClientCapabilities, d
 from zerver.lib.exceptions import JsonableError, MissingAuthenticationError
 from zerver.lib.narrow_helpers import narrow_dataclasses_from_tuples
 from zerver.lib.request import RequestNotes
-from zerver.lib.response import json_success
+from zerver.lib.response import json_success, json_success_streaming
 from zerver.lib.typed_endpoint import ApiParamConfig, typed_endpoint
+from zerver.lib.users import STREAMING_USERS_MIN_COUNT
 from zerver.models import Stream, UserProfile
 from zerver.views.streams import parse_include_subscribers
 
@@ -35,6 +37,8 @@ def _default_narrow(user_profile: UserProfile, narrow: list[list[str]]) -> list[
 
 NarrowT: TypeAlias = list[Annotated[list[str], Len(min_length=2, max_length=2)]]
 
+T = TypeVar("T")
+
 
 @typed_endpoint
 def events_register_backend(
@@ -52,6 +56,7 @@ def events_register_backend(
     presence_history_limit_days: Json[int] | None = None,
     idle_queue_timeout: Json[PositiveInt | Literal["mobile"]] | None = None,
     slim_presence: Json[bool] = False,
+    state_versions: Json[dict[str, str]] | None = None,
 ) -> HttpResponse:
     if narrow is None:
         narrow = []
@@ -130,5 +135,25 @@ def events_register_backend(
         fetch_event_types=fetch_event_types,
         spectator_requested_language=spectator_requested_language,
         pronouns_field_type_supported=pronouns_field_type_supported,
+        state_versions=state_versions,
     )
+
+    if (
+        len(ret.get("realm_users", [])) + len(ret.get("realm_non_active_users", []))
+        >= STREAMING_USERS_MIN_COUNT
+    ):
+        streams = {
+            key: _consume(ret.pop(key))
+            for key in ["realm_users", "realm_non_active_users", "realm_user_groups"]
+            if key in ret
+        }
+        return json_success_streaming(request, ret, streams=streams)
     return json_success(request, data=ret)
+
+
+def _consume(items: list[T]) -> Iterator[T]:
+    """Iterates over the list, removing the items from it, so that
+    they can be freed once they have been serialized."""
+    items.reverse()
+    while items:
+        yield items.pop()
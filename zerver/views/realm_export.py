@@ -11,7 +11,7 @@ from zerver.actions.realm_export import do_delete_realm_export, notify_realm_exp
 from zerver.decorator import require_realm_admin
 from zerver.lib.exceptions import JsonableError, OrganizationOwnerRequiredError
 from zerver.lib.export import get_realm_exports_serialized
-from zerver.lib.queue import queue_event_on_commit
+from zerver.lib.queue import queue_event_on_commit, sharded_queue_name
 from zerver.lib.response import json_success
 from zerver.lib.send_email import FromAddress
 from zerver.lib.typed_endpoint import typed_endpoint
@@ -114,7 +114,7 @@ def export_realm(
         "user_profile_id": user.id,
         "realm_export_id": row.id,
     }
-    queue_event_on_commit("deferred_work", event)
+    queue_event_on_commit(sharded_queue_name("deferred_work", user.id), event)
     return json_success(request, data={"id": row.id})
 
 
@@ -57,7 +57,7 @@ from zerver.lib.rate_limiter import (
     rate_limit_spectator_attachment_access_by_file,
     should_rate_limit,
 )
-from zerver.lib.response import json_success
+from zerver.lib.response import json_success, json_success_streaming
 from zerver.lib.send_email import FromAddress, send_email
 from zerver.lib.stream_subscription import get_user_subscribed_streams
 from zerver.lib.streams import (
@@ -78,6 +78,7 @@ from zerver.lib.upload import get_file_info, upload_avatar_image
 from zerver.lib.url_encoding import append_url_query_string
 from zerver.lib.user_groups import UserGroupMembershipDetails
 from zerver.lib.users import (
+    STREAMING_USERS_MIN_COUNT,
     APIUserDict,
     access_bot_by_id,
     access_user_by_email,
@@ -91,6 +92,7 @@ from zerver.lib.users import (
     check_valid_bot_type,
     check_valid_interface_type,
     get_users_for_api,
+    iter_users_for_api,
     max_message_id_for_user,
     validate_short_name_and_construct_bot_email,
     validate_user_custom_profile_data,
@@ -105,6 +107,7 @@ from zerver.models.realms import (
     Realm,
 )
 from zerver.models.users import (
+    active_user_ids,
     get_user_by_delivery_email,
     get_user_by_id_in_realm_including_cross_realm,
     get_user_including_cross_realm,
@@ -879,6 +882,16 @@ def get_members_backend(
 
         user_profile = None
 
+    if user_ids is None and len(active_user_ids(realm.id)) >= STREAMING_USERS_MIN_COUNT:
+        members = iter_users_for_api(
+            realm,
+            user_profile,
+            client_gravatar=client_gravatar,
+            user_avatar_url_field_optional=False,
+            include_custom_profile_fields=include_custom_profile_fields,
+        )
+        return json_success_streaming(request, streams={"members": members})
+
     data = get_user_data(
         user_profile,
         include_custom_profile_fields,
@@ -77,6 +77,19 @@ def register_worker(
         test_queues.add(queue_name)
 
 
+def tuned_value(current: int, target: float, minimum: int, maximum: int, backlogged: bool) -> int:
+    """Moves current towards target, within [minimum, maximum], at most
+    doubling or halving it at once.  It is only raised while there is a
+    backlog to drain, and small adjustments are skipped, so that noise
+    in the consume times doesn't cause constant changes."""
+    value = int(min(max(target, current / 2, minimum), current * 2, maximum))
+    if value > current and not backlogged:
+        return current
+    if abs(value - current) < current / 4 and minimum <= current <= maximum:
+        return current
+    return value
+
+
 def check_and_send_restart_signal() -> None:
     try:
         if not connection.is_usable():
@@ -98,6 +111,17 @@ class QueueProcessingWorker(ABC):
     # startup and steady-state memory.
     PREFETCH = 100
 
+    # In adaptive mode, PREFETCH is only the starting point; the worker
+    # tunes its prefetch while running, within [MIN_PREFETCH,
+    # MAX_PREFETCH], to hold about ADAPTIVE_PREFETCH_SECONDS of work at
+    # the recently observed consume time.  It is raised only while the
+    # worker has a backlog, and the decisions are recorded in the stats
+    # file.
+    ADAPTIVE_BATCHING = False
+    MIN_PREFETCH = 10
+    MAX_PREFETCH = 1000
+    ADAPTIVE_PREFETCH_SECONDS = 10.0
+
     def __init__(
         self,
         threaded: bool = False,
@@ -108,8 +132,13 @@ class QueueProcessingWorker(ABC):
         self.threaded = threaded
         self.disable_timeout = disable_timeout
         self.worker_num = worker_num
+        self.prefetch = self.PREFETCH
         if not hasattr(self, "queue_name"):
             raise WorkerDeclarationError("Queue worker declared without queue_name")
+        if settings.QUEUE_SHARDS.get(self.queue_name, 1) > 1 and worker_num is not None:
+            # Each worker of a sharded queue consumes its own shard,
+            # numbered from 1; see sharded_queue_name.
+            self.queue_name += f"_shard{worker_num}"
 
         self.initialize_statistics()
 
@@ -120,23 +149,30 @@ class QueueProcessingWorker(ABC):
         self.consume_iteration_counter = 0
         self.idle = True
         self.last_statistics_update_time = 0.0
+        self.recent_tuning_decisions: MutableSequence[dict[str, Any]] = deque(maxlen=10)
 
         self.update_statistics()
 
-    @sentry_sdk.trace
-    def update_statistics(self) -> None:
+    def get_recent_average_consume_time(self) -> float | None:
         total_seconds = sum(seconds for _, seconds in self.recent_consume_times)
         total_events = sum(events_number for events_number, _ in self.recent_consume_times)
         if total_events == 0:
-            recent_average_consume_time = None
-        else:
-            recent_average_consume_time = total_seconds / total_events
-        stats_dict = dict(
+            return None
+        return total_seconds / total_events
+
+    @sentry_sdk.trace
+    def update_statistics(self) -> None:
+        stats_dict: dict[str, Any] = dict(
             update_time=time.time(),
-            recent_average_consume_time=recent_average_consume_time,
+            recent_average_consume_time=self.get_recent_average_consume_time(),
             queue_last_emptied_timestamp=self.queue_last_emptied_timestamp,
             consumed_since_last_emptied=self.consumed_since_last_emptied,
         )
+        if self.ADAPTIVE_BATCHING:
+            stats_dict.update(
+                self.get_batching_parameters(),
+                recent_tuning_decisions=list(self.recent_tuning_decisions),
+            )
 
         os.makedirs(settings.QUEUE_STATS_DIR, exist_ok=True)
 
@@ -160,6 +196,44 @@ class QueueProcessingWorker(ABC):
             # and the only reasonable size to return is 0.
             return 0
 
+    def get_batching_parameters(self) -> dict[str, int]:
+        return dict(prefetch=self.prefetch)
+
+    def tune_batching(self, average_consume_time: float, backlogged: bool) -> None:
+        self.prefetch = tuned_value(
+            self.prefetch,
+            self.ADAPTIVE_PREFETCH_SECONDS / average_consume_time,
+            self.MIN_PREFETCH,
+            self.MAX_PREFETCH,
+            backlogged,
+        )
+
+    def autotune_batching(self, remaining_local_queue_size: int) -> bool:
+        """Retunes the batching parameters after a consume, returning
+        whether any of them changed."""
+        average_consume_time = self.get_recent_average_consume_time()
+        if not self.ADAPTIVE_BATCHING or average_consume_time is None:
+            return False
+
+        previous = self.get_batching_parameters()
+        # Guard against a zero average from a coarse clock.
+        self.tune_batching(max(average_consume_time, 1e-6), remaining_local_queue_size > 0)
+        parameters = self.get_batching_parameters()
+        if parameters == previous:
+            return False
+
+        if self.q is not None and parameters["prefetch"] != previous["prefetch"]:
+            self.q.set_prefetch(self.prefetch)
+        self.recent_tuning_decisions.append(
+            dict(
+                time=time.time(),
+                recent_average_consume_time=average_consume_time,
+                local_queue_size=remaining_local_queue_size,
+                **parameters,
+            )
+        )
+        return True
+
     @abstractmethod
     def consume(self, data: dict[str, Any]) -> None:
         pass
@@ -221,6 +295,7 @@ class QueueProcessingWorker(ABC):
                         self.recent_consume_times.append((len(events), consume_time_seconds))
 
                     remaining_local_queue_size = self.get_remaining_local_queue_size()
+                    tuned = self.autotune_batching(remaining_local_queue_size)
                     if remaining_local_queue_size == 0:
                         self.queue_last_emptied_timestamp = time.time()
                         self.consumed_since_last_emptied = 0
@@ -233,7 +308,8 @@ class QueueProcessingWorker(ABC):
                     else:
                         self.consume_iteration_counter += 1
                         if (
-                            self.consume_iteration_counter
+                            tuned
+                            or self.consume_iteration_counter
                             >= self.CONSUME_ITERATIONS_BEFORE_UPDATE_STATS_NUM
                             or time.time() - self.last_statistics_update_time
                             >= self.MAX_SECONDS_BEFORE_UPDATE_STATS
@@ -288,7 +364,7 @@ class QueueProcessingWorker(ABC):
         check_and_send_restart_signal()
 
     def setup(self) -> None:
-        self.q = SimpleQueueClient(prefetch=self.PREFETCH)
+        self.q = SimpleQueueClient(prefetch=self.prefetch)
 
     def start(self) -> None:
         assert self.q is not None
@@ -304,12 +380,20 @@ class QueueProcessingWorker(ABC):
 
 
 class LoopQueueProcessingWorker(QueueProcessingWorker):
-    sleep_delay = 1
+    sleep_delay: float = 1
     batch_size = 100
 
+    # In adaptive mode, batch_size is tuned like the prefetch, to take
+    # about ADAPTIVE_BATCH_SECONDS to consume; larger batches amortize
+    # more per-batch overhead, smaller ones redo less work on failure.
+    MIN_BATCH_SIZE = 10
+    MAX_BATCH_SIZE = 1000
+    ADAPTIVE_BATCH_SECONDS = 1.0
+
     @override
     def setup(self) -> None:
-        self.q = SimpleQueueClient(prefetch=max(self.PREFETCH, self.batch_size))
+        self.prefetch = max(self.PREFETCH, self.batch_size)
+        self.q = SimpleQueueClient(prefetch=self.prefetch)
 
     @override
     def start(self) -> None:  # nocoverage
@@ -318,10 +402,27 @@ class LoopQueueProcessingWorker(QueueProcessingWorker):
         self.q.start_json_consumer(
             self.queue_name,
             lambda events: self.do_consume(self.consume_batch, events),
-            batch_size=self.batch_size,
+            batch_size=(lambda: self.batch_size) if self.ADAPTIVE_BATCHING else self.batch_size,
             timeout=self.sleep_delay,
         )
 
+    @override
+    def get_batching_parameters(self) -> dict[str, int]:
+        return dict(prefetch=self.prefetch, batch_size=self.batch_size)
+
+    @override
+    def tune_batching(self, average_consume_time: float, backlogged: bool) -> None:
+        self.batch_size = tuned_value(
+            self.batch_size,
+            self.ADAPTIVE_BATCH_SECONDS / average_consume_time,
+            self.MIN_BATCH_SIZE,
+            self.MAX_BATCH_SIZE,
+            backlogged,
+        )
+        super().tune_batching(average_consume_time, backlogged)
+        # A full batch must fit in the prefetch.
+        self.prefetch = max(self.prefetch, self.batch_size)
+
     @abstractmethod
     def consume_batch(self, events: list[dict[str, Any]]) -> None:
         pass
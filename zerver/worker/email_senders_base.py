@@ -45,6 +45,10 @@ def retry_send_email_failures(
 
 
 class EmailSendingWorker(LoopQueueProcessingWorker):
+    # Delivery times vary a lot between SMTP servers, so we size
+    # batches and the prefetch from the observed send times.
+    ADAPTIVE_BATCHING = True
+
     def __init__(
         self,
         threaded: bool = False,
@@ -1,10 +1,15 @@
 # Documented in https://zulip.readthedocs.io/en/latest/subsystems/queuing.html
 import logging
 import time
+from collections import Counter, defaultdict, deque
 from collections.abc import Mapping
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
 from types import FrameType
 from typing import Any
+from urllib.parse import urlsplit
 
+import requests
 from django.db import transaction
 from typing_extensions import override
 
@@ -19,21 +24,93 @@ from zerver.worker.base import InterruptConsumeError, QueueProcessingWorker, ass
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class FetchedUrl:
+    url: str
+    data: UrlEmbedData | None
+    cache_timeout: int
+    seconds: float
+
+
+def fetch_url(url: str) -> FetchedUrl:
+    # This runs in the worker's thread pool, so must not access the
+    # database or the cache.
+    start_time = time.time()
+    try:
+        data = url_preview.fetch_link_embed_data(url)
+    except requests.exceptions.RequestException:
+        return FetchedUrl(
+            url, None, url_preview.PREVIEW_FETCH_ERROR_CACHE_TIMEOUT, time.time() - start_time
+        )
+    return FetchedUrl(url, data, url_preview.PREVIEW_CACHE_TIMEOUT, time.time() - start_time)
+
+
 @assign_queue("embed_links")
 class FetchLinksEmbedData(QueueProcessingWorker):
     # This is a slow queue with network requests, so a disk write is negligible.
     # Update stats file after every consume call.
     CONSUME_ITERATIONS_BEFORE_UPDATE_STATS_NUM = 1
 
+    # The URLs in a message are fetched concurrently, but only a
+    # couple at a time from any one host, so that a slow host does not
+    # take up every fetch.
+    MAX_CONCURRENT_FETCHES = 8
+    MAX_CONCURRENT_FETCHES_PER_DOMAIN = 2
+
+    def fetch_urls(self, urls: list[str]) -> dict[str, UrlEmbedData | None]:
+        pending: dict[str, deque[str]] = defaultdict(deque)
+        for url in urls:
+            pending[urlsplit(url).hostname or ""].append(url)
+
+        url_embed_data: dict[str, UrlEmbedData | None] = {}
+        in_flight: dict[Future[FetchedUrl], str] = {}
+        in_flight_per_domain: Counter[str] = Counter()
+        executor = ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT_FETCHES)
+        try:
+            while True:
+                for domain, domain_pending in pending.items():
+                    while (
+                        domain_pending
+                        and len(in_flight) < self.MAX_CONCURRENT_FETCHES
+                        and in_flight_per_domain[domain] < self.MAX_CONCURRENT_FETCHES_PER_DOMAIN
+                    ):
+                        in_flight[executor.submit(fetch_url, domain_pending.popleft())] = domain
+                        in_flight_per_domain[domain] += 1
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight_per_domain[in_flight.pop(future)] -= 1
+                    fetched = future.result()
+                    logging.info(
+                        "Time spent on get_link_embed_data for %s: %s",
+                        fetched.url,
+                        fetched.seconds,
+                    )
+                    url_embed_data[fetched.url] = fetched.data
+                    url_preview.cache_link_embed_data(
+                        {fetched.url: fetched.data}, timeout=fetched.cache_timeout
+                    )
+        finally:
+            # If we time out, leave any fetches still in flight to
+            # finish in the background, rather than waiting for them.
+            executor.shutdown(wait=False, cancel_futures=True)
+        return url_embed_data
+
     @override
     def consume(self, event: Mapping[str, Any]) -> None:
-        url_embed_data: dict[str, UrlEmbedData | None] = {}
-        for url in event["urls"]:
-            start_time = time.time()
-            url_embed_data[url] = url_preview.get_link_embed_data(url)
+        start_time = time.time()
+        url_embed_data = url_preview.get_cached_link_embed_data(event["urls"])
+        for url in url_embed_data:
             logging.info(
                 "Time spent on get_link_embed_data for %s: %s", url, time.time() - start_time
             )
+        url_embed_data.update(
+            self.fetch_urls(
+                [url for url in dict.fromkeys(event["urls"]) if url not in url_embed_data]
+            )
+        )
 
         # Ideally, we should use `durable=True` here. However, in the
         # `test_message_update_race_condition` test, this function is not called
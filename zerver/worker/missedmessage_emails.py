@@ -2,12 +2,13 @@
 import logging
 import threading
 from collections import defaultdict
-from datetime import timedelta
+from datetime import datetime, timedelta
 from typing import Any
 
 import sentry_sdk
 from django.conf import settings
 from django.db import transaction
+from django.db.models import F, Min, QuerySet
 from django.db.utils import IntegrityError
 from django.utils.timezone import now as timezone_now
 from typing_extensions import override
@@ -15,53 +16,81 @@ from typing_extensions import override
 from zerver.lib.db_connections import reset_queries
 from zerver.lib.email_notifications import MissedMessageData, handle_missedmessage_emails
 from zerver.lib.per_request_cache import flush_per_request_caches
-from zerver.models import ScheduledMessageNotificationEmail
-from zerver.models.users import get_user_profile_by_id
-from zerver.worker.base import QueueProcessingWorker, assign_queue
+from zerver.models import ScheduledMessageNotificationEmail, UserProfile
+from zerver.worker.base import LoopQueueProcessingWorker, assign_queue
 
 logger = logging.getLogger(__name__)
 
 
 @assign_queue("missedmessage_emails")
-class MissedMessageWorker(QueueProcessingWorker):
+class MissedMessageWorker(LoopQueueProcessingWorker):
     # Aggregate all messages received over the last several seconds
     # (configurable by each recipient) to let someone finish sending a
     # batch of messages and/or editing them before they are sent out
     # as emails to recipients.
     #
-    # The batch interval is best-effort -- we poll at most every
-    # CHECK_FREQUENCY_SECONDS, to avoid excessive activity.
+    # The batch interval is best-effort -- the worker thread sleeps
+    # until the earliest scheduled email is due, but wakes at most
+    # every CHECK_FREQUENCY_SECONDS, to avoid excessive activity when
+    # many recipients' emails fall due one after another.
     CHECK_FREQUENCY_SECONDS = 5
 
+    # A wildcard mention in a large channel enqueues an event for
+    # every recipient at once; those are inserted in bulk.
+    ADAPTIVE_BATCHING = True
+
     worker_thread: threading.Thread | None = None
 
-    # This condition variable mediates the stopping and has_timeout
+    # This condition variable mediates the stopping and next_due
     # pieces of state, below it.
     cv = threading.Condition()
     stopping = False
-    has_timeout = False
+    # When the earliest email the worker thread is waiting for is due,
+    # or None if it is waiting for the first row to be scheduled.
+    next_due: datetime | None = None
+    last_sent_time: datetime | None = None
 
     # The main thread, which handles the RabbitMQ connection and creates
     # database rows from them.
     @override
     @sentry_sdk.trace
-    def consume(self, event: dict[str, Any]) -> None:
-        logging.debug("Processing missedmessage_emails event: %s", event)
-        # When we consume an event, check if there are existing pending emails
-        # for that user, and if so use the same scheduled timestamp.
-
-        user_profile_id: int = event["user_profile_id"]
-        user_profile = get_user_profile_by_id(user_profile_id)
-        batch_duration_seconds = user_profile.email_notifications_batching_period_seconds
-        batch_duration = timedelta(seconds=batch_duration_seconds)
+    def consume_batch(self, events: list[dict[str, Any]]) -> None:
+        logging.debug("Processing %d missedmessage_emails events", len(events))
+        user_profile_ids = {event["user_profile_id"] for event in events}
+        batching_periods = dict(
+            UserProfile.objects.filter(id__in=user_profile_ids).values_list(
+                "id", "email_notifications_batching_period_seconds"
+            )
+        )
+        # If there are existing pending emails for a user, we use
+        # the same scheduled timestamp for the new ones.
+        scheduled_timestamps = dict(
+            ScheduledMessageNotificationEmail.objects.filter(user_profile_id__in=user_profile_ids)
+            .values("user_profile_id")
+            .annotate(scheduled_timestamp=Min("scheduled_timestamp"))
+            .values_list("user_profile_id", "scheduled_timestamp")
+        )
 
-        try:
-            pending_email = ScheduledMessageNotificationEmail.objects.filter(
-                user_profile_id=user_profile_id
-            )[0]
-            scheduled_timestamp = pending_email.scheduled_timestamp
-        except IndexError:
-            scheduled_timestamp = timezone_now() + batch_duration
+        now = timezone_now()
+        rows: list[dict[str, Any]] = []
+        for event in events:
+            user_profile_id: int = event["user_profile_id"]
+            if user_profile_id not in batching_periods:
+                # The user has since been deleted.
+                continue
+            if user_profile_id not in scheduled_timestamps:
+                scheduled_timestamps[user_profile_id] = now + timedelta(
+                    seconds=batching_periods[user_profile_id]
+                )
+            rows.append(
+                dict(
+                    user_profile_id=user_profile_id,
+                    message_id=event["message_id"],
+                    trigger=event["trigger"],
+                    scheduled_timestamp=scheduled_timestamps[user_profile_id],
+                    mentioned_user_group_id=event.get("mentioned_user_group_id"),
+                )
+            )
 
         with self.cv:
             # We now hold the lock, so there are three places the
@@ -69,44 +98,69 @@ class MissedMessageWorker(QueueProcessingWorker):
             #
             #  1. In maybe_send_batched_emails, and will have to take
             #     the lock (and thus block insertions of new rows
-            #     here) to decide if there are any rows and if it thus
-            #     needs a timeout.
+            #     here) to decide when it next needs to wake up.
             #
-            #  2. In the cv.wait_for with a timeout because there were
-            #     rows already.  There's nothing for us to do, since
-            #     the newly-inserted row will get checked upon that
-            #     timeout.
+            #  2. In the cv.wait_for with a timeout until next_due.
+            #     There's nothing for us to do unless one of our new
+            #     rows is due earlier than that.
             #
             #  3. In the cv.wait_for without a timeout, because there
             #     weren't any rows (which we're about to change).
             #
             # Notifying in (1) is irrelevant, since the thread is not
-            # waiting.  If we over-notify by doing so for both (2) and
-            # (3), the behaviour is correct but slightly inefficient,
-            # as the thread will be needlessly awoken and will just
-            # re-wait.  However, if we fail to awake case (3), the
-            # worker thread will never wake up, and the
-            # ScheduledMessageNotificationEmail internal queue will
-            # back up.
-            #
-            # Use the self.has_timeout property (which is protected by
-            # the lock) to determine which of cases (2) or (3) we are
-            # in, and as such if we need to notify after making the
-            # row.
+            # waiting.  Over-notifying is correct but slightly
+            # inefficient, as the thread will be needlessly awoken
+            # and will just re-wait.  However, if we fail to awake
+            # case (3), or (2) with an earlier row, the worker thread
+            # will not send that row's email in time.
             try:
-                ScheduledMessageNotificationEmail.objects.create(
-                    user_profile_id=user_profile_id,
-                    message_id=event["message_id"],
-                    trigger=event["trigger"],
-                    scheduled_timestamp=scheduled_timestamp,
-                    mentioned_user_group_id=event.get("mentioned_user_group_id"),
-                )
-                if not self.has_timeout:
-                    self.cv.notify()
+                # Foreign keys are only checked when the transaction
+                # commits, so any IntegrityError is raised on exiting
+                # this block.
+                with transaction.atomic(durable=True):
+                    ScheduledMessageNotificationEmail.objects.bulk_create(
+                        [ScheduledMessageNotificationEmail(**row) for row in rows]
+                    )
             except IntegrityError:
-                logging.debug(
-                    "ScheduledMessageNotificationEmail row could not be created. The message may have been deleted. Skipping event."
-                )
+                # Some of the messages may have been deleted; create
+                # the rows one at a time, skipping those.
+                rows = [row for row in rows if self.create_row(row)]
+
+            if rows:
+                earliest = min(row["scheduled_timestamp"] for row in rows)
+                if self.next_due is None or earliest < self.next_due:
+                    self.cv.notify()
+
+    def create_row(self, row: dict[str, Any]) -> bool:
+        try:
+            ScheduledMessageNotificationEmail.objects.create(**row)
+        except IntegrityError:
+            logging.debug(
+                "ScheduledMessageNotificationEmail row could not be created. The message may have been deleted. Skipping event."
+            )
+            return False
+        return True
+
+    def scheduled_emails(self) -> QuerySet[ScheduledMessageNotificationEmail]:
+        scheduled_emails = ScheduledMessageNotificationEmail.objects.all()
+        shards = settings.QUEUE_SHARDS.get("missedmessage_emails", 1)
+        if shards > 1 and self.worker_num is not None:
+            # Each shard only sends the emails for the users whose
+            # events it consumes (see sharded_queue_name), so that
+            # one user's batch is never split between workers.
+            scheduled_emails = scheduled_emails.alias(shard=F("user_profile_id") % shards).filter(
+                shard=self.worker_num - 1
+            )
+        return scheduled_emails
+
+    def get_next_due(self) -> datetime | None:
+        # This uses the index on scheduled_timestamp.
+        return (
+            self.scheduled_emails()
+            .order_by("scheduled_timestamp")
+            .values_list("scheduled_timestamp", flat=True)
+            .first()
+        )
 
     @override
     def start(self) -> None:
@@ -153,14 +207,14 @@ class MissedMessageWorker(QueueProcessingWorker):
                     # crash-looping.  Instead of using time.sleep,
                     # which would block this thread and delay attempts
                     # to exit, we wait on the condition variable.
-                    # With has_timeout set, this will only be notified
-                    # by .stop(), below.
+                    # With next_due set to now, this will only be
+                    # notified by .stop(), below.
                     #
                     # Generally, delays in this background process are
                     # acceptable, so long as they at least
                     # occasionally retry.
                     with self.cv:
-                        self.has_timeout = True
+                        self.next_due = timezone_now()
                         self.cv.wait(timeout=backoff)
                     backoff = min(30, backoff * 2)
 
@@ -173,38 +227,40 @@ class MissedMessageWorker(QueueProcessingWorker):
             #  1. We are being explicitly asked to stop; see the
             #     notify() call in stop()
             #
-            #  2. We have no ScheduledMessageNotificationEmail
-            #     objects currently (has_timeout = False) and the
-            #     first one was just enqueued; see the notify()
-            #     call in consume().  We break out so that we can
-            #     come back around the loop and re-wait with a
-            #     timeout (see next condition).
+            #  2. A ScheduledMessageNotificationEmail was just
+            #     created which is due before next_due (or there
+            #     were none before, and next_due is None); see the
+            #     notify() call in consume_batch().  We break out so
+            #     that we can come back around the loop and re-wait
+            #     with the earlier timeout.
             #
-            #  3. One or more ScheduledMessageNotificationEmail
-            #     exist in the database, so we need to re-check
-            #     them regularly; this happens by hitting the
-            #     timeout and calling maybe_send_batched_emails().
-            #     There is no explicit notify() for this.
-            timeout: int | None = None
-            if ScheduledMessageNotificationEmail.objects.exists():
-                timeout = self.CHECK_FREQUENCY_SECONDS
-            self.has_timeout = timeout is not None
+            #  3. The earliest ScheduledMessageNotificationEmail is
+            #     due; this happens by hitting the timeout and
+            #     calling maybe_send_batched_emails().  There is no
+            #     explicit notify() for this.
+            self.next_due = self.get_next_due()
+            timeout: float | None = None
+            if self.next_due is not None:
+                wake_time = self.next_due
+                if self.last_sent_time is not None:
+                    wake_time = max(
+                        wake_time,
+                        self.last_sent_time + timedelta(seconds=self.CHECK_FREQUENCY_SECONDS),
+                    )
+                timeout = max((wake_time - timezone_now()).total_seconds(), 0)
 
             def wait_condition() -> bool:
                 if self.stopping:
                     # Condition (1)
                     return True
-                if timeout is None:
-                    # Condition (2).  We went to sleep with no
-                    # ScheduledMessageNotificationEmail existing,
-                    # and one has just been made.  We re-check
-                    # that is still true now that we have the
-                    # lock, and if we see it, we stop waiting.
-                    return ScheduledMessageNotificationEmail.objects.exists()
-                # This should only happen at the start or end of
-                # the wait, when we haven't been notified, but are
-                # re-checking the condition.
-                return False
+                # Condition (2).  We re-check that a row due earlier
+                # than we are waiting for exists now that we have the
+                # lock, and if we see it, we stop waiting.  This
+                # should only otherwise happen at the start or end
+                # of the wait, when we haven't been notified, but
+                # are re-checking the condition.
+                next_due = self.get_next_due()
+                return next_due is not None and (self.next_due is None or next_due < self.next_due)
 
             with sentry_sdk.start_span(name="condvar wait") as span:
                 span.set_data("timeout", timeout)
@@ -213,9 +269,8 @@ class MissedMessageWorker(QueueProcessingWorker):
 
         # Being notified means that we are in conditions (1) or
         # (2), above.  In neither case do we need to look at if
-        # there are batches to send -- (2) means that the
-        # ScheduledMessageNotificationEmail was _just_ created, so
-        # there is no need to check it now.
+        # there are batches to send -- in (2), we will go back
+        # around the loop and wait for the new earliest row.
         if not was_notified:
             self.maybe_send_batched_emails()
 
@@ -224,18 +279,21 @@ class MissedMessageWorker(QueueProcessingWorker):
     @sentry_sdk.trace
     def maybe_send_batched_emails(self) -> None:
         current_time = timezone_now()
+        self.last_sent_time = current_time
 
         with transaction.atomic(durable=True):
-            events_to_process = ScheduledMessageNotificationEmail.objects.filter(
-                scheduled_timestamp__lte=current_time
-            ).select_for_update(
-                # We intend to delete these rows later, so we need a
-                # FOR UPDATE lock.
-                no_key=False,
-                # If another worker (or message deletion) has locked
-                # one of the rows, we can look at it later (if it
-                # still exists).  This avoids deadlocks.
-                skip_locked=True,
+            events_to_process = (
+                self.scheduled_emails()
+                .filter(scheduled_timestamp__lte=current_time)
+                .select_for_update(
+                    # We intend to delete these rows later, so we need a
+                    # FOR UPDATE lock.
+                    no_key=False,
+                    # If another worker (or message deletion) has locked
+                    # one of the rows, we can look at it later (if it
+                    # still exists).  This avoids deadlocks.
+                    skip_locked=True,
+                )
             )
 
             # Batch the entries by user
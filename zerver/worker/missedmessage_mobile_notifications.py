@@ -1,10 +1,11 @@
 # Documented in https://zulip.readthedocs.io/en/latest/subsystems/queuing.html
 import logging
+from collections import defaultdict
 from typing import Any
 
-from django.conf import settings
 from typing_extensions import override
 
+from zerver.lib.cache import bulk_cached_fetch, user_profile_by_id_cache_key
 from zerver.lib.push_notifications import (
     handle_push_notification,
     handle_remove_push_notification,
@@ -13,28 +14,22 @@ from zerver.lib.push_notifications import (
 from zerver.lib.push_registration import handle_register_push_device_to_bouncer
 from zerver.lib.queue import retry_event
 from zerver.lib.remote_server import PushNotificationBouncerRetryLaterError
-from zerver.worker.base import QueueProcessingWorker, assign_queue
+from zerver.models.users import base_get_user_queryset
+from zerver.worker.base import LoopQueueProcessingWorker, assign_queue
 
 logger = logging.getLogger(__name__)
 
 
 @assign_queue("missedmessage_mobile_notifications")
-class PushNotificationsWorker(QueueProcessingWorker):
+class PushNotificationsWorker(LoopQueueProcessingWorker):
     # The use of aioapns in the backend means that we cannot use
     # SIGALRM to limit how long a consume takes, as SIGALRM does not
     # play well with asyncio.
     MAX_CONSUME_SECONDS = None
-
-    @override
-    def __init__(
-        self,
-        threaded: bool = False,
-        disable_timeout: bool = False,
-        worker_num: int | None = None,
-    ) -> None:
-        if settings.MOBILE_NOTIFICATIONS_SHARDS > 1 and worker_num is not None:  # nocoverage
-            self.queue_name += f"_shard{worker_num}"
-        super().__init__(threaded, disable_timeout, worker_num)
+    # Notifications are latency-sensitive, so rather than waiting up
+    # to a second for a batch to fill, we process whatever has arrived
+    # every 0.1s.
+    sleep_delay = 0.1
 
     @override
     def start(self) -> None:
@@ -44,29 +39,80 @@ class PushNotificationsWorker(QueueProcessingWorker):
         initialize_push_notifications()
         super().start()
 
-    @override
-    def consume(self, event: dict[str, Any]) -> None:
-        try:
-            event_type = event.get("type")
+    def handle_event(self, event: dict[str, Any]) -> None:
+        event_type = event.get("type")
+        if event_type == "register_push_device_to_bouncer":
+            handle_register_push_device_to_bouncer(event["payload"])
+        elif event_type == "remove":
+            message_ids = event["message_ids"]
+            handle_remove_push_notification(event["user_profile_id"], message_ids)
+        else:
+            handle_push_notification(event["user_profile_id"], event)
+
+    def retry_later(self, event: dict[str, Any]) -> None:
+        event_type = event.get("type")
+
+        def failure_processor(event: dict[str, Any]) -> None:
             if event_type == "register_push_device_to_bouncer":
-                handle_register_push_device_to_bouncer(event["payload"])
-            elif event_type == "remove":
-                message_ids = event["message_ids"]
-                handle_remove_push_notification(event["user_profile_id"], message_ids)
+                logger.warning(
+                    "Maximum retries exceeded for device_id:%s event:register_push_device_to_bouncer",
+                    event["payload"]["device_id"],
+                )
             else:
-                handle_push_notification(event["user_profile_id"], event)
-        except PushNotificationBouncerRetryLaterError:
+                logger.warning(
+                    "Maximum retries exceeded for trigger:%s event:push_notification",
+                    event["user_profile_id"],
+                )
 
-            def failure_processor(event: dict[str, Any]) -> None:
-                if event_type == "register_push_device_to_bouncer":
-                    logger.warning(
-                        "Maximum retries exceeded for device_id:%s event:register_push_device_to_bouncer",
-                        event["payload"]["device_id"],
-                    )
-                else:
-                    logger.warning(
-                        "Maximum retries exceeded for trigger:%s event:push_notification",
-                        event["user_profile_id"],
-                    )
+        retry_event(self.queue_name, event, failure_processor)
+
+    @override
+    def consume_batch(self, events: list[dict[str, Any]]) -> None:
+        # Fetch the users for the whole batch at once; the handlers
+        # then find them in the cache.
+        bulk_cached_fetch(
+            user_profile_by_id_cache_key,
+            lambda user_ids: base_get_user_queryset().filter(id__in=user_ids),
+            list({event["user_profile_id"] for event in events if "user_profile_id" in event}),
+            id_fetcher=lambda user_profile: user_profile.id,
+        )
+
+        # A user's remove events are coalesced into one, so that each
+        # of their devices gets one notification to remove all of the
+        # messages, rather than one for each event.  It is sent in
+        # place of the user's last remove event in the batch: the
+        # messages have been read by then, so any earlier events to
+        # notify the user of them will send nothing.
+        remove_events: dict[int, list[dict[str, Any]]] = defaultdict(list)
+        for event in events:
+            if event.get("type") == "remove":
+                remove_events[event["user_profile_id"]].append(event)
+
+        for event in events:
+            if event.get("type") != "remove":
+                original_events = [event]
+            else:
+                original_events = remove_events[event["user_profile_id"]]
+                if event is not original_events[-1]:
+                    continue
+                if len(original_events) > 1:
+                    event = {
+                        **event,
+                        "message_ids": list(
+                            dict.fromkeys(
+                                message_id
+                                for remove_event in original_events
+                                for message_id in remove_event["message_ids"]
+                            )
+                        ),
+                    }
 
-            retry_event(self.queue_name, event, failure_processor)
+            try:
+                self.handle_event(event)
+            except PushNotificationBouncerRetryLaterError:
+                for original_event in original_events:
+                    self.retry_later(original_event)
+            except Exception as e:
+                # Don't let one bad event drop the notifications of
+                # the other users in the batch.
+                self._handle_consume_exception(original_events, e)
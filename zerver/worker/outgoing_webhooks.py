@@ -1,30 +1,166 @@
 # Documented in https://zulip.readthedocs.io/en/latest/subsystems/queuing.html
 import logging
+import threading
+from collections import Counter, defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from time import perf_counter
 from typing import Any
 
+import requests
 from typing_extensions import override
 
 from zerver.lib.bot_lib import do_flag_message_triggered_bots_messages_as_processed
-from zerver.lib.outgoing_webhook import do_rest_call, get_outgoing_webhook_service_handler
+from zerver.lib.outgoing_webhook import (
+    OutgoingWebhookRequest,
+    OutgoingWebhookServiceInterface,
+    get_outgoing_webhook_service_handler,
+    log_request_time,
+    make_outgoing_webhook_session,
+    process_request_exception,
+    process_response,
+)
+from zerver.models import UserProfile
 from zerver.models.bots import get_bot_services
 from zerver.models.users import get_user_profile_by_id
-from zerver.worker.base import QueueProcessingWorker, assign_queue
+from zerver.worker.base import LoopQueueProcessingWorker, assign_queue
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class Delivery:
+    event: dict[str, Any]
+    base_url: str
+    service_handler: OutgoingWebhookServiceInterface
+    request: OutgoingWebhookRequest
+
+
 @assign_queue("outgoing_webhooks")
-class OutgoingWebhookWorker(QueueProcessingWorker):
+class OutgoingWebhookWorker(LoopQueueProcessingWorker):
+    # The requests for a batch of events are sent concurrently, rather
+    # than one bot server's timeout at a time.  A bot can only have a
+    # few of its requests in flight at once, so that a flood of
+    # messages to one slow bot does not hold up the others.
+    MAX_CONCURRENT_REQUESTS = 16
+    MAX_CONCURRENT_REQUESTS_PER_BOT = 4
+    # Bots' replies are interactive, so rather than waiting up to a
+    # second for a batch to fill, we process whatever has arrived
+    # every 0.1s.
+    sleep_delay = 0.1
+
+    def __init__(
+        self,
+        threaded: bool = False,
+        disable_timeout: bool = False,
+        worker_num: int | None = None,
+    ) -> None:
+        super().__init__(threaded, disable_timeout, worker_num)
+        # The pool and its threads' sessions are reused across
+        # batches, to keep connections to each bot server open.
+        # requests.Session is not thread-safe, so each thread has its
+        # own.
+        self.executor = ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT_REQUESTS)
+        self.thread_local = threading.local()
+
+    def get_session(self, base_url: str) -> requests.Session:
+        """The calling thread's session for requests to base_url."""
+        sessions: dict[str, requests.Session] | None = getattr(self.thread_local, "sessions", None)
+        if sessions is None:
+            sessions = self.thread_local.sessions = {}
+        if base_url not in sessions:
+            sessions[base_url] = make_outgoing_webhook_session()
+        return sessions[base_url]
+
+    def send_delivery(self, delivery: Delivery) -> tuple[requests.Response, float]:
+        # This runs in the worker's thread pool, so must not touch the
+        # database; everything else about the delivery happens in the
+        # main thread.
+        delivery.service_handler.session = self.get_session(delivery.base_url)
+        start_time = perf_counter()
+        response = delivery.service_handler.send_request(delivery.request)
+        return response, perf_counter() - start_time
+
+    def build_deliveries(self, event: dict[str, Any], bot_profile: UserProfile) -> list[Delivery]:
+        deliveries = []
+        for service in get_bot_services(bot_profile.id):
+            # Each service gets its own copy of the event, since
+            # retrying a request modifies it.
+            service_event = {**event, "service_name": str(service.name)}
+            # send_delivery replaces this session with the sending
+            # thread's.
+            service_handler = get_outgoing_webhook_service_handler(
+                service, session=self.get_session(service.base_url)
+            )
+            request = service_handler.build_request(
+                service.base_url, service_event, bot_profile.realm
+            )
+            if request is not None:
+                deliveries.append(
+                    Delivery(service_event, service.base_url, service_handler, request)
+                )
+        return deliveries
+
+    def handle_delivery_result(
+        self, delivery: Delivery, future: Future[tuple[requests.Response, float]]
+    ) -> None:
+        try:
+            response, seconds = future.result()
+        except requests.exceptions.RequestException as e:
+            process_request_exception(delivery.event, e)
+            return
+        log_request_time(delivery.service_handler, seconds)
+        process_response(delivery.event, delivery.service_handler, response)
+
     @override
-    def consume(self, event: dict[str, Any]) -> None:
-        message = event["message"]
-        event["command"] = message["content"]
-        bot_profile = get_user_profile_by_id(event["user_profile_id"])
-
-        services = get_bot_services(event["user_profile_id"])
-        for service in services:
-            event["service_name"] = str(service.name)
-            service_handler = get_outgoing_webhook_service_handler(service)
-            do_rest_call(service.base_url, event, service_handler)
-
-        do_flag_message_triggered_bots_messages_as_processed(bot_profile, [message["id"]])
+    def consume_batch(self, events: list[dict[str, Any]]) -> None:
+        # A failure while handling one event is logged, like
+        # do_consume would for the whole batch, and doesn't stop the
+        # worker from delivering the other events, and flagging their
+        # messages as processed.
+        pending: dict[int, deque[Delivery]] = defaultdict(deque)
+        processed_events: dict[int, list[dict[str, Any]]] = defaultdict(list)
+        bot_profiles: dict[int, UserProfile] = {}
+        for event in events:
+            try:
+                event["command"] = event["message"]["content"]
+                bot_profile = get_user_profile_by_id(event["user_profile_id"])
+                deliveries = self.build_deliveries(event, bot_profile)
+            except Exception as e:
+                self._handle_consume_exception([event], e)
+                continue
+            bot_profiles[bot_profile.id] = bot_profile
+            pending[bot_profile.id].extend(deliveries)
+            processed_events[bot_profile.id].append(event)
+
+        in_flight: dict[Future[tuple[requests.Response, float]], Delivery] = {}
+        in_flight_per_bot: Counter[int] = Counter()
+        while True:
+            for bot_id, bot_pending in pending.items():
+                while (
+                    bot_pending
+                    and len(in_flight) < self.MAX_CONCURRENT_REQUESTS
+                    and in_flight_per_bot[bot_id] < self.MAX_CONCURRENT_REQUESTS_PER_BOT
+                ):
+                    delivery = bot_pending.popleft()
+                    in_flight[self.executor.submit(self.send_delivery, delivery)] = delivery
+                    in_flight_per_bot[bot_id] += 1
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                delivery = in_flight.pop(future)
+                in_flight_per_bot[delivery.service_handler.user_profile.id] -= 1
+                try:
+                    self.handle_delivery_result(delivery, future)
+                except Exception as e:
+                    self._handle_consume_exception([delivery.event], e)
+
+        for bot_id, bot_events in processed_events.items():
+            try:
+                do_flag_message_triggered_bots_messages_as_processed(
+                    bot_profiles[bot_id], [event["message"]["id"] for event in bot_events]
+                )
+            except Exception as e:
+                self._handle_consume_exception(bot_events, e)
@@ -2,7 +2,6 @@
 import logging
 from typing import Any
 
-from django.conf import settings
 from django.db import connection
 from psycopg2.sql import SQL, Literal
 from typing_extensions import override
@@ -30,20 +29,14 @@ class UserActivityWorker(LoopQueueProcessingWorker):
       downtime of the queue processor, many clients will have several
       common events from doing an action multiple times.
 
+    Since larger batches deduplicate more events, the worker tunes its
+    batch size and prefetch to the backlog (see ADAPTIVE_BATCHING).
+
     """
 
-    client_id_map: dict[str, int] = {}
+    ADAPTIVE_BATCHING = True
 
-    @override
-    def __init__(
-        self,
-        threaded: bool = False,
-        disable_timeout: bool = False,
-        worker_num: int | None = None,
-    ) -> None:
-        if settings.USER_ACTIVITY_SHARDS > 1 and worker_num is not None:  # nocoverage
-            self.queue_name += f"_shard{worker_num}"
-        super().__init__(threaded, disable_timeout, worker_num)
+    client_id_map: dict[str, int] = {}
 
     @override
     def start(self) -> None:
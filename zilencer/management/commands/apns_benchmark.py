@@ -0,0 +1,81 @@
+import asyncio
+import time
+from typing import Any
+from unittest import mock
+
+import aioapns
+from aioapns.common import APNS_RESPONSE_CODE, NotificationResult
+from django.core.management.base import CommandParser
+from typing_extensions import override
+
+from zerver.lib.management import ZulipBaseCommand
+from zerver.lib.push_notifications import (
+    APNsContext,
+    UserPushIdentityCompat,
+    send_apple_push_notification,
+)
+from zerver.models import PushDeviceToken
+
+
+class FakeAPNs:
+    """Stands in for aioapns.APNs, answering each notification
+    successfully after a fixed delay."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+
+    async def send_notification(self, request: aioapns.NotificationRequest) -> NotificationResult:
+        await asyncio.sleep(self.latency)
+        return NotificationResult(request.notification_id, APNS_RESPONSE_CODE.SUCCESS)
+
+
+class Command(ZulipBaseCommand):
+    help = """Measures how long sending an APNs notification to a user's
+    devices takes against a fake APNs server, one device at a time as
+    before, and with the notifications sent concurrently.  No
+    notifications are sent, and nothing is written to the database."""
+
+    @override
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--devices", help="Number of devices", default=20, type=int)
+        parser.add_argument(
+            "--latency", help="APNs response time, in seconds", default=0.05, type=float
+        )
+
+    @override
+    def handle(self, *args: Any, **options: Any) -> None:
+        devices = [
+            PushDeviceToken(
+                id=i,
+                kind=PushDeviceToken.APNS,
+                token=f"{i:064x}",
+                ios_app_id="org.zulip.Zulip",
+                user_id=1,
+            )
+            for i in range(1, options["devices"] + 1)
+        ]
+        payload = {"alert": "Benchmark", "custom": {"zulip": {}}}
+        apns_context = APNsContext(
+            apns=FakeAPNs(options["latency"]),  # type: ignore[arg-type] # Stands in for aioapns.APNs
+            loop=asyncio.new_event_loop(),
+        )
+
+        # The former approach: wait for each device's response in turn.
+        start = time.perf_counter()
+        for device in devices:
+            request = aioapns.NotificationRequest(
+                apns_topic=device.ios_app_id, device_token=device.token, message=payload
+            )
+            apns_context.loop.run_until_complete(apns_context.apns.send_notification(request))
+        print(f"one at a time: {1000 * (time.perf_counter() - start):.0f}ms")
+
+        with mock.patch(
+            "zerver.lib.push_notifications.get_apns_context", return_value=apns_context
+        ):
+            start = time.perf_counter()
+            sent = send_apple_push_notification(UserPushIdentityCompat(user_id=1), devices, payload)
+            print(
+                f"concurrently: {1000 * (time.perf_counter() - start):.0f}ms "
+                f"({sent} of {len(devices)} sent)"
+            )
+        apns_context.loop.close()
@@ -0,0 +1,58 @@
+import time
+from typing import Any
+from unittest import mock
+
+from django.core.management.base import CommandError, CommandParser
+from django.db import transaction
+from typing_extensions import override
+
+from zerver.lib.management import ZulipBaseCommand
+from zerver.lib.user_message import UserMessageLite, bulk_insert_ums
+from zerver.models import Message
+
+
+class Command(ZulipBaseCommand):
+    help = """Times inserting UserMessage rows for a single message, with
+    INSERT statements and with COPY, across a range of recipient counts.
+
+    Nothing is committed; the rows reference nonexistent users, which is
+    only possible because the foreign key checks are deferred."""
+
+    @override
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--recipients",
+            nargs="+",
+            type=int,
+            default=[10, 100, 1000, 5000, 10000, 50000],
+            help="Recipient counts to time",
+        )
+        parser.add_argument("--rounds", help="Runs of each", default=3, type=int)
+
+    @override
+    def handle(self, *args: Any, **options: Any) -> None:
+        message = Message.objects.order_by("id").last()
+        if message is None:
+            raise CommandError("Needs at least one message to attach rows to")
+
+        for num_recipients in options["recipients"]:
+            ums = [
+                UserMessageLite(user_profile_id=10**9 + i, message_id=message.id, flags=0)
+                for i in range(num_recipients)
+            ]
+            results = []
+            for name, threshold in [("INSERT", num_recipients + 1), ("COPY", 0)]:
+                best = float("inf")
+                for _ in range(options["rounds"]):
+                    with (
+                        mock.patch(
+                            "zerver.lib.user_message.BULK_INSERT_UMS_COPY_THRESHOLD", threshold
+                        ),
+                        transaction.atomic(),
+                    ):
+                        start = time.perf_counter()
+                        bulk_insert_ums(ums)
+                        best = min(best, time.perf_counter() - start)
+                        transaction.set_rollback(True)
+                results.append(f"{name} {1000 * best:.1f}ms")
+            print(f"{num_recipients} recipients: " + ", ".join(results))
@@ -0,0 +1,85 @@
+from multiprocessing import Barrier, Value
+from multiprocessing.sharedctypes import Synchronized
+from multiprocessing.synchronize import Barrier as BarrierType
+from typing import Any
+
+from django.core.management.base import CommandParser
+from typing_extensions import override
+
+from zerver.lib.cache import cache_delete, cache_with_key, realm_user_dict_fields
+from zerver.lib.management import ZulipBaseCommand
+from zerver.lib.parallel import run_parallel
+from zerver.lib.types import RawUserDict
+from zerver.models import UserProfile
+
+# Shared with the worker processes by stampede_initializer.
+recomputations: "Synchronized[int]"
+barrier: BarrierType
+
+
+def stampede_initializer(counter: "Synchronized[int]", start_barrier: BarrierType) -> None:
+    global recomputations, barrier
+    recomputations = counter
+    barrier = start_barrier
+
+
+def stampede_cache_key(realm_id: int) -> str:
+    return f"cache_stampede_benchmark:{realm_id}"
+
+
+def query_realm_user_dicts(realm_id: int) -> list[RawUserDict]:
+    with recomputations.get_lock():
+        recomputations.value += 1
+    return list(UserProfile.objects.filter(realm_id=realm_id).values(*realm_user_dict_fields))
+
+
+fetch_functions = {
+    "cache_with_key": cache_with_key(stampede_cache_key, timeout=60)(query_realm_user_dicts),
+    "single_flight": cache_with_key(stampede_cache_key, timeout=60, single_flight=True)(
+        query_realm_user_dicts
+    ),
+}
+
+
+def stampede(item: tuple[str, int]) -> None:
+    name, realm_id = item
+    # Start every process's request at the same moment, as when a
+    # hot key is flushed under load.
+    barrier.wait()
+    fetch_functions[name](realm_id)
+
+
+class Command(ZulipBaseCommand):
+    help = """Simulates a cache stampede: many processes missing the same
+    expensive cache key (a realm's user dicts) at once, and measures
+    how many of them recompute it, with plain cache_with_key and with
+    single_flight.  Only a benchmark-specific cache key is written."""
+
+    @override
+    def add_arguments(self, parser: CommandParser) -> None:
+        self.add_realm_args(parser, required=True)
+        parser.add_argument("--processes", help="Number of processes", default=16, type=int)
+        parser.add_argument("--rounds", help="Number of stampedes", default=5, type=int)
+
+    @override
+    def handle(self, *args: Any, **options: Any) -> None:
+        realm = self.get_realm(options)
+        assert realm is not None
+        processes = options["processes"]
+
+        for name in fetch_functions:
+            counter: Synchronized[int] = Value("i", 0)
+            for _ in range(options["rounds"]):
+                cache_delete(stampede_cache_key(realm.id))
+                run_parallel(
+                    stampede,
+                    [(name, realm.id)] * processes,
+                    processes,
+                    initializer=stampede_initializer,
+                    initargs=(counter, Barrier(processes)),
+                )
+            print(
+                f"{name}: {counter.value / options['rounds']:.1f} recomputations per "
+                f"stampede of {processes} processes"
+            )
+        cache_delete(stampede_cache_key(realm.id))
@@ -0,0 +1,78 @@
+import time
+from typing import Any
+
+from django.core.management.base import CommandParser
+from typing_extensions import override
+
+from zerver.lib.management import ZulipBaseCommand
+from zerver.tornado.event_queue import (
+    DEFAULT_EVENT_QUEUE_TIMEOUT_SECS,
+    allocate_client_descriptor,
+    clients,
+    gc_event_queues,
+)
+
+
+class Command(ZulipBaseCommand):
+    help = """Measures how long garbage-collecting Tornado's event queues
+    blocks the IOLoop, compared to scanning every queue on each pass."""
+
+    @override
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--queues", help="Number of event queues", default=100000, type=int)
+        parser.add_argument(
+            "--expired", help="Percentage of queues which are expired", default=5, type=float
+        )
+
+    @override
+    def handle(self, *args: Any, **options: Any) -> None:
+        clients.clear()
+        now = time.time()
+        num_expired = int(options["queues"] * options["expired"] / 100)
+        for i in range(options["queues"]):
+            client = allocate_client_descriptor(
+                dict(
+                    all_public_streams=False,
+                    apply_markdown=True,
+                    client_gravatar=True,
+                    client_type_name="website",
+                    event_types=None,
+                    last_connection_time=now,
+                    queue_timeout=DEFAULT_EVENT_QUEUE_TIMEOUT_SECS,
+                    realm_id=1,
+                    user_profile_id=i,
+                )
+            )
+            if i < num_expired:
+                client.last_connection_time = now - DEFAULT_EVENT_QUEUE_TIMEOUT_SECS
+
+        # The former approach: examine every queue on every pass.
+        start = time.perf_counter()
+        due = [
+            client
+            for client in clients.values()
+            if client.expired(now) or client.should_mark_offline(now)
+        ]
+        print(
+            f"full scan: {1000 * (time.perf_counter() - start):.1f}ms to find "
+            f"{len(due)} due of {len(clients)} queues"
+        )
+
+        pauses: list[float] = []
+        more_due = True
+        while more_due:
+            start = time.perf_counter()
+            more_due = gc_event_queues(port=9800)
+            pauses.append(time.perf_counter() - start)
+        print(
+            f"incremental: removed {options['queues'] - len(clients)} queues in "
+            f"{len(pauses)} passes; longest pause {1000 * max(pauses):.1f}ms, "
+            f"total {1000 * sum(pauses):.1f}ms"
+        )
+
+        start = time.perf_counter()
+        gc_event_queues(port=9800)
+        print(
+            f"incremental, with nothing due: {1000 * (time.perf_counter() - start):.3f}ms "
+            f"for {len(clients)} queues"
+        )
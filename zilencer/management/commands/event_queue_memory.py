@@ -0,0 +1,88 @@
+import tracemalloc
+from collections import deque
+from collections.abc import Callable
+from typing import Any
+
+from django.core.management.base import CommandParser
+from typing_extensions import override
+
+from zerver.lib.management import ZulipBaseCommand
+from zerver.tornado.event_queue import EventQueue
+
+
+def make_message_event(message_id: int) -> dict[str, Any]:
+    return dict(
+        type="message",
+        message=dict(
+            id=message_id,
+            sender_id=10,
+            sender_email="user10@zulip.example.com",
+            recipient_id=20,
+            type="stream",
+            display_recipient="Verona",
+            subject="test",
+            content="<p>hello</p>",
+            content_type="text/html",
+            client="website",
+            timestamp=1700000000,
+        ),
+    )
+
+
+def measure(fill: Callable[[], list[Any]]) -> tuple[int, list[Any]]:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    queues = fill()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, queues
+
+
+class Command(ZulipBaseCommand):
+    help = """Measures the memory used per Tornado event queue to hold
+    message events, compared to storing a dictionary per event per queue."""
+
+    @override
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--queues", help="Number of event queues", default=1000, type=int)
+        parser.add_argument(
+            "--events", help="Number of message events per queue", default=100, type=int
+        )
+
+    @override
+    def handle(self, *args: Any, **options: Any) -> None:
+        num_queues = options["queues"]
+        num_events = options["events"]
+        events = [make_message_event(message_id) for message_id in range(num_events)]
+        flags: list[str] = []
+
+        def fill_legacy() -> list[Any]:
+            # The former representation: a deque of event dictionaries,
+            # each a shallow copy carrying its own id and flags.
+            queues: list[deque[dict[str, Any]]] = []
+            for _ in range(num_queues):
+                queue: deque[dict[str, Any]] = deque()
+                for event_id, event in enumerate(events):
+                    queue_event = dict(event, flags=flags, internal_data={})
+                    queue_event["id"] = event_id
+                    queue.append(queue_event)
+                queues.append(queue)
+            return queues
+
+        def fill_shared() -> list[Any]:
+            queues: list[EventQueue] = []
+            for i in range(num_queues):
+                queue = EventQueue(str(i))
+                overlay = dict(flags=flags, internal_data={})
+                for event in events:
+                    queue.push(event, overlay)
+                queues.append(queue)
+            return queues
+
+        for name, fill in [("dict per event", fill_legacy), ("shared payloads", fill_shared)]:
+            used, queues = measure(fill)
+            print(
+                f"{name}: {used} bytes for {num_queues} queues of {num_events} events; "
+                f"{used // num_queues} bytes/queue"
+            )
+            del queues
@@ -0,0 +1,106 @@
+import os
+import tempfile
+import time
+from typing import Any
+
+import orjson
+from django.core.management.base import CommandParser
+from typing_extensions import override
+
+from zerver.lib.management import ZulipBaseCommand
+from zerver.tornado.event_queue import (
+    ClientDescriptor,
+    EventQueue,
+    clients,
+    read_event_queue_snapshot,
+    write_event_queue_snapshot,
+)
+
+
+def make_client(queue_id: str, num_events: int) -> ClientDescriptor:
+    client = ClientDescriptor(
+        user_profile_id=int(queue_id),
+        realm_id=1,
+        event_queue=EventQueue(queue_id),
+        event_types=None,
+        client_type_name="website",
+        apply_markdown=True,
+        client_gravatar=True,
+        slim_presence=True,
+        all_public_streams=False,
+        idle_queue_timeout=None,
+        narrow=[],
+        bulk_message_deletion=True,
+        stream_typing_notifications=True,
+        pronouns_field_type_supported=True,
+        linkifier_url_template=True,
+        user_list_incomplete=True,
+        include_deactivated_groups=True,
+        archived_channels=True,
+        empty_topic_name=True,
+        simplified_presence_events=True,
+        individual_emoji_changes=True,
+    )
+    for message_id in range(num_events):
+        client.event_queue.push(
+            dict(
+                type="message",
+                message=dict(id=message_id, content="<p>hello</p>", sender_id=10),
+                flags=[],
+            )
+        )
+    return client
+
+
+class Command(ZulipBaseCommand):
+    help = """Times dumping and loading Tornado's event queues across a restart,
+    in both the legacy single-JSON-document format and the per-queue snapshot format."""
+
+    @override
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--queues", help="Number of event queues", default=10000, type=int)
+        parser.add_argument("--events", help="Number of events in each queue", default=20, type=int)
+
+    @override
+    def handle(self, *args: Any, **options: Any) -> None:
+        clients.clear()
+        for i in range(options["queues"]):
+            clients[str(i)] = make_client(str(i), options["events"])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            legacy_path = os.path.join(tmp_dir, "legacy.json")
+            start = time.perf_counter()
+            with open(legacy_path, "wb") as f:
+                f.write(orjson.dumps([(qid, client.to_dict()) for qid, client in clients.items()]))
+            dump_time = time.perf_counter() - start
+            start = time.perf_counter()
+            with open(legacy_path, "rb") as f:
+                data = orjson.loads(f.read())
+                {qid: ClientDescriptor.from_dict(client) for (qid, client) in data}
+            load_time = time.perf_counter() - start
+            print(
+                f"legacy: dump {dump_time:.3f}s, load {load_time:.3f}s, "
+                f"{os.path.getsize(legacy_path)} bytes"
+            )
+
+            snapshot_path = os.path.join(tmp_dir, "snapshot")
+            start = time.perf_counter()
+            with open(snapshot_path, "wb") as f:
+                write_event_queue_snapshot(f, clients)
+            dump_time = time.perf_counter() - start
+            start = time.perf_counter()
+            with open(snapshot_path, "rb") as f:
+                loaded_clients = read_event_queue_snapshot(f)
+            load_time = time.perf_counter() - start
+            print(
+                f"snapshot: dump {dump_time:.3f}s, load {load_time:.3f}s, "
+                f"{os.path.getsize(snapshot_path)} bytes"
+            )
+
+            # Loaded queues are deserialized on first use; that cost
+            # is spread across clients reconnecting, rather than
+            # blocking the restart.
+            start = time.perf_counter()
+            for client in loaded_clients.values():
+                client.event_queue.contents()
+            print(f"snapshot: hydrating all queues {time.perf_counter() - start:.3f}s")
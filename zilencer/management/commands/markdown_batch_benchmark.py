@@ -0,0 +1,71 @@
+import time
+from typing import Any
+
+from django.core.management.base import CommandError, CommandParser
+from typing_extensions import override
+
+from zerver.lib.management import ZulipBaseCommand
+from zerver.lib.markdown import render_message_markdown, render_message_markdown_batch
+from zerver.lib.parallel import run_parallel
+from zerver.models import Message
+from zerver.models.realms import get_realm_by_id
+
+
+def render_batch(batch: tuple[int, list[int]]) -> None:
+    realm_id, message_ids = batch
+    messages = list(Message.objects.filter(id__in=message_ids).select_related("sender"))
+    render_message_markdown_batch(messages, get_realm_by_id(realm_id))
+
+
+class Command(ZulipBaseCommand):
+    help = """Measures Markdown rendering throughput, in messages per second,
+    rendering a realm's latest messages one at a time, in batches, and
+    in batches across several processes.  Nothing is saved."""
+
+    @override
+    def add_arguments(self, parser: CommandParser) -> None:
+        self.add_realm_args(parser, required=True)
+        parser.add_argument("--messages", help="Number of messages", default=5000, type=int)
+        parser.add_argument("--batch-size", help="Messages per batch", default=1000, type=int)
+        parser.add_argument("--processes", help="Number of processes", default=4, type=int)
+
+    @override
+    def handle(self, *args: Any, **options: Any) -> None:
+        realm = self.get_realm(options)
+        assert realm is not None
+        messages = list(
+            Message.objects.filter(realm_id=realm.id)
+            .select_related("sender")
+            .order_by("-id")[: options["messages"]]
+        )
+        if not messages:
+            raise CommandError("The realm has no messages")
+        batch_size = options["batch_size"]
+
+        def report(name: str, start: float) -> None:
+            elapsed = time.perf_counter() - start
+            print(f"{name}: {len(messages) / elapsed:.0f} messages/second")
+
+        start = time.perf_counter()
+        for message in messages:
+            render_message_markdown(message, message.content, realm=realm)
+        report("one at a time", start)
+
+        start = time.perf_counter()
+        for i in range(0, len(messages), batch_size):
+            render_message_markdown_batch(messages[i : i + batch_size], realm)
+        report(f"batches of {batch_size}", start)
+
+        # This includes fetching each batch's messages again, as
+        # rerender_messages does.
+        message_ids = [message.id for message in messages]
+        start = time.perf_counter()
+        run_parallel(
+            render_batch,
+            [
+                (realm.id, message_ids[i : i + batch_size])
+                for i in range(0, len(message_ids), batch_size)
+            ],
+            options["processes"],
+        )
+        report(f"batches of {batch_size} in {options['processes']} processes", start)
@@ -0,0 +1,66 @@
+import time
+from typing import Any
+
+from django.core.management.base import CommandError, CommandParser
+from django.db.models import Max
+from typing_extensions import override
+
+from zerver.lib.management import ZulipBaseCommand
+from zerver.models import Message, ScheduledMessageNotificationEmail, UserProfile
+from zerver.models.scheduled_jobs import NotificationTriggers
+from zerver.worker.missedmessage_emails import MissedMessageWorker
+
+
+class BenchmarkMissedMessageWorker(MissedMessageWorker):
+    @override
+    def update_statistics(self) -> None:
+        # Don't overwrite the stats file of the real worker.
+        pass
+
+
+class Command(ZulipBaseCommand):
+    help = """Measures how quickly the missedmessage_emails worker schedules
+    the emails for a wildcard mention with many recipients, consuming
+    the events one at a time and in batches.  The recipients cycle
+    through the realm's active users.  No emails are sent, and the
+    scheduled rows are deleted afterwards."""
+
+    @override
+    def add_arguments(self, parser: CommandParser) -> None:
+        self.add_realm_args(parser, required=True)
+        parser.add_argument("--recipients", help="Number of recipients", default=10000, type=int)
+        parser.add_argument("--batch-size", help="Events per batch", default=500, type=int)
+
+    @override
+    def handle(self, *args: Any, **options: Any) -> None:
+        realm = self.get_realm(options)
+        assert realm is not None
+        user_ids = list(
+            UserProfile.objects.filter(realm=realm, is_active=True, is_bot=False).values_list(
+                "id", flat=True
+            )
+        )
+        message = Message.objects.filter(realm=realm).order_by("-id").first()
+        if not user_ids or message is None:
+            raise CommandError("The realm needs active users and at least one message.")
+
+        events = [
+            dict(
+                user_profile_id=user_ids[i % len(user_ids)],
+                message_id=message.id,
+                trigger=NotificationTriggers.STREAM_WILDCARD_MENTION,
+            )
+            for i in range(options["recipients"])
+        ]
+        worker = BenchmarkMissedMessageWorker()
+        for batch_size in [1, options["batch_size"]]:
+            max_id = ScheduledMessageNotificationEmail.objects.aggregate(Max("id"))["id__max"] or 0
+            start = time.perf_counter()
+            for i in range(0, len(events), batch_size):
+                worker.consume_batch(events[i : i + batch_size])
+            elapsed = time.perf_counter() - start
+            ScheduledMessageNotificationEmail.objects.filter(id__gt=max_id).delete()
+            print(
+                f"Batches of {batch_size}: {elapsed:.2f}s for {len(events)} events, "
+                f"{len(events) / elapsed:.0f} events/s"
+            )
@@ -0,0 +1,137 @@
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from unittest import mock
+
+from django.core.management.base import CommandError, CommandParser
+from django.db import transaction
+from typing_extensions import override
+
+from zerver.actions.create_user import do_create_user
+from zerver.lib.management import ZulipBaseCommand
+from zerver.lib.message_cache import MessageDict
+from zerver.lib.outgoing_webhook import do_rest_call, get_outgoing_webhook_service_handler
+from zerver.lib.users import add_service
+from zerver.models import Message, Service, UserProfile
+from zerver.models.bots import get_bot_services
+from zerver.worker.outgoing_webhooks import OutgoingWebhookWorker
+
+
+def make_stub_handler(latency: float, slow_latency: float, slow_fraction: float) -> type:
+    class StubBotServerHandler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:
+            self.rfile.read(int(self.headers["Content-Length"]))
+            time.sleep(slow_latency if random.random() < slow_fraction else latency)
+            body = b'{"response_not_required": true}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        @override
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    return StubBotServerHandler
+
+
+class Command(ZulipBaseCommand):
+    help = """Measures outgoing webhook delivery throughput, in requests per
+    second, against a local stub bot server, delivering one request at a
+    time as the worker used to, and with the worker's concurrent delivery.
+
+    The bots are created in a transaction which is rolled back, and
+    messages are not marked as processed."""
+
+    @override
+    def add_arguments(self, parser: CommandParser) -> None:
+        self.add_realm_args(parser, required=True)
+        parser.add_argument("--events", help="Number of events", default=200, type=int)
+        parser.add_argument("--bots", help="Number of bots", default=4, type=int)
+        parser.add_argument(
+            "--latency", help="Usual response time, in seconds", default=0.02, type=float
+        )
+        parser.add_argument(
+            "--slow-latency", help="Slow response time, in seconds", default=0.5, type=float
+        )
+        parser.add_argument(
+            "--slow-percent", help="Percentage of slow responses", default=5, type=float
+        )
+
+    @override
+    def handle(self, *args: Any, **options: Any) -> None:
+        realm = self.get_realm(options)
+        assert realm is not None
+        owner = UserProfile.objects.filter(realm=realm, is_bot=False, is_active=True).first()
+        message = Message.objects.filter(realm_id=realm.id).order_by("id").last()
+        if owner is None or message is None:
+            raise CommandError("The realm needs a user and a message")
+
+        server = ThreadingHTTPServer(
+            ("127.0.0.1", 0),
+            make_stub_handler(
+                options["latency"], options["slow_latency"], options["slow_percent"] / 100
+            ),
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}/"
+
+        with (
+            transaction.atomic(),
+            mock.patch(
+                "zerver.worker.outgoing_webhooks.do_flag_message_triggered_bots_messages_as_processed"
+            ),
+        ):
+            message_dict = MessageDict.wide_dict(message, realm.id)
+            events = []
+            for i in range(options["bots"]):
+                bot = do_create_user(
+                    f"benchmark-bot-{i}@{realm.host}",
+                    None,
+                    realm,
+                    f"Benchmark bot {i}",
+                    bot_type=UserProfile.OUTGOING_WEBHOOK_BOT,
+                    bot_owner=owner,
+                    acting_user=None,
+                )
+                add_service(
+                    "benchmark",
+                    user_profile=bot,
+                    base_url=base_url,
+                    interface=Service.GENERIC,
+                    token="token",
+                )
+                events.extend(
+                    {"message": message_dict, "trigger": "mention", "user_profile_id": bot.id}
+                    for _ in range(options["events"] // options["bots"])
+                )
+
+            def report(name: str, start: float) -> None:
+                elapsed = time.perf_counter() - start
+                print(f"{name}: {len(events) / elapsed:.1f} requests/second")
+
+            # The worker's former behavior: one request at a time,
+            # each with a new session.
+            start = time.perf_counter()
+            for event in events:
+                serial_event = {**event, "command": message_dict["content"]}
+                for service in get_bot_services(event["user_profile_id"]):
+                    serial_event["service_name"] = str(service.name)
+                    do_rest_call(
+                        service.base_url,
+                        serial_event,
+                        get_outgoing_webhook_service_handler(service),
+                    )
+            report("one at a time", start)
+
+            worker = OutgoingWebhookWorker()
+            start = time.perf_counter()
+            for i in range(0, len(events), worker.batch_size):
+                worker.consume_batch([dict(event) for event in events[i : i + worker.batch_size]])
+            report(f"concurrently, in batches of {worker.batch_size}", start)
+
+            transaction.set_rollback(True)
+        server.shutdown()
@@ -0,0 +1,90 @@
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any
+from unittest import mock
+
+import redis.client
+from django.core.management.base import CommandParser
+from django.test import override_settings
+from typing_extensions import override
+
+from zerver.lib.management import ZulipBaseCommand
+from zerver.lib.rate_limiter import (
+    LocalBudgetRateLimiterBackend,
+    RateLimitedObject,
+    RateLimiterBackend,
+    RedisRateLimiterBackend,
+)
+
+
+class RateLimitedBenchmarkObject(RateLimitedObject):
+    def __init__(self, i: int, backend: type[RateLimiterBackend]) -> None:
+        self.i = i
+        super().__init__(backend)
+
+    @override
+    def key(self) -> str:
+        return f"{type(self).__name__}:{self.i}"
+
+    @override
+    def rules(self) -> list[tuple[int, int]]:
+        # Generous enough that the benchmark is never rate-limited.
+        return [(60, 1000000)]
+
+
+@contextmanager
+def redis_latency(seconds: float) -> Iterator[None]:
+    def delayed(func: Callable[..., Any]) -> Callable[..., Any]:
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            time.sleep(seconds)
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    with (
+        mock.patch.object(
+            redis.client.Redis, "execute_command", delayed(redis.client.Redis.execute_command)
+        ),
+        mock.patch.object(redis.client.Pipeline, "execute", delayed(redis.client.Pipeline.execute)),
+    ):
+        yield
+
+
+class Command(ZulipBaseCommand):
+    help = """Measures the per-request overhead of rate limiting, checking
+    every request with Redis, and with a local budget of requests, with
+    and without extra latency added to each Redis round trip."""
+
+    @override
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--requests", help="Number of requests", default=5000, type=int)
+        parser.add_argument("--entities", help="Number of users", default=50, type=int)
+        parser.add_argument("--budget", help="Local budget", default=20, type=int)
+        parser.add_argument(
+            "--latency", help="Added Redis latency, in milliseconds", default=1.0, type=float
+        )
+
+    @override
+    def handle(self, *args: Any, **options: Any) -> None:
+        for latency in [0.0, options["latency"] / 1000]:
+            for backend in [RedisRateLimiterBackend, LocalBudgetRateLimiterBackend]:
+                objects = [
+                    RateLimitedBenchmarkObject(i, backend) for i in range(options["entities"])
+                ]
+                for obj in objects:
+                    obj.clear_history()
+                with (
+                    override_settings(RATE_LIMITING_LOCAL_BUDGET=options["budget"]),
+                    redis_latency(latency),
+                ):
+                    start = time.perf_counter()
+                    for i in range(options["requests"]):
+                        objects[i % len(objects)].rate_limit()
+                    elapsed = time.perf_counter() - start
+                print(
+                    f"{backend.__name__}, {1000 * latency:.1f}ms added latency: "
+                    f"{1_000_000 * elapsed / options['requests']:.0f}us/request"
+                )
+                for obj in objects:
+                    obj.clear_history()
@@ -0,0 +1,65 @@
+import time
+from typing import Any
+
+from django.core.management.base import CommandError, CommandParser
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from typing_extensions import override
+
+from zerver.lib.cache import flush_realm_state_snapshots
+from zerver.lib.events import fetch_initial_state_data
+from zerver.lib.management import ZulipBaseCommand
+from zerver.models import UserProfile
+
+
+class Command(ZulipBaseCommand):
+    help = """Measures the time and database queries needed to compute
+    the /register initial state for a sample of a realm's active users,
+    with and without REALM_STATE_SNAPSHOTS.  To measure the effect at
+    scale, run it against a realm populated with many users, e.g. 10000
+    of them."""
+
+    @override
+    def add_arguments(self, parser: CommandParser) -> None:
+        self.add_realm_args(parser, required=True)
+        parser.add_argument("--users", help="Number of users to register as", default=20, type=int)
+
+    @override
+    def handle(self, *args: Any, **options: Any) -> None:
+        realm = self.get_realm(options)
+        assert realm is not None
+        user_profiles = list(
+            UserProfile.objects.filter(realm=realm, is_active=True, is_bot=False).order_by("id")[
+                : options["users"]
+            ]
+        )
+        if not user_profiles:
+            raise CommandError("The realm needs active users.")
+        realm_users = UserProfile.objects.filter(realm=realm).count()
+        print(f"Registering as {len(user_profiles)} users of a realm with {realm_users} users.")
+
+        for snapshots in [False, True]:
+            with override_settings(REALM_STATE_SNAPSHOTS=snapshots):
+                # Start from an empty snapshot, so that the first
+                # user pays for computing it.
+                flush_realm_state_snapshots(realm.id)
+                times = []
+                queries = []
+                for user_profile in user_profiles:
+                    with CaptureQueriesContext(connection) as context:
+                        start = time.perf_counter()
+                        fetch_initial_state_data(
+                            user_profile,
+                            realm=realm,
+                            client_gravatar=True,
+                            user_avatar_url_field_optional=True,
+                        )
+                        times.append(time.perf_counter() - start)
+                    queries.append(len(context.captured_queries))
+            label = "With snapshots" if snapshots else "Without snapshots"
+            print(
+                f"{label}: first {1000 * times[0]:.1f}ms/{queries[0]} queries, "
+                f"mean {1000 * sum(times) / len(times):.1f}ms/"
+                f"{sum(queries) / len(queries):.1f} queries"
+            )
@@ -0,0 +1,109 @@
+import time
+import tracemalloc
+from collections.abc import Callable
+from typing import Any
+
+from django.core.management.base import CommandError, CommandParser
+from django.http import HttpRequest, HttpResponse
+from typing_extensions import override
+
+from zerver.lib.events import fetch_initial_state_data
+from zerver.lib.management import ZulipBaseCommand
+from zerver.lib.response import json_success, json_success_streaming
+from zerver.lib.users import get_users_for_api, iter_users_for_api
+from zerver.models import UserProfile
+
+
+class Command(ZulipBaseCommand):
+    help = """Measures the peak memory allocated, and the time taken, to
+    generate and send the GET /users and POST /register responses for
+    a realm, with and without streaming them.  Memory is measured with
+    tracemalloc, which counts Python allocations (including the
+    serialized response), not the process's RSS; tracemalloc also slows
+    everything down, so the times are only useful for comparison.
+
+    To measure the effect at scale, run it against a realm populated
+    with many users, e.g. 100000 of them."""
+
+    @override
+    def add_arguments(self, parser: CommandParser) -> None:
+        self.add_realm_args(parser, required=True)
+        parser.add_argument("--skip-register", action="store_true", help="Only measure GET /users")
+
+    @override
+    def handle(self, *args: Any, **options: Any) -> None:
+        realm = self.get_realm(options)
+        assert realm is not None
+        user_profile = (
+            UserProfile.objects.filter(realm=realm, is_active=True, is_bot=False)
+            .order_by("id")
+            .first()
+        )
+        if user_profile is None:
+            raise CommandError("The realm needs an active user.")
+        realm_users = UserProfile.objects.filter(realm=realm).count()
+        print(f"Generating responses for {user_profile.delivery_email}, of {realm_users} users.")
+        request = HttpRequest()
+
+        def users_response() -> HttpResponse:
+            members = get_users_for_api(
+                realm,
+                user_profile,
+                client_gravatar=True,
+                user_avatar_url_field_optional=False,
+                include_custom_profile_fields=True,
+            )
+            return json_success(request, {"members": list(members.values())})
+
+        def streamed_users_response() -> HttpResponse:
+            members = iter_users_for_api(
+                realm,
+                user_profile,
+                client_gravatar=True,
+                user_avatar_url_field_optional=False,
+                include_custom_profile_fields=True,
+            )
+            return json_success_streaming(request, streams={"members": members})
+
+        measure("GET /users", users_response)
+        measure("GET /users, streamed", streamed_users_response)
+        if options["skip_register"]:
+            return
+
+        def fetch_state() -> dict[str, Any]:
+            return fetch_initial_state_data(
+                user_profile,
+                realm=realm,
+                client_gravatar=True,
+                user_avatar_url_field_optional=True,
+            )
+
+        def register_response() -> HttpResponse:
+            return json_success(request, fetch_state())
+
+        def streamed_register_response() -> HttpResponse:
+            state = fetch_state()
+            streams = {
+                key: state.pop(key)
+                for key in ["realm_users", "realm_non_active_users", "realm_user_groups"]
+                if key in state
+            }
+            return json_success_streaming(request, state, streams=streams)
+
+        measure("POST /register", register_response)
+        measure("POST /register, streamed", streamed_register_response)
+
+
+def measure(label: str, get_response: Callable[[], HttpResponse]) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    response = get_response()
+    # Consume the response the way the WSGI server does.
+    size = sum(len(chunk) for chunk in response)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{label}: {size / 2**20:.1f}MiB response, peak {peak / 2**20:.1f}MiB allocated, "
+        f"{1000 * elapsed:.0f}ms"
+    )
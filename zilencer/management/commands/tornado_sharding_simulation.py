@@ -0,0 +1,50 @@
+from collections import Counter
+from collections.abc import Callable
+from typing import Any
+
+from django.core.management.base import CommandParser
+from typing_extensions import override
+
+from zerver.lib.management import ZulipBaseCommand
+from zerver.tornado.sharding import get_user_id_tornado_port
+
+
+def modulo_port(realm_ports: list[int], user_id: int) -> int:
+    # The previous sharding scheme, for comparison.
+    return realm_ports[user_id % len(realm_ports)]
+
+
+class Command(ZulipBaseCommand):
+    help = """Simulates how many users change Tornado port as Tornado processes
+    are added to a realm's shard, and how evenly users are spread across ports."""
+
+    @override
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--users", help="Number of users", default=100000, type=int)
+        parser.add_argument(
+            "--max-ports", help="Largest number of Tornado ports", default=8, type=int
+        )
+
+    @override
+    def handle(self, *args: Any, **options: Any) -> None:
+        user_ids = range(1, options["users"] + 1)
+        schemes: list[tuple[str, Callable[[list[int], int], int]]] = [
+            ("modulo", modulo_port),
+            ("consistent hashing", get_user_id_tornado_port),
+        ]
+        for name, get_port in schemes:
+            print(f"{name}:")
+            previous: dict[int, int] | None = None
+            for num_ports in range(1, options["max_ports"] + 1):
+                ports = list(range(9800, 9800 + num_ports))
+                assignments = {user_id: get_port(ports, user_id) for user_id in user_ids}
+                counts = Counter(assignments.values())
+                spread = max(counts.values()) / (len(user_ids) / num_ports)
+                moved = ""
+                if previous is not None:
+                    num_moved = sum(
+                        1 for user_id in user_ids if assignments[user_id] != previous[user_id]
+                    )
+                    moved = f", {num_moved} users ({100 * num_moved / len(user_ids):.1f}%) moved"
+                print(f"  {num_ports} ports: busiest port has {spread:.2f}x average load{moved}")
+                previous = assignments
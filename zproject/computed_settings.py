@@ -7,7 +7,7 @@ from copy import deepcopy
 from typing import Any, Final, Literal
 from urllib.parse import urljoin
 
-from scripts.lib.zulip_tools import get_tornado_ports
+from scripts.lib.zulip_tools import get_queue_shards, get_tornado_ports
 from zerver.lib.db import TimeTrackingConnection, TimeTrackingCursor
 from zerver.lib.types import AnalyticsDataUploadLevel
 
@@ -1278,10 +1278,9 @@ CROSS_REALM_BOT_EMAILS = {
     "emailgateway@zulip.com",
 }
 
-MOBILE_NOTIFICATIONS_SHARDS = int(
-    get_config("application_server", "mobile_notification_shards", "1")
-)
-USER_ACTIVITY_SHARDS = int(get_config("application_server", "user_activity_shards", "1"))
+# How many sub-queues, each with its own consumer, each shardable
+# queue is partitioned into; see SHARDABLE_QUEUES.
+QUEUE_SHARDS = get_queue_shards(config_file)
 
 # Process soft reactivations in their own queue and worker process instead of
 # sharing deferred_work. This lives here, not in default_settings, because it
@@ -281,6 +281,12 @@ SUBMIT_USAGE_STATISTICS = True
 PROMOTE_SPONSORING_ZULIP = True
 RATE_LIMITING = True
 RATE_LIMITING_AUTHENTICATE = True
+# If nonzero, each server process may allow up to this many requests
+# by an entity, in the domains listed below, without checking with
+# Redis -- which saves a Redis round trip on most requests, at the
+# cost of letting each process exceed the limit by that many.
+RATE_LIMITING_LOCAL_BUDGET = 0
+RATE_LIMITING_LOCAL_BUDGET_DOMAINS = ["api_by_user", "api_by_ip"]
 RATE_LIMIT_TOR_TOGETHER = False
 SEND_LOGIN_EMAILS = True
 EMBEDDED_BOTS_ENABLED = False
@@ -513,6 +519,30 @@ DEBUG_ERROR_REPORTING = False
 # this is disabled in production, but we need it in development.
 POST_MIGRATION_CACHE_FLUSHING = False
 
+# If nonzero, each server process also keeps up to this many of the
+# most frequently read remote cache entries (user profiles, system
+# groups) in memory, for up to LOCAL_CACHE_TIMEOUT seconds.  Entries
+# flushed by one process are dropped by the others within a fraction
+# of a second, via Redis.
+LOCAL_CACHE_SIZE = 0
+LOCAL_CACHE_TIMEOUT = 60
+
+# Opt-in profiling of the database queries and cache keys used by a
+# sample of requests, for `manage.py request_profiles` to summarize.
+# It is enabled by setting either list: it covers requests whose path
+# starts with one of REQUEST_PROFILING_PATHS (or any path, if it is
+# empty), made by one of REQUEST_PROFILING_USER_IDS (or anyone).
+REQUEST_PROFILING_PATHS: list[str] = []
+REQUEST_PROFILING_USER_IDS: list[int] = []
+REQUEST_PROFILING_SAMPLE_RATE = 1.0
+REQUEST_PROFILING_BUFFER_SIZE = 1000
+
+# If enabled, the parts of the /register initial state shared by many
+# users of a realm (users, user groups, custom profile fields, etc.)
+# are cached as per-realm snapshots, which are discarded whenever an
+# event changing them is sent.
+REALM_STATE_SNAPSHOTS = False
+
 # Settings for APNS.  Only needed on push.zulipchat.com or if
 # rebuilding the mobile app with a different push notifications
 # server.
@@ -6,11 +6,12 @@ from zerver.tornado.views import (
     cleanup_event_queue,
     get_events,
     get_events_internal,
+    metrics,
     notify,
     web_reload_clients,
 )
 
-# Minimal URL configuration for Tornado.  Tornado only serves 5
+# Minimal URL configuration for Tornado.  Tornado only serves 6
 # endpoints, but without a dedicated urlconf it resolves every request
 # against the full Django URL configuration (~800 patterns), wasting
 # significant CPU on regex matching.
@@ -33,5 +34,6 @@ urlpatterns = [
     path("json/", include(api_and_json_patterns)),
     path("api/internal/notify_tornado", notify),
     path("api/internal/web_reload_clients", web_reload_clients),
+    path("api/internal/tornado_metrics", metrics),
     path("api/v1/events/internal", get_events_internal),
 ]